@@ -0,0 +1,147 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+"""
+
+Build time and memory of keywords hierarchy of LRKeywordsModel, on keywords of a catalog or on synthetic keywords :
+    - random tree : each keyword under a random keyword created before it, so the tree gets wide and a few tens deep
+    - chain : each keyword under the previous one
+
+Build time is measured without tracemalloc, memory (retained after build, and peak) with tracemalloc.
+
+With --reference, the same is measured for a previous version of lrtools/lrkeyword.py, for example the version before
+compact arrays :
+    git show 2012281~1:lrtools/lrkeyword.py > /tmp/lrkeyword_dict.py
+    python bench/keywords_model.py --reference /tmp/lrkeyword_dict.py
+
+"""
+
+import os
+import sys
+import gc
+import time
+import random
+import sqlite3
+import argparse
+import tracemalloc
+import importlib.util
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from lrtools.lrkeyword import LRKeywordsModel
+
+
+def synthetic_keywords(count, chain=False, seed=1):
+    """
+    Return connection to a memory database with table AgLibraryKeyword of count keywords
+    """
+    rnd = random.Random(seed)
+    conn = sqlite3.connect(":memory:")
+    conn.execute(
+        "CREATE TABLE AgLibraryKeyword (id_local INTEGER PRIMARY KEY, name, lc_name, parent INTEGER)"
+    )
+    rows = [(1, None, None, None)]
+    for idkey in range(2, count + 1):
+        if chain:
+            parent = idkey - 1
+        elif idkey > 200:
+            parent = rnd.randint(max(1, idkey // 8 - 50), idkey - 1)
+        else:
+            parent = 1
+        name = f"kw{idkey % 5000} word{idkey % 37}"
+        rows.append((idkey, name, name.lower(), parent))
+    conn.executemany("INSERT INTO AgLibraryKeyword VALUES (?, ?, ?, ?)", rows)
+    return conn
+
+
+def build(model_class, cursor):
+    """
+    Return keywords model of class model_class, with hierarchy loaded
+    """
+    model = model_class()
+    if hasattr(model, "load_hierarchy"):
+        model.load_hierarchy(cursor)
+    else:
+        # model with dictionaries, before compact arrays
+        model.load_hierarchical_keywords(cursor)
+        model.load_children(cursor)
+    return model
+
+
+def measure(label, model_class, conn, names=True):
+    """
+    Print build time and memory of keywords model
+    - names : print also time to build hierarchical names of 1000 keywords
+    """
+    gc.collect()
+    start = time.perf_counter()
+    try:
+        build(model_class, conn.cursor())
+    except RecursionError:
+        print(f"  {label}: RecursionError")
+        return
+    duration = time.perf_counter() - start
+    gc.collect()
+    tracemalloc.start()
+    model = build(model_class, conn.cursor())
+    gc.collect()
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"  {label}: build {duration * 1e3:.0f} ms, retained {size / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB"
+    )
+    if names and hasattr(model, "hierarchical_name"):
+        ids = model.ids[1 :: max(1, len(model.ids) // 1000)]
+        start = time.perf_counter()
+        for idkey in ids:
+            model.hierarchical_name(idkey)
+        print(
+            f"  {label}: hierarchical name (cold) {(time.perf_counter() - start) / max(1, len(ids)) * 1e6:.1f} us by keyword"
+        )
+
+
+def main():
+    """Main entry from command line"""
+    parser = argparse.ArgumentParser(
+        description="Measure build time and memory of keywords hierarchy, on catalog or synthetic keywords"
+    )
+    parser.add_argument("lrcat", nargs="?", help="Lightroom catalog file. Default is synthetic keywords")
+    parser.add_argument(
+        "-n",
+        "--keywords",
+        type=int,
+        default=100000,
+        help="number of synthetic keywords (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--reference",
+        help="file of a previous version of lrkeyword.py, measured too",
+    )
+    args = parser.parse_args()
+
+    models = [("current", LRKeywordsModel)]
+    if args.reference:
+        spec = importlib.util.spec_from_file_location("lrkeyword_reference", args.reference)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        models.insert(0, ("reference", module.LRKeywordsModel))
+
+    if args.lrcat:
+        datasets = [(args.lrcat, sqlite3.connect(f"file:{args.lrcat}?mode=ro", uri=True), True)]
+    else:
+        # hierarchical names of a chain are as long as the chain : not measured
+        datasets = [
+            (f"random tree, {args.keywords} keywords", synthetic_keywords(args.keywords), True),
+            (f"chain, {args.keywords} keywords", synthetic_keywords(args.keywords, chain=True), False),
+        ]
+    for label, conn, names in datasets:
+        print(label)
+        for name, model_class in models:
+            measure(name, model_class, conn, names)
+        conn.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
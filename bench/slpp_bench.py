@@ -0,0 +1,100 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+"""
+
+Throughput in MB/s of SLPP decoder (lrtools/slpp.py), against original decoder (slpp_original.py)
+
+Texts decoded are develop settings of photos of a catalog, and a large develop settings text built from the first
+one, with 160 retouch spots (about 40 KB).
+
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from lrtools.slpp import SLPP
+from slpp_original import SLPP as OriginalSLPP
+
+SPOT = """\t\t{
+\t\t\tenabled = true,
+\t\t\tmode = "heal",
+\t\t\topacity = 1,
+\t\t\tsourceX = 0.412345,
+\t\t\tsourceY = 0.623456,
+\t\t\tspotX = 0.387654,
+\t\t\tspotY = 0.598765,
+\t\t\tfeather = 0.5,
+\t\t\tradius = 0.012345,
+\t\t},
+"""
+
+
+def throughput(decoder, texts, rounds):
+    """
+    Return MB/s of decoding texts rounds times
+    """
+    size = sum(len(text) for text in texts) * rounds
+    start = time.perf_counter()
+    for _ in range(rounds):
+        for text in texts:
+            decoder().decode(text)
+    return size / (time.perf_counter() - start) / 1e6
+
+
+def main():
+    """Main entry from command line"""
+    parser = argparse.ArgumentParser(
+        description="Measure MB/s of SLPP decoder and original decoder on develop settings of a catalog"
+    )
+    parser.add_argument("lrcat", help="Lightroom catalog file")
+    parser.add_argument(
+        "--limit",
+        type=int,
+        default=5000,
+        help="max number of develop settings texts (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--rounds",
+        type=int,
+        default=100,
+        help="number of decodings of large text (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(f"file:{args.lrcat}?mode=ro", uri=True)
+    texts = [
+        text[text.find("{") :]
+        for text, in conn.execute(
+            "SELECT text FROM Adobe_imageDevelopSettings WHERE text IS NOT NULL LIMIT ?",
+            (args.limit,),
+        )
+        if "{" in text
+    ]
+    conn.close()
+    if not texts:
+        print("no develop settings in catalog")
+        return 1
+    if "RetouchInfo = {\n\t}" in texts[0]:
+        large = texts[0].replace("RetouchInfo = {\n\t}", "RetouchInfo = {\n" + SPOT * 160 + "\t}")
+    else:
+        large = texts[0].rstrip()[:-1] + "\tRetouchInfo = {\n" + SPOT * 160 + "\t},\n}"
+
+    for label, bench_texts, rounds in (
+        (f"develop settings ({len(texts)} texts, {sum(map(len, texts)) // len(texts)} bytes average)", texts, 1),
+        (f"large develop settings ({len(large) // 1000} KB, {args.rounds} times)", [large], args.rounds),
+    ):
+        original = throughput(OriginalSLPP, bench_texts, rounds)
+        new = throughput(SLPP, bench_texts, rounds)
+        print(f"{label}: original {original:.2f} MB/s, SLPP {new:.2f} MB/s, x{new / original:.1f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+"""
+
+Check that SLPP decoder (lrtools/slpp.py) returns the same structures as the original decoder (slpp_original.py)
+
+Texts compared are :
+    - definitions of smart collections of a catalog (AgLibraryCollectionContent)
+    - develop settings of photos of a catalog (Adobe_imageDevelopSettings)
+    - Lua tables generated at random, with irregular spaces, newlines, separators and values
+
+Decimal numbers are the only intended difference : the original decoder repeated their first decimal digit
+("1.5" decoded as 1.55). Texts differing only by them are counted apart, other differences are errors.
+
+"""
+
+import os
+import sys
+import random
+import logging
+import sqlite3
+import argparse
+from decimal import Decimal
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from lrtools.slpp import SLPP
+from slpp_original import SLPP as OriginalSLPP
+
+
+def catalog_texts(lrcat, limit):
+    """
+    Return list of Lua texts of catalog : smart collections definitions and develop settings
+    """
+    conn = sqlite3.connect(f"file:{lrcat}?mode=ro", uri=True)
+    texts = [
+        content[content.find("{") :]
+        for content, in conn.execute(
+            "SELECT content FROM AgLibraryCollectionContent WHERE owningModule='ag.library.smart_collection'"
+        )
+        if content and "{" in content
+    ]
+    texts += [
+        text[text.find("{") :]
+        for text, in conn.execute(
+            "SELECT text FROM Adobe_imageDevelopSettings WHERE text IS NOT NULL LIMIT ?",
+            (limit,),
+        )
+        if "{" in text
+    ]
+    conn.close()
+    return texts
+
+
+def random_texts(count, seed):
+    """
+    Return list of count Lua tables generated at random
+    """
+    rnd = random.Random(seed)
+    keys = ["a", "Key", "true", "FALSE", "x2", "k_u", "é", "_u", "2k", "value2"]
+    values = [
+        "1",
+        "-2",
+        "3.25",
+        "4.",
+        "-0.5",
+        "00.010",
+        '"s"',
+        '""',
+        '"a b"',
+        "true",
+        "False",
+        "word",
+        "w2",
+        "1e-05",
+        "{}",
+        "-",
+        "0",
+    ]
+    spaces = ["", " ", "\t", "  ", "\t\t"]
+    newlines = ["\n", "", "\n\t", "\n\t\t", "\r\n", " "]
+
+    def table(depth):
+        out = ["{"]
+        for _ in range(rnd.randint(0, 6)):
+            out.append(rnd.choice(newlines) + rnd.choice(spaces))
+            if rnd.random() < 0.5:
+                out.append(rnd.choice(keys) + rnd.choice(spaces) + "=" + rnd.choice(spaces))
+            value = table(depth + 1) if depth < 3 and rnd.random() < 0.2 else rnd.choice(values)
+            out.append(value + rnd.choice(spaces) + rnd.choice([",", ",", ",", "", ";"]) + rnd.choice(spaces))
+        out.append(rnd.choice(newlines) + rnd.choice(spaces) + "}")
+        return "".join(out)
+
+    return [table(0) for _ in range(count)]
+
+
+def decode(decoder, text):
+    """
+    Return decoded text, or exception name
+    """
+    try:
+        return "ok", decoder().decode(text)
+    except Exception as _e:  # pylint: disable=broad-except
+        return "exception", type(_e).__name__
+
+
+def original_decimals(obj):
+    """
+    Return obj with decimal numbers as decoded by original decoder : first decimal digit repeated
+    """
+    if isinstance(obj, float):
+        text = format(Decimal(repr(obj)), "f")
+        point = text.find(".")
+        if point < 0 or point + 1 == len(text):
+            return obj
+        return float(text[: point + 1] + text[point + 1] + text[point + 1 :])
+    if isinstance(obj, dict):
+        return {key: original_decimals(value) for key, value in obj.items()}
+    if isinstance(obj, list):
+        return [original_decimals(value) for value in obj]
+    return obj
+
+
+def main():
+    """Main entry from command line"""
+    parser = argparse.ArgumentParser(
+        description="Compare SLPP decoder with original decoder on Lua texts of a catalog, and on random Lua tables"
+    )
+    parser.add_argument("lrcat", nargs="?", help="Lightroom catalog file")
+    parser.add_argument(
+        "--develop-limit",
+        type=int,
+        default=10000,
+        help="max number of develop settings texts (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--random",
+        type=int,
+        default=100000,
+        help="number of random Lua tables (default: %(default)s)",
+    )
+    parser.add_argument("--seed", type=int, default=7, help="seed of random tables")
+    args = parser.parse_args()
+
+    # errors of malformed texts are logged by both decoders
+    logging.disable(logging.CRITICAL)
+
+    corpus = []
+    if args.lrcat:
+        corpus.append(("catalog", catalog_texts(args.lrcat, args.develop_limit)))
+    corpus.append(("random", random_texts(args.random, args.seed)))
+
+    errors = 0
+    for name, texts in corpus:
+        identical = decimals = differences = 0
+        for text in texts:
+            original = decode(OriginalSLPP, text)
+            new = decode(SLPP, text)
+            if repr(original) == repr(new):
+                identical += 1
+            elif repr(original) == repr((new[0], original_decimals(new[1]))):
+                decimals += 1
+            else:
+                differences += 1
+                if differences <= 5:
+                    print(f"DIFFERENCE on {text!r:.200}\n  original: {original!r:.200}\n  new     : {new!r:.200}")
+        print(
+            f"{name:8s}: {len(texts)} texts, {identical} identical, {decimals} differing by decimal numbers only, {differences} differences"
+        )
+        errors += differences
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+"""
+
+Open and requests durations of a catalog opened directly, and by snapshot in memory or in a temporary file
+(LRCatDB parameter snapshot)
+
+Requests are executed twice after open : first on a cold copy, then on pages already read.
+Drop the system file cache before running to measure a cold catalog (Linux : "sync; echo 3 > /proc/sys/vm/drop_caches").
+
+"""
+
+import os
+import sys
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+
+# pylint: disable=wrong-import-position
+from lrtools.lrcat import LRCatDB, SNAPSHOT_TEMPFILE
+from lrtools.lrtoolconfig import LRToolConfig
+
+# requests as (columns, criteria) of LRSelectPhoto.select_generic
+REQUESTS = [
+    ("name=full,datecapt,camera,lens", "rating=>=3"),
+    ("name", "keyword=%dog%"),
+    ("name,uuid", "datecapt=>=2015, hasgps=1"),
+    ("name=full,xmp", ""),
+]
+
+
+def run_requests(lrdb):
+    """
+    Execute requests, and return tuple (number of rows, duration)
+    """
+    start = time.perf_counter()
+    rows = sum(
+        len(lrdb.lrphoto.select_generic(columns, criteria).fetchall())
+        for columns, criteria in REQUESTS
+    )
+    return rows, time.perf_counter() - start
+
+
+def main():
+    """Main entry from command line"""
+    parser = argparse.ArgumentParser(
+        description="Measure open and requests durations of catalog, opened directly and by snapshot"
+    )
+    parser.add_argument("lrcat", help="Lightroom catalog file")
+    parser.add_argument(
+        "--threads",
+        type=int,
+        default=4,
+        help="number of threads for requests on pooled snapshot in memory (default: %(default)s)",
+    )
+    args = parser.parse_args()
+
+    config = LRToolConfig()
+    print(f"catalog {args.lrcat}: {os.path.getsize(args.lrcat) / 1e6:.0f} MB, {len(REQUESTS)} requests")
+    for snapshot in (None, ":memory:", SNAPSHOT_TEMPFILE):
+        start = time.perf_counter()
+        lrdb = LRCatDB(config, args.lrcat, snapshot=snapshot)
+        duration = time.perf_counter() - start
+        rows, first = run_requests(lrdb)
+        _, second = run_requests(lrdb)
+        lrdb.close()
+        print(
+            f"{str(snapshot or 'direct'):10s}: open {duration:.3f} s, requests {first:.3f} s then {second:.3f} s ({rows} rows)"
+        )
+
+    start = time.perf_counter()
+    lrdb = LRCatDB(config, args.lrcat, snapshot=":memory:", pooled=True)
+    duration = time.perf_counter() - start
+    start = time.perf_counter()
+    with ThreadPoolExecutor(args.threads) as executor:
+        rows = sum(
+            executor.map(
+                lambda request: len(lrdb.lrphoto.select_generic(*request).fetchall()),
+                REQUESTS,
+            )
+        )
+    print(
+        f"pooled :memory: ({args.threads} threads): open {duration:.3f} s, requests {time.perf_counter() - start:.3f} s ({rows} rows)"
+    )
+    lrdb.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+"""
+
+Report keywords of a Lightroom catalog
+
+"""
+
+import sys
+import logging
+import argparse
+from sqlite3 import OperationalError
+
+from lrtools import __version__ as LR_VERSION
+
+from lrtools.lrtoolconfig import LRToolConfig, LRConfigException
+
+from lrtools.lrcat import LRCatDB, LRCatException
+from lrtools.lrkeyword import LRKeywords
+from lrtools.lrcooccurrence import LRCooccurrence
+from lrtools.display import display_results, display_progress
+
+
+def main():
+    """Main entry from command line"""
+
+    config = LRToolConfig()
+
+    #
+    # commands parser
+    #
+    parser = argparse.ArgumentParser(
+        description="Report keywords of Lightroom catalog"
+    )
+    parser.add_argument(
+        "keyword",
+        help='hierarchical keyword name (ex: "Places|France"). Only this keyword and keywords under it are reported,'
+        " or keyword for --related",
+        nargs="?",
+        default="",
+    )
+    parser.add_argument(
+        "-b",
+        "--lrcat",
+        default=config.default_lrcat,
+        help='Lightroom catalog file for database request (default:"%(default)s")',
+    )
+    parser.add_argument(
+        "-t",
+        "--tree",
+        action="store_true",
+        help="display keywords in hierarchical indented format",
+    )
+    parser.add_argument(
+        "-u",
+        "--usage",
+        action="store_true",
+        help="display count of photos by keyword : photos with keyword, and photos with keyword or a keyword under it",
+    )
+    parser.add_argument(
+        "-R",
+        "--related",
+        action="store_true",
+        help='display keywords the most often on the same photos as keyword "keyword" (10 by default, see --max-lines)',
+    )
+    parser.add_argument(
+        "--export-cooccurrence",
+        metavar="CSV_FILE",
+        help="export count of photos by pair of keywords in CSV file",
+    )
+    parser.add_argument(
+        "--no-persons",
+        action="store_true",
+        help="ignore persons keywords for --related and --export-cooccurrence",
+    )
+    parser.add_argument(
+        "-o",
+        "--sort",
+        choices=["name", "photos", "total"],
+        default="name",
+        help='sort usage by keyword name, or by count in descending order (default:"%(default)s")',
+    )
+    parser.add_argument(
+        "-m",
+        "--min-count",
+        type=int,
+        default=0,
+        help="display only keywords with at least MIN_COUNT photos, including keywords under them",
+    )
+    parser.add_argument(
+        "-n",
+        "--max-lines",
+        type=int,
+        default=-1,
+        help="max number of results to display",
+    )
+    parser.add_argument(
+        "-N",
+        "--no-header",
+        action="store_true",
+        help="don't print header (columns names)",
+    )
+    parser.add_argument(
+        "-w",
+        "--widths",
+        default="-50,8,8",
+        help='widths of columns to display (default:"%(default)s")',
+    )
+    parser.add_argument(
+        "-S",
+        "--separator",
+        default=" | ",
+        help='separator string between columns (default:"%(default)s")',
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="copy catalog in memory before requests. Useful for a catalog on a network drive,"
+        " or for a consistent view of a catalog in use",
+    )
+    parser.add_argument(
+        "--snapshot-file",
+        help='as --snapshot, but copy catalog in file SNAPSHOT_FILE ("tempfile" for a temporary file)',
+    )
+    parser.add_argument("--log", help="log to file")
+
+    args = parser.parse_args()
+
+    # logging
+    if args.log:
+        log = logging.getLogger()
+        log.setLevel(logging.INFO)
+        handler = logging.FileHandler(args.log, "a", "utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+        log.addHandler(handler)
+    log = logging.getLogger()
+    log.info("lrkeywords start")
+    log.info("lrtools version : %s", LR_VERSION)
+
+    # open catalog
+    if not args.lrcat.endswith("lrcat"):
+        # specify LR catalog or INI file
+        config.load(args.lrcat)
+        args.lrcat = config.default_lrcat
+    lrdb = LRCatDB(
+        config,
+        args.lrcat,
+        snapshot=args.snapshot_file or (":memory:" if args.snapshot else None),
+        progress=lambda done, total: display_progress("snapshot", done, total),
+    )
+    lrk = LRKeywords(lrdb)
+
+    if args.tree:
+        lrk.show_hierarchical_indented()
+
+    if args.usage:
+        try:
+            usage = lrk.usage_counts()
+        except OperationalError as _e:
+            sys.exit(f" ==> FAILED: {_e}")
+        rows = []
+        for idkey, (photos, total) in usage.items():
+            if total < args.min_count:
+                continue
+            try:
+                hkeyname = lrk.get_hierarchical_name(idkey)
+            except KeyError:
+                # root keyword
+                continue
+            if args.keyword and not (
+                hkeyname == args.keyword or hkeyname.startswith(f"{args.keyword}|")
+            ):
+                continue
+            rows.append((hkeyname, photos, total))
+        if args.sort == "name":
+            rows.sort()
+        else:
+            column = 1 if args.sort == "photos" else 2
+            rows.sort(key=lambda row: (-row[column], row[0]))
+        display_results(
+            rows,
+            ["keyword", "photos", "total"],
+            max_lines=args.max_lines,
+            header=not args.no_header,
+            widths=args.widths,
+            separator=args.separator,
+        )
+
+    if args.related or args.export_cooccurrence:
+        cooccurrence = LRCooccurrence(lrk, include_persons=not args.no_persons)
+        try:
+            cooccurrence.build()
+        except OperationalError as _e:
+            sys.exit(f" ==> FAILED: {_e}")
+        if args.export_cooccurrence:
+            exported = cooccurrence.export(
+                args.export_cooccurrence, max(args.min_count, 1)
+            )
+            print(f" * Pairs of keywords exported: {exported}")
+        if args.related:
+            try:
+                idkey = lrk.get_id(args.keyword)
+            except KeyError:
+                sys.exit(f' ==> FAILED: keyword "{args.keyword}" not found')
+            top = args.max_lines if args.max_lines > 0 else 10
+            display_results(
+                [
+                    (lrk.get_hierarchical_name(idrelated), count)
+                    for idrelated, count in cooccurrence.related(idkey, top)
+                ],
+                ["keyword", "photos"],
+                header=not args.no_header,
+                widths=args.widths,
+                separator=args.separator,
+            )
+
+    log.info("lrkeywords end")
+
+
+if __name__ == "__main__":
+    # protect main from IOError occuring with a pipe command
+    try:
+        main()
+    except IOError as _e:
+        if _e.errno not in [22, 32]:
+            raise _e
+    except (LRConfigException, LRCatException) as _e:
+        print(" ==> FAILED:", _e, file=sys.stderr)
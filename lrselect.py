@@ -21,7 +21,7 @@ from lrtools.lrcat import LRCatDB, LRCatException
 from lrtools.lrselectgeneric import LRSelectException
 from lrtools.lrselectphoto import LRSelectPhoto
 from lrtools.lrselectcollection import LRSelectCollection
-from lrtools.display import display_results
+from lrtools.display import display_results, display_progress
 
 
 DEFAULT_COLUMNS = "name,datecapt"
@@ -106,6 +106,12 @@ def main():
         "--file",
         help="UUIDs photos file : replace the criteria parameter which is ignored",
     )
+    parser.add_argument(
+        "--file-key",
+        choices=["uuid", "id", "name"],
+        default="uuid",
+        help='type of values in file of option "--file" : uuid, id or name (exact base name) (default:"%(default)s")',
+    )
     parser.add_argument(
         "-t",
         "--table",
@@ -142,6 +148,31 @@ def main():
         action="store_true",
         help="print raw value (for speed, aperture columns)",
     )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="copy catalog in memory before requests. Useful for a catalog on a network drive,"
+        " or for a consistent view of a catalog in use",
+    )
+    parser.add_argument(
+        "--snapshot-file",
+        help='as --snapshot, but copy catalog in file SNAPSHOT_FILE ("tempfile" for a temporary file)',
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="use acceleration cache file next to catalog, for criteria datecapt, name, exactname, keyword, gps, develop"
+        " and for flat photo table. Cache is ignored when not up to date with catalog",
+    )
+    parser.add_argument(
+        "--cache-file",
+        help="as --cache, but with cache file CACHE_FILE",
+    )
+    parser.add_argument(
+        "--cache-build",
+        action="store_true",
+        help="build or refresh cache when not up to date with catalog (implies --cache)",
+    )
     parser.add_argument("--log", help="log on file")
     parser.add_argument(
         "--version", "-V", action="store_true", help="show version and exit"
@@ -195,7 +226,17 @@ def main():
         # not a catalog but an INI file
         config.load(args.lrcat)
         args.lrcat = config.default_lrcat
-    lrdb = LRCatDB(config, args.lrcat)
+    lrdb = LRCatDB(
+        config,
+        args.lrcat,
+        snapshot=args.snapshot_file or (":memory:" if args.snapshot else None),
+        progress=lambda done, total: display_progress("snapshot", done, total),
+        cache=args.cache_file or args.cache or args.cache_build,
+    )
+    if args.cache_build:
+        built = lrdb.build_cache()
+        if built:
+            print(f" * Cache built: {', '.join(built)}", file=sys.stderr)
 
     # select on which table to work
     if args.table == "photo":
@@ -217,43 +258,52 @@ def main():
         return
 
     if args.file:
-        # option file containing photo uuids
+        # option file containing photo uuids (or ids, names)
         try:
-            uuids = open(args.file, encoding="utf-8").read().splitlines()
+            values = open(args.file, encoding="utf-8").read().splitlines()
         except FileNotFoundError as _e:
             print(
                 f' ==> Failed to open input file "{_e.filename}"',
                 file=sys.stderr,
             )
             return
-        # build rows ...
-        bad_uuids = []
-        rows = []
-        for uuid in uuids:
-            try:
-                row = lrobj.select_generic(
-                    ",".join(columns_lr), f'uuid="{uuid}"'
-                ).fetchone()
-                if row is None:
-                    # failed to get uuid fromm db
-                    bad_uuids.append(uuid)
-                    continue
-                rows.append(row)
-            except LRSelectException as _e:
-                print(" ==> FAILED:", _e, file=sys.stderr)
-                return
-            except sqlite3.OperationalError as _e:
-                print(" ==> FAILED SQL :", _e, file=sys.stderr)
-                return
-        if bad_uuids:
+        # build rows in a single request, values being loaded in a temporary table
+        try:
+            cursor, bad_values = lrobj.select_by_values(
+                ",".join(columns_lr), args.file_key, values
+            )
+            rows = cursor.fetchall()
+        except LRSelectException as _e:
+            print(" ==> FAILED:", _e, file=sys.stderr)
+            return
+        except sqlite3.OperationalError as _e:
+            print(" ==> FAILED SQL :", _e, file=sys.stderr)
+            return
+        if bad_values:
             print(
-                f"=> WARNING found uuids invalid ({len(bad_uuids)}/{len(uuids)}) : {', '.join(bad_uuids)}"
+                f"=> WARNING found {args.file_key}s invalid ({len(bad_values)}/{len(values)}) : {', '.join(map(str, bad_values))}"
             )
+        total = len(rows)
     else:
+        # rows are streamed from database, not kept in memory
         try:
-            rows = lrobj.select_generic(
-                ",".join(columns_lr), args.criteria
-            ).fetchall()
+            total = None
+            if args.count or (args.results and not args.no_header):
+                # count computed by sqlite, without transfer of rows
+                total = lrobj.select_generic(
+                    ",".join(columns_lr), args.criteria, count=True
+                ).fetchone()[0]
+            rows = None
+            if args.results or args.filesize:
+                # only displayed rows are requested, except if total filesize is wanted
+                limit = (
+                    args.max_lines
+                    if args.max_lines > 0 and not args.filesize
+                    else None
+                )
+                rows = lrobj.select_iter(
+                    ",".join(columns_lr), args.criteria, limit=limit
+                )
         except LRSelectException as _e:
             # convert specific error caused by a limitation on build SQL with criteria width or height
             if _e.args[0] == "no such column: dims":
@@ -262,12 +312,13 @@ def main():
             return
 
     if args.count:
-        print(" * Count results:", len(rows))
+        print(" * Count results:", total)
 
     if args.results:
         display_results(
             rows,
             columns,
+            total=total,
             max_lines=args.max_lines,
             header=not args.no_header,
             widths=args.widths,
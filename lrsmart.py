@@ -7,20 +7,227 @@ Execute Lightroom smart collections from catalog or file
 
 """
 
+import io
 import sys
 import logging
 import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import redirect_stdout
 from sqlite3 import OperationalError
 
 from lrtools import __version__ as LR_VERSION
 
 from lrtools.lrtoolconfig import LRToolConfig, LRConfigException
 
-from lrtools.lrcat import LRCatDB, LRCatException
+from lrtools.lrcat import LRCatDB, LRCatException, iter_cursor
+from lrtools.lrcache import LRCacheException
 from lrtools.lrselectgeneric import LRSelectException
 from lrtools.lrsmartcoll import SQLSmartColl, SmartException
+from lrtools.lrsmartcache import LRSmartCache
 from lrtools.slpp import SLPP
-from lrtools.display import display_results
+from lrtools.display import display_results, display_progress
+
+
+def build_smart_sql(args, config, lrdb, smart_name):
+    """
+    Decode smart collection smart_name (name or filename), display its definition and build its requests
+    Return tuple (sql, sql_count), or None if failed or no request is needed
+    """
+    try:
+        if args.file:
+            print(f'Smart Collection filename "{smart_name}"')
+            try:
+                smart = open(smart_name, "r", encoding="utf-8").read()
+                smart = smart[smart.find("{") :]
+                lua = SLPP()
+                smart = lua.decode(smart)
+                if not smart or "value" not in smart:
+                    raise TypeError
+                if "title" in smart:
+                    smart_title = smart["title"]
+                else:
+                    smart_title = smart_name
+                print(f' * Collection name : "{smart_title}"')
+                smart = smart["value"]
+            except OSError:
+                print("  ==> FAILED : Not found")
+                return None
+            except (KeyError, TypeError):
+                print("  ==> FAILED : Invalid syntax")
+                return None
+
+        else:
+            smart = lrdb.get_smartcoll_data(smart_name)
+            if not smart:
+                raise OSError
+    except OSError as _e:
+        print("  ==> FAILED : Not found")
+        return None
+
+    builder = SQLSmartColl(config, lrdb, smart)
+
+    if args.dict:
+        print(" * Definition as python dictionary :")
+        for _s in builder.to_string().splitlines():
+            print("\t", _s)
+
+    if not (args.results or args.count or args.sql):
+        return None
+
+    try:
+        if args.compiler:
+            sql = builder.build_compiled_sql(args.columns)
+        else:
+            sql = builder.build_sql(args.columns)
+    except (LRSelectException, SmartException) as _e:
+        print(" ==> FAILED : ", _e)
+        return None
+    # the whole UNION/INTERSECT composition is counted : duplicates already removed
+    return sql, f"SELECT COUNT(*) FROM ({sql})"
+
+
+def run_smart(args, config, lrdb, smart_name, count_smart, sql_cache=None):
+    """
+    Execute smart collection smart_name (name or filename) and print requested informations
+    - sql_cache : LRSmartCache instance, for requests built by previous executions
+    Return False if all processing must stop
+    """
+    log = logging.getLogger()
+    if not args.file:
+        print(f'Smart Collection "{smart_name}"')
+    if args.raw:
+        if args.file:
+            try:
+                for line in (
+                    open(smart_name, encoding="utf-8").read().splitlines()
+                ):
+                    print(line)
+            except OSError:
+                print("  ==> FAILED : Not found")
+                return True
+        else:
+            print(" * Raw definition as stored :")
+            smart = lrdb.get_smartcoll_data(smart_name, True)
+            if not smart:
+                print("  ==> FAILED : Not found")
+                return False
+            for _s in smart.splitlines():
+                print("\t", _s)
+
+    sqls = None
+    content = None
+    if sql_cache and not args.file and (args.results or args.count or args.sql):
+        # requests built by a previous execution : definition is neither decoded nor compiled
+        content = lrdb.get_smartcoll_data(smart_name, True)
+        if not content:
+            print("  ==> FAILED : Not found")
+            return True
+        if not args.dict:
+            sqls = sql_cache.get(content, args.columns, args.compiler)
+    if not sqls:
+        sqls = build_smart_sql(args, config, lrdb, smart_name)
+        if not sqls:
+            return True
+        if content:
+            sql_cache.put(content, args.columns, args.compiler, *sqls)
+    sql, sql_count = sqls
+
+    # add sort on column
+    sort_column = args.sort_column.strip()
+    way = "ASC"
+    if sort_column[0] == "-":
+        way = "DESC"
+        sort_column = sort_column[1:]
+    sql += f" ORDER BY {sort_column} {way}"
+
+    if args.max_lines > 0:
+        # only displayed rows are requested
+        sql += f" LIMIT {args.max_lines}"
+
+    if args.sql:
+        print(" * SQL Request: ", sql)
+
+    if not (args.results or args.count):
+        return True
+
+    log.info('start smart "%s"', smart_name)
+    # rows are streamed from database, not kept in memory
+    try:
+        total = None
+        if args.count or (args.results and not args.no_header):
+            # count computed by sqlite, without transfer of rows
+            total = lrdb.new_cursor().execute(sql_count).fetchone()[0]
+            log.info("end smart : %s rows", total)
+        if args.results:
+            cursor = lrdb.new_cursor()
+            cursor.execute(sql)
+            rows = iter_cursor(cursor)
+    except OperationalError as _e:
+        log.info("end smart : FAILED : %s", _e)
+        print(" ==> FAILED : ", _e)
+        return True
+
+    if args.count:
+        print(" * Count results:", total, end="  ")
+        if smart_name in count_smart:
+            if count_smart[smart_name] == total:
+                print("=> conform to LR", end="")
+            else:
+                print(
+                    f"=> NOT_CONFORM to LR : {count_smart[smart_name]}",
+                    end="",
+                )
+        print()
+
+    if args.results:
+        display_results(
+            rows,
+            [d[0] for d in cursor.description],
+            total=total,
+            max_lines=args.max_lines,
+            header=not args.no_header,
+            raw_print=args.raw_print,
+            separator=args.separator,
+        )
+    return True
+
+
+# catalog and cache of requests of worker process (option --jobs), opened once by process
+_worker_lrdb = None
+_worker_sql_cache = None
+
+
+def _init_worker(config, lrcat, snapshot, cache, sql_cache_file):
+    """
+    Open catalog in worker process, and cache of requests if sql_cache_file is not None
+    """
+    global _worker_lrdb, _worker_sql_cache  # pylint: disable=global-statement
+    _worker_lrdb = LRCatDB(config, lrcat, snapshot=snapshot, cache=cache)
+    if sql_cache_file is not None:
+        _worker_sql_cache = LRSmartCache(_worker_lrdb, sql_cache_file)
+
+
+def _run_smart_worker(args, config, smart_name, count_smart):
+    """
+    Execute smart collection in worker process (see run_smart)
+    Return tuple (printed output, False if all processing must stop)
+    """
+    output = io.StringIO()
+    with redirect_stdout(output):
+        try:
+            go_on = run_smart(
+                args,
+                config,
+                _worker_lrdb,
+                smart_name,
+                count_smart,
+                _worker_sql_cache,
+            )
+        except Exception as _e:  # pylint: disable=broad-except
+            # failure is reported, without stopping others smart collections
+            print(" ==> FAILED : ", _e)
+            go_on = True
+    return output.getvalue(), go_on
 
 
 def main():
@@ -85,6 +292,11 @@ def main():
     parser.add_argument(
         "-c", "--count", action="store_true", help="display count of results"
     )
+    parser.add_argument(
+        "--compiler",
+        action="store_true",
+        help="build a single request for all criteria of smart collection, instead of a request by criteria",
+    )
     parser.add_argument("--validation-file", default="", help=argparse.SUPPRESS)
     parser.add_argument(
         "-r", "--results", action="store_true", help="display datas results"
@@ -134,6 +346,45 @@ def main():
         action="store_true",
         help="print raw value (for speed, aperture columns)",
     )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="copy catalog in memory before requests. Useful for a catalog on a network drive,"
+        " or for a consistent view of a catalog in use",
+    )
+    parser.add_argument(
+        "--snapshot-file",
+        help='as --snapshot, but copy catalog in file SNAPSHOT_FILE ("tempfile" for a temporary file)',
+    )
+    parser.add_argument(
+        "--cache",
+        action="store_true",
+        help="use acceleration cache file next to catalog, for criteria datecapt, name, exactname, keyword, gps and develop."
+        " Cache is ignored when not up to date with catalog",
+    )
+    parser.add_argument(
+        "--cache-file",
+        help="as --cache, but with cache file CACHE_FILE",
+    )
+    parser.add_argument(
+        "--cache-build",
+        action="store_true",
+        help="build or refresh cache when not up to date with catalog (implies --cache)",
+    )
+    parser.add_argument(
+        "--sql-cache",
+        action="store_true",
+        help="keep requests built in cache file (see --cache-file), and reuse them while the smart collection,"
+        " keywords and collections are unchanged",
+    )
+    parser.add_argument(
+        "-j",
+        "--jobs",
+        type=int,
+        default=1,
+        help="number of worker processes executing smart collections, each with its own connection to catalog."
+        " With --snapshot or --snapshot-file, each process copies catalog in memory",
+    )
     parser.add_argument("--log", help="log to file")
 
     args = parser.parse_args()
@@ -179,7 +430,24 @@ def main():
         # specify LR catalog or INI file
         config.load(args.lrcat)
         args.lrcat = config.default_lrcat
-    lrdb = LRCatDB(config, args.lrcat)
+    snapshot = args.snapshot_file or (":memory:" if args.snapshot else None)
+    cache = args.cache_file or args.cache or args.cache_build
+    lrdb = LRCatDB(
+        config,
+        args.lrcat,
+        # with worker processes, snapshot is done by each process
+        snapshot=snapshot if args.jobs <= 1 else None,
+        progress=lambda done, total: display_progress("snapshot", done, total),
+        cache=cache,
+    )
+    if args.cache_build:
+        built = lrdb.build_cache()
+        if built:
+            print(f" * Cache built: {', '.join(built)}", file=sys.stderr)
+
+    sql_cache = None
+    if args.sql_cache:
+        sql_cache = LRSmartCache(lrdb, args.cache_file)
 
     if args.list:
         if not args.smart_name:
@@ -192,119 +460,40 @@ def main():
             colls += lrdb.select_collections(lrdb.SMART_COLL, name)
         args.smart_name = [name for _, name, _ in colls]
 
-    for smart_name in args.smart_name:
-        if not args.file:
-            print(f'Smart Collection "{smart_name}"')
-        if args.raw:
-            if args.file:
-                try:
-                    for line in (
-                        open(smart_name, encoding="utf-8").read().splitlines()
-                    ):
-                        print(line)
-                except OSError:
-                    print("  ==> FAILED : Not found")
-                    continue
-            else:
-                print(" * Raw definition as stored :")
-                smart = lrdb.get_smartcoll_data(smart_name, True)
-                if not smart:
-                    print("  ==> FAILED : Not found")
-                    return
-                for _s in smart.splitlines():
-                    print("\t", _s)
-
-        try:
-            if args.file:
-                print(f'Smart Collection filename "{smart_name}"')
-                try:
-                    smart = open(smart_name, "r", encoding="utf-8").read()
-                    smart = smart[smart.find("{") :]
-                    lua = SLPP()
-                    smart = lua.decode(smart)
-                    if not smart or "value" not in smart:
-                        raise TypeError
-                    if "title" in smart:
-                        smart_title = smart["title"]
-                    else:
-                        smart_title = smart_name
-                    print(f' * Collection name : "{smart_title}"')
-                    smart = smart["value"]
-                except OSError:
-                    print("  ==> FAILED : Not found")
-                    continue
-                except (KeyError, TypeError):
-                    print("  ==> FAILED : Invalid syntax")
-                    continue
-
-            else:
-                smart = lrdb.get_smartcoll_data(smart_name)
-                if not smart:
-                    raise OSError
-        except OSError as _e:
-            print("  ==> FAILED : Not found")
-            continue
-
-        builder = SQLSmartColl(config, lrdb, smart)
-
-        if args.dict:
-            print(" * Definition as python dictionary :")
-            for _s in builder.to_string().splitlines():
-                print("\t", _s)
-
-        if not (args.results or args.count or args.sql):
-            continue
-
-        try:
-            sql = builder.build_sql(args.columns)
-        except (LRSelectException, SmartException) as _e:
-            print(" ==> FAILED : ", _e)
-            continue
-        # add sort on column
-        sort_column = args.sort_column.strip()
-        way = "ASC"
-        if sort_column[0] == "-":
-            way = "DESC"
-            sort_column = sort_column[1:]
-        sql += f" ORDER BY {sort_column} {way}"
-
-        if args.sql:
-            print(" * SQL Request: ", sql)
-
-        if not (args.results or args.count):
-            continue
-
-        log.info('start smart "%s"', smart_name)
-        try:
-            lrdb.cursor.execute(sql)
-            rows = lrdb.cursor.fetchall()
-            log.info("end smart : %s rows", len(rows))
-        except OperationalError as _e:
-            log.info("end smart : FAILED : %s", _e)
-            print(" ==> FAILED : ", _e)
-            continue
-
-        if args.count:
-            print(" * Count results:", len(rows), end="  ")
-            if smart_name in count_smart:
-                if count_smart[smart_name] == len(rows):
-                    print("=> conform to LR", end="")
-                else:
-                    print(
-                        f"=> NOT_CONFORM to LR : {count_smart[smart_name]}",
-                        end="",
-                    )
-            print()
-
-        if args.results:
-            display_results(
-                rows,
-                [d[0] for d in lrdb.cursor.description],
-                max_lines=args.max_lines,
-                header=not args.no_header,
-                raw_print=args.raw_print,
-                separator=args.separator,
-            )
+    if args.jobs > 1:
+        # smart collections distributed on worker processes, outputs printed in smart collections order
+        with ProcessPoolExecutor(
+            max_workers=args.jobs,
+            initializer=_init_worker,
+            initargs=(
+                config,
+                args.lrcat,
+                snapshot and ":memory:",
+                cache,
+                sql_cache and sql_cache.cache_file,
+            ),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _run_smart_worker, args, config, smart_name, count_smart
+                )
+                for smart_name in args.smart_name
+            ]
+            for future in futures:
+                output, go_on = future.result()
+                print(output, end="")
+                if not go_on:
+                    for pending in futures:
+                        pending.cancel()
+                    break
+    else:
+        for smart_name in args.smart_name:
+            if not run_smart(
+                args, config, lrdb, smart_name, count_smart, sql_cache
+            ):
+                break
+    if sql_cache:
+        sql_cache.close()
 
     log.info("lrsmart end")
 
@@ -316,5 +505,10 @@ if __name__ == "__main__":
     except IOError as _e:
         if _e.errno not in [22, 32]:
             raise _e
-    except (LRConfigException, LRSelectException, LRCatException) as _e:
+    except (
+        LRConfigException,
+        LRSelectException,
+        LRCatException,
+        LRCacheException,
+    ) as _e:
         print(" ==> FAILED:", _e, file=sys.stderr)
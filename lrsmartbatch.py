@@ -0,0 +1,227 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+"""
+
+Evaluate all smart collections of a Lightroom catalog, sharing results of identical criteria
+
+"""
+
+import sys
+import time
+import logging
+import argparse
+
+from lrtools import __version__ as LR_VERSION
+
+from lrtools.lrtoolconfig import LRToolConfig, LRConfigException
+
+from lrtools.lrcat import LRCatDB, LRCatException
+from lrtools.lrcache import LRCacheException
+from lrtools.lrsmartbatch import LRSmartBatch
+from lrtools.lrsmartindex import LRSmartIndex
+from lrtools.display import display_results, display_progress
+
+
+def main():
+    """Main entry from command line"""
+
+    config = LRToolConfig()
+
+    #
+    # commands parser
+    #
+    parser = argparse.ArgumentParser(
+        description="Evaluate smart collections from Lightroom catalog, in batch :"
+        " criteria shared by smart collections are evaluated once."
+        " Display count of photos and duration by smart collection"
+    )
+    parser.add_argument(
+        "smart_name",
+        help='name of smart collections (joker "%%"). Leave empty for all collections',
+        nargs="?",
+        default="",
+    )
+    parser.add_argument(
+        "-b",
+        "--lrcat",
+        default=config.default_lrcat,
+        help='Lightroom catalog file for database request (default:"%(default)s")',
+    )
+    parser.add_argument("--validation-file", default="", help=argparse.SUPPRESS)
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="build or refresh index of photos in smart collections, stored in cache file."
+        " Only smart collections or photos modified since last refresh are evaluated",
+    )
+    parser.add_argument(
+        "--index-full",
+        action="store_true",
+        help="rebuild whole index of photos in smart collections (see --index)",
+    )
+    parser.add_argument(
+        "-p",
+        "--photo",
+        help="display smart collections containing photo PHOTO (id, uuid or name with jokers \"%%\")."
+        " Index is refreshed if not up to date with catalog",
+    )
+    parser.add_argument(
+        "--cache-file",
+        help="cache file for index (default: cache file next to catalog)",
+    )
+    parser.add_argument(
+        "-N",
+        "--no-header",
+        action="store_true",
+        help="don't print header (columns names)",
+    )
+    parser.add_argument(
+        "-w",
+        "--widths",
+        default="-40,8,8,9,9",
+        help='widths of columns to display (default:"%(default)s")',
+    )
+    parser.add_argument(
+        "-S",
+        "--separator",
+        default=" | ",
+        help='separator string between columns (default:"%(default)s")',
+    )
+    parser.add_argument(
+        "--snapshot",
+        action="store_true",
+        help="copy catalog in memory before requests. Useful for a catalog on a network drive,"
+        " or for a consistent view of a catalog in use",
+    )
+    parser.add_argument(
+        "--snapshot-file",
+        help='as --snapshot, but copy catalog in file SNAPSHOT_FILE ("tempfile" for a temporary file)',
+    )
+    parser.add_argument("--log", help="log to file")
+
+    args = parser.parse_args()
+
+    # logging
+    if args.log:
+        log = logging.getLogger()
+        log.setLevel(logging.INFO)
+        handler = logging.FileHandler(args.log, "a", "utf-8")
+        handler.setFormatter(logging.Formatter("%(asctime)s - %(message)s"))
+        log.addHandler(handler)
+    log = logging.getLogger()
+    log.info("lrsmartbatch start")
+    log.info("lrtools version : %s", LR_VERSION)
+
+    # photos number by smart collection extracted from Lightroom, see lrsmart.py
+    count_smart = {}
+    if args.validation_file:
+        try:
+            lines = (
+                open(args.validation_file, encoding="utf8").read().splitlines()
+            )
+            for line in lines:
+                values = line.split("==>")
+                if not len(values) == 2:
+                    continue
+                count_smart[values[0].strip()] = int(values[1].strip())
+        except FileNotFoundError:
+            sys.exit("Validation file not found")
+
+    # open catalog
+    if not args.lrcat.endswith("lrcat"):
+        # specify LR catalog or INI file
+        config.load(args.lrcat)
+        args.lrcat = config.default_lrcat
+    lrdb = LRCatDB(
+        config,
+        args.lrcat,
+        snapshot=args.snapshot_file or (":memory:" if args.snapshot else None),
+        progress=lambda done, total: display_progress("snapshot", done, total),
+    )
+
+    if args.index or args.index_full or args.photo:
+        index = LRSmartIndex(config, lrdb, args.cache_file)
+        stats = None
+        if args.index or args.index_full or not index.is_fresh():
+            stats = index.refresh(full=args.index_full)
+            print(
+                f' * Index refreshed: {stats["collections"]} smart collections evaluated on all photos,'
+                f' {stats["images"]} photos evaluated for others smart collections'
+            )
+            for name, error in stats["failed"]:
+                print(f'Smart Collection "{name}" ==> FAILED : {error}')
+        if args.photo:
+            if not stats:
+                # smart collections in error are missing from results
+                for name, error in index.failed():
+                    print(f'Smart Collection "{name}" ==> FAILED : {error}')
+            if args.photo.isdigit():
+                photos = {int(args.photo): index.smart_collections(int(args.photo))}
+            elif len(args.photo) == 36 and args.photo.count("-") == 4:
+                photos = {args.photo: index.smart_collections_by_uuid(args.photo)}
+            else:
+                photos = index.smart_collections_by_name(args.photo)
+            display_results(
+                [
+                    (photo, name)
+                    for photo, names in photos.items()
+                    for name in names
+                ],
+                ["photo", "smart collection"],
+                header=not args.no_header,
+                widths="36,-40",
+                separator=args.separator,
+            )
+        log.info("lrsmartbatch end")
+        return
+
+    start = time.perf_counter()
+    batch = LRSmartBatch(config, lrdb)
+    rows = []
+    failed = []
+    for name, result in batch.run(args.smart_name):
+        if result["ids"] is None:
+            failed.append((name, result["error"]))
+            continue
+        count = len(result["ids"])
+        if name in count_smart and count_smart[name] != count:
+            count = f"{count} (LR:{count_smart[name]})"
+        rows.append(
+            (
+                name,
+                count,
+                result["criteria"],
+                result["criteria"] - result["evaluated"],
+                f'{result["duration"] * 1000:.1f}',
+            )
+        )
+    duration = time.perf_counter() - start
+
+    display_results(
+        rows,
+        ["smart collection", "photos", "criteria", "shared", "time (ms)"],
+        header=not args.no_header,
+        widths=args.widths,
+        separator=args.separator,
+    )
+    for name, error in failed:
+        print(f'Smart Collection "{name}" ==> FAILED : {error}')
+    if not args.no_header:
+        print(
+            f" * {len(rows) + len(failed)} smart collections, {len(batch.criteria_ids)} distinct criteria evaluated"
+            f" in {duration:.2f}s"
+        )
+
+    log.info("lrsmartbatch end")
+
+
+if __name__ == "__main__":
+    # protect main from IOError occuring with a pipe command
+    try:
+        main()
+    except IOError as _e:
+        if _e.errno not in [22, 32]:
+            raise _e
+    except (LRConfigException, LRCatException, LRCacheException) as _e:
+        print(" ==> FAILED:", _e, file=sys.stderr)
@@ -3,162 +3,181 @@
 # pylint: disable=line-too-long
 """
     Lexical parser for criteria
+
+    Criteria are parsed in a single pass to a list of tokens and to a syntax tree of tuples :
+        - ("KEYVAL", (key, value)) : criterion
+        - ("AND", (node, ...)), ("OR", (node, ...)) : "," binds tighter than "|", as AND and OR in SQL
+        - ("PAR", node) : expression between parenthesis
+        - ("NOT", node) : negation of criterion or expression between parenthesis, by "!" or "not(...)"
+    Parsed criteria are kept in a LRU cache, keyed by criteria string.
 """
 
 import re
+from functools import lru_cache
+
+# number of criteria strings kept parsed
+PARSE_CACHE_SIZE = 256
+
+# List of tokens accepted after specific token
+RULES_FOLLOW = {
+    None: ["LPAR", "KEYVAL", "NOT"],
+    "KEYVAL": ["OR", "AND", "RPAR"],
+    "OR": ["KEYVAL", "LPAR", "NOT"],
+    "AND": ["KEYVAL", "LPAR", "NOT"],
+    "LPAR": ["KEYVAL", "LPAR", "NOT"],
+    "RPAR": ["OR", "AND", "RPAR"],
+    "NOT": ["KEYVAL", "LPAR", "NOT"],
+}
+
+# tokens of operators characters
+OPERATORS = {"(": "LPAR", ")": "RPAR", ",": "AND", "|": "OR", "!": "NOT"}
+
+SPACES = re.compile(r" *")
+KEY = re.compile(r"(\w+) *")
+EQUAL = re.compile(r" *= *")
+# regex from https://www.metaltoad.com/blog/regex-quoted-string-escapable-quotes
+QUOTED = re.compile(r' *((?<![\\])[\'"])((?:.(?!(?<![\\])\1))*.?)\1')
+VALUE = re.compile(r" *([^,\|\)\(]+)")
+
+
+def _append(stack, nots, node):
+    """
+    Append node to current terms of AND, negated by NOT operators pending
+    """
+    for _ in range(nots[-1]):
+        node = ("NOT", node)
+    nots[-1] = 0
+    stack[-1][-1].append(node)
 
 
-class CriterLexer:
+def _node(terms):
     """
-    Lexical parser for criteria
+    Return node of expression from list of terms of OR, each a list of terms of AND
     """
+    ors = tuple(
+        ands[0] if len(ands) == 1 else ("AND", tuple(ands)) for ands in terms
+    )
+    return ors[0] if len(ors) == 1 else ("OR", ors)
 
-    # List of tokens accepted after specific token
-    RULES_FOLLOW = {
-        None: ["LPAR", "KEYVAL"],
-        "KEYVAL": ["OR", "AND", "RPAR"],
-        "OR": ["KEYVAL", "LPAR"],
-        "AND": ["KEYVAL", "LPAR"],
-        "LPAR": ["KEYVAL", "LPAR"],
-        "RPAR": ["OR", "AND", "RPAR"],
-    }
-
-    def __init__(self, criters):
-        """ """
-        self.criters = criters
-        self.tokens = list()
-        self.last_error = ""
-
-    def _parse_keyval(self):
-        """
-        Parse KEY [= VALUE]
-        """
-        #
-        # get criter
-        #
-        _m = re.match(r"(\w+) *", self.criters)
-        if not _m:
-            return False
-        key = _m.group(1).lower()
-        self.criters = self.criters[_m.end() :]
 
+@lru_cache(maxsize=PARSE_CACHE_SIZE)
+def parse_criteria(criters):
+    """
+    Parse criteria string : tokens are scanned by position, and checked as they come
+    Return tuple (tokens, tree, error) : tree is None for empty or invalid criteria, error is empty if syntax is valid
+    """
+    tokens = []
+    # first error on tokens order, reported if no invalid token follows
+    error = ""
+    # expressions opened by parenthesis : list of terms of OR, each a list of terms of AND
+    stack = [[[]]]
+    # number of NOT operators pending for next term, by expression
+    nots = [0]
+    unbalanced = False
+    prev = None
+    pos = 0
+    end = len(criters.rstrip())
+    while pos < end:
+        _m = KEY.match(criters, pos, end)
+        if (
+            _m
+            and _m.group(1).lower() == "not"
+            and criters.startswith("(", _m.end(), end)
+        ):
+            # operator NOT before parenthesis : "not(...)"
+            token, data = "NOT", None
+            pos = _m.end()
         #
-        # get value
+        # parse "key = value", or "key" alone
         #
-        _m = re.match(r" *= *", self.criters)
-        if _m:
-            self.criters = self.criters[_m.end() :]
-            # regex from https://www.metaltoad.com/blog/regex-quoted-string-escapable-quotes
-            _m = re.match(
-                r' *((?<![\\])[\'"])((?:.(?!(?<![\\])\1))*.?)\1', self.criters
-            )
+        elif _m:
+            key = _m.group(1).lower()
+            pos = _m.end()
+            _m = EQUAL.match(criters, pos, end)
             if _m:
-                # regex return quote type ("') and string
-                value = _m.group(2)
-            else:
-                _m = re.match(r" *([^,\|\)\(]+)", self.criters)
+                pos = _m.end()
+                _m = QUOTED.match(criters, pos, end)
                 if _m:
-                    value = _m.group(1)
+                    # regex return quote type ("') and string
+                    value = _m.group(2)
                 else:
-                    self.last_error = f'No value for criterion "{key}"'
-                    return False
-            if _m:
-                self.criters = self.criters[_m.end() :]
-                self.tokens.append(("KEYVAL", (key, value)))
-
+                    _m = VALUE.match(criters, pos, end)
+                    if not _m:
+                        return (
+                            tuple(tokens),
+                            None,
+                            f'No value for criterion "{key}"',
+                        )
+                    value = _m.group(1)
+                pos = _m.end()
+            else:
+                # no value for criter
+                value = "True"
+            token, data = "KEYVAL", (key, value)
+        elif criters[pos] in OPERATORS:
+            token, data = OPERATORS[criters[pos]], None
+            pos = SPACES.match(criters, pos + 1, end).end()
         else:
-            # no value for criter
-            value = "True"
-            self.tokens.append(("KEYVAL", (key, value)))
-        return True
-
-    def parse(self, criters=None):
-        """
-        Parse criters string
-        """
-        if criters:
-            self.criters = criters
-        if not self.criters:
-            return False
-
-        while len(self.criters) > 0:
-
-            self.criters = self.criters.rstrip()
-            if len(self.criters) == 0:
-                break
+            return (
+                tuple(tokens),
+                None,
+                f'Invalid token \042{criters[pos:end].split(" ")[0]}\042',
+            )
+        tokens.append((token, data))
+
+        if error:
+            continue
+        if token not in RULES_FOLLOW[prev]:
+            error = f'"{token}" not allowed after "{prev}"'
+        elif token == "KEYVAL":
+            _append(stack, nots, (token, data))
+        elif token == "NOT":
+            nots[-1] += 1
+        elif token == "OR":
+            stack[-1].append([])
+        elif token == "LPAR":
+            stack.append([[]])
+            nots.append(0)
+        elif token == "RPAR":
+            if len(stack) == 1:
+                # reported after errors on tokens order, as unbalanced parenthesis at end
+                unbalanced = True
+            else:
+                nots.pop()
+                node = ("PAR", _node(stack.pop()))
+                _append(stack, nots, node)
+        prev = token
 
-            #
-            # parse "key = value"
-            #
-            if self._parse_keyval():
-                continue
-            if self.last_error:
-                return False
+    if not error and (unbalanced or len(stack) != 1):
+        error = "unbalanced parenthesis"
+    if not error and prev in ("AND", "OR", "NOT"):
+        error = f'"{prev}" not allowed at end'
+    if error or not tokens:
+        return tuple(tokens), None, error
+    return tuple(tokens), _node(stack[0]), ""
 
-            #
-            # operator left parenthesis : '('
-            #
-            _m = re.match(r"(\() *", self.criters)
-            if _m:
-                self.tokens.append(("LPAR", None))
-                self.criters = self.criters[_m.end() :]
-                continue
-
-            #
-            # operator right parenthesis : ')'
-            #
-            _m = re.match(r"(\)) *", self.criters)
-            if _m:
-                self.tokens.append(("RPAR", None))
-                self.criters = self.criters[_m.end() :]
-                continue
-
-            #
-            # operator AND : ','
-            #
-            _m = re.match(r", *", self.criters)
-            if _m:
-                self.tokens.append(("AND", None))
-                self.criters = self.criters[_m.end() :]
-                continue
-
-            #
-            # operator OR : '|'
-            #
-            _m = re.match(r"\| *", self.criters)
-            if _m:
-                self.tokens.append(("OR", None))
-                self.criters = self.criters[_m.end() :]
-                continue
-
-            #
-            # Finally : token error
-            #
-            self.last_error = (
-                f'Invalid token \042{self.criters.split(" ")[0]}\042'
-            )
 
-            return False
+class CriterLexer:
+    """
+    Lexical parser for criteria
+    """
 
-        return self.check_syntax()
+    def __init__(self, criters):
+        """ """
+        self.criters = criters
+        self.tokens = list()
+        self.tree = None
+        self.last_error = ""
 
-    def check_syntax(self):
+    def parse(self, criters=None):
         """
-        Check criters syntax (only following token)
+        Parse criters string : set tokens, syntax tree (see parse_criteria) and last_error
+        Return True if syntax is valid
         """
-        prev_token = None
-        par_level = 0
-        for token, _ in self.tokens:
-            allowed_tokens = self.RULES_FOLLOW[prev_token]
-            if token not in allowed_tokens:
-                self.last_error = f'"{token}" not allowed after "{prev_token}"'
-                return False
-            if token == "LPAR":
-                par_level += 1
-            elif token == "RPAR":
-                par_level -= 1
-            prev_token = token
-        if par_level != 0:
-            self.last_error = "unbalanced parenthesis"
+        if criters:
+            self.criters = criters
+        if not self.criters:
             return False
-        return True
+        tokens, self.tree, self.last_error = parse_criteria(self.criters)
+        self.tokens = list(tokens)
+        return not self.last_error
@@ -10,6 +10,7 @@ SQL results display functions
 import sys
 import os
 import re
+import itertools
 from datetime import datetime, timedelta
 import pytz
 import tzlocal
@@ -118,6 +119,14 @@ def seconds_tostring(seconds, **kwargs):
     return "".join(stime)
 
 
+def display_progress(label, done, total):
+    """display progression on stderr, on the same line"""
+    percent = 100 * done // total if total else 100
+    print(f"\r * {label}: {percent:3}%", end="", file=sys.stderr)
+    if done >= total:
+        print(file=sys.stderr)
+
+
 #
 # default columns width and display functions
 #
@@ -189,9 +198,10 @@ def prepare_display_columns(columns, widths):
 def display_results(rows, columns, **kwargs):
     """
     Display SQL results
-    - rows : SQL colummns
+    - rows : SQL rows : a list, or an iterable (ex: LRSelectGeneric.select_iter) consumed as displayed
     - columns : column names to display ("filesize" column can be specified for compute filesize )
     - kwargs :
+       * total : total number of rows displayed in header, when rows is an iterable without length
        * max_lines : max lines to display
        * header : display header (columns names)
        * indent : number of indentation space on each line
@@ -200,10 +210,18 @@ def display_results(rows, columns, **kwargs):
        * raw_print : print raw value (for columns aperture, shutter speed, ido, dates)
        * filesize : compute and add column filesize
     """
-    if not rows:
+    if hasattr(rows, "__len__"):
+        total = len(rows)
+    else:
+        total = kwargs.get("total")
+    # rows are consumed once : peek first row, then chain it back
+    rows = iter(rows)
+    first_row = next(rows, None)
+    if first_row is None:
         if kwargs.get("header", True):
             print(" * None data result")
         return
+    rows = itertools.chain([first_row], rows)
 
     if isinstance(columns, str):
         columns = [a.strip() for a in columns.split(",")]
@@ -217,19 +235,23 @@ def display_results(rows, columns, **kwargs):
     wanted_lines = kwargs.get("max_lines", sys.maxsize)
     if wanted_lines < 0:
         wanted_lines = sys.maxsize
-    if wanted_lines >= len(rows):
-        max_lines = len(rows)
-        if kwargs.get("header", True):
-            print(f" * Results ({len(rows)} entries) :")
-    else:
-        max_lines = wanted_lines
-        if kwargs.get("header", True):
-            print(f" * Results (first {wanted_lines} entries of {len(rows)}) :")
+    max_lines = wanted_lines
+    if kwargs.get("header", True):
+        if total is None:
+            # count of rows unknown
+            if wanted_lines == sys.maxsize:
+                print(" * Results :")
+            else:
+                print(f" * Results (first {wanted_lines} entries) :")
+        elif wanted_lines >= total:
+            print(f" * Results ({total} entries) :")
+        else:
+            print(f" * Results (first {wanted_lines} entries of {total}) :")
 
     column_spec = prepare_display_columns(columns, widths)
 
     # basic check : detect if suffisant column
-    for i in range(len(rows[0])):
+    for i in range(len(first_row)):
         if i < len(column_spec):
             continue
         column_spec[i] = (f"column{i}", DEFAULT_SPEC[0], DEFAULT_SPEC[1])
@@ -264,11 +286,8 @@ def display_results(rows, columns, **kwargs):
         columns_lr.remove("filesize")
         id_fname = columns_lr.index("name=full")
         id_filesize = columns.index("filesize")
-    for num in range(0, max_lines):
-        if num == len(rows):
-            break
+    for row in itertools.islice(rows, max_lines):
         line = []
-        row = rows[num]
         if kwargs.get("filesize", False):
             fname = row[id_fname]
             try:
@@ -294,8 +313,7 @@ def display_results(rows, columns, **kwargs):
 
     # datas displayed, but maybe still filesize to compute
     if kwargs.get("filesize", False):
-        for num in range(max_lines, len(rows)):
-            row = rows[num]
+        for row in rows:
             fname = row[id_fname]
             try:
                 size = os.path.getsize(fname)
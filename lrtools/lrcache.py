@@ -0,0 +1,270 @@
+# # -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+
+"""
+LRCacheDB class for the acceleration database of a Lightroom catalog
+
+The catalog is opened read-only, so indexes missing in Lightroom schema can't be added to it.
+The cache is a sqlite file, next to the catalog, containing copies of some catalog columns with their indexes.
+It is attached to catalog connections as database "lrcache".
+Each part of the cache is invalidated when the size or the modification time of the catalog changes.
+"""
+
+import os
+import sqlite3
+import logging
+import time
+
+from .lrdevelop import build_develop
+
+log = logging.getLogger(__name__)
+
+# database name of cache in catalog connections
+CACHE_ALIAS = "lrcache"
+# suffix of cache file, added to catalog filename without extension
+CACHE_SUFFIX = ".lrtools-cache"
+
+
+def catalog_fingerprint(lrcat_file):
+    """
+    Return fingerprint of catalog file : size and modification time
+    """
+    stat = os.stat(lrcat_file)
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+
+class LRCacheException(Exception):
+    """LRCacheDB Exception"""
+
+
+class LRCacheDB:
+    """
+    Acceleration database of a Lightroom catalog
+
+    Parts of cache (tables of database "lrcache") :
+        - dates : capture time of photos, and its dates at start of day, month and year
+        - names : photo names (basename and virtual copy name), and uppercase basenames
+        - keywords : keywords names, case insensitive
+        - gps : GPS coordinates of geolocalized photos
+        - facts : one denormalized row by photo : all columns of Adobe_images, and columns of joined tables
+            (file, folder, exif, iptc, develop settings, additional metadata) prefixed by their origin
+        - develop : a selection of develop settings of photos, decoded from Lua (see lrdevelop). Refresh decodes
+            only photos new or touched since last build
+    """
+
+    # format version of cache tables, increase it on any change in PARTS
+    VERSION = 2
+
+    # SQL statements building each part, or function building it (see build), catalog is attached as "lrcat"
+    PARTS = {
+        "dates": [
+            "DROP TABLE IF EXISTS dates",
+            "CREATE TABLE dates (image INTEGER PRIMARY KEY, captureTime, day, month, year)",
+            "INSERT INTO dates SELECT id_local, captureTime,"
+            " DATE(captureTime, 'start of day'), DATE(captureTime, 'start of month'), DATE(captureTime, 'start of year')"
+            " FROM lrcat.Adobe_images",
+            "CREATE INDEX dates_day ON dates(day)",
+            "CREATE INDEX dates_month ON dates(month)",
+            "CREATE INDEX dates_year ON dates(year)",
+        ],
+        "names": [
+            "DROP TABLE IF EXISTS names",
+            "CREATE TABLE names (image INTEGER PRIMARY KEY, name TEXT COLLATE NOCASE, ubase TEXT)",
+            "INSERT INTO names SELECT i.id_local, fi.baseName || COALESCE(i.copyName, ''), UPPER(fi.baseName)"
+            " FROM lrcat.Adobe_images i LEFT JOIN lrcat.AgLibraryFile fi ON i.rootFile = fi.id_local",
+            "CREATE INDEX names_name ON names(name)",
+            "CREATE INDEX names_ubase ON names(ubase)",
+        ],
+        "keywords": [
+            "DROP TABLE IF EXISTS keywords",
+            "CREATE TABLE keywords (id INTEGER PRIMARY KEY, name TEXT COLLATE NOCASE)",
+            "INSERT INTO keywords SELECT id_local, name FROM lrcat.AgLibraryKeyword",
+            "CREATE INDEX keywords_name ON keywords(name)",
+        ],
+        "gps": [
+            "DROP TABLE IF EXISTS gps",
+            "CREATE TABLE gps (image INTEGER, lat, lon)",
+            "INSERT INTO gps SELECT image, gpsLatitude, gpsLongitude FROM lrcat.AgHarvestedExifMetadata WHERE hasGps = 1",
+            "CREATE INDEX gps_lat_lon ON gps(lat, lon)",
+        ],
+        "facts": [
+            "DROP TABLE IF EXISTS facts",
+            "CREATE TABLE facts AS SELECT i.*,"
+            " fi.baseName AS fileBaseName, fi.extension AS fileExtension, fi.sidecarExtensions AS fileSidecarExtensions,"
+            " fo.id_local AS folderId, rf.absolutePath || fo.pathFromRoot AS folderPath,"
+            " cm.value AS exifCamera, csn.value AS exifCameraSN, el.value AS exifLens,"
+            " em.isoSpeedRating AS exifIso, em.focalLength AS exifFocal, em.aperture AS exifAperture,"
+            " em.shutterSpeed AS exifSpeed, em.flashFired AS exifFlash,"
+            " em.hasGps AS exifHasGps, em.gpsLatitude AS exifLatitude, em.gpsLongitude AS exifLongitude,"
+            " iic.value AS iptcCreator, iptc.caption AS iptcCaption, iptc.copyright AS iptcCopyright,"
+            " iptcloc.value AS iptcLocation, iptccity.value AS iptcCity, iptcstate.value AS iptcState, iptccountry.value AS iptcCountry,"
+            " am.monochrome AS metaMonochrome, am.externalXmpIsDirty AS metaXmpDirty,"
+            " ids.grayscale AS devGrayscale,"
+            " (SELECT CASE"
+            " WHEN ids.croppedWidth <> 'uncropped' AND i.orientation IN ('AB', 'BA', 'CD', 'DC') THEN CAST(ids.croppedWidth AS int) || 'x' || CAST(ids.croppedHeight AS int)"
+            " WHEN ids.croppedWidth <> 'uncropped' AND i.orientation IN ('AD', 'DA', 'BC', 'CB') THEN CAST(ids.croppedHeight AS int) || 'x' || CAST(ids.croppedWidth AS int)"
+            " WHEN ids.croppedWidth = 'uncropped' AND i.orientation IN ('AB', 'BA', 'CD', 'DC') THEN CAST(i.filewidth AS int) || 'x' || CAST(i.fileHeight AS int)"
+            " WHEN ids.croppedWidth = 'uncropped' AND i.orientation IN ('AD', 'DA', 'BC', 'CB') THEN CAST(i.fileHeight AS int) || 'x' || CAST(i.filewidth AS int)"
+            " ELSE CAST(i.filewidth AS int) || 'x' || CAST(i.fileHeight AS int) END) AS devDims"
+            " FROM lrcat.Adobe_images i"
+            " LEFT JOIN lrcat.AgLibraryFile fi ON i.rootFile = fi.id_local"
+            " LEFT JOIN lrcat.AgLibraryFolder fo ON fi.folder = fo.id_local"
+            " LEFT JOIN lrcat.AgLibraryRootFolder rf ON fo.rootFolder = rf.id_local"
+            " LEFT JOIN lrcat.AgHarvestedExifMetadata em ON i.id_local = em.image"
+            " LEFT JOIN lrcat.AgInternedExifCameraModel cm ON cm.id_local = em.cameraModelRef"
+            " LEFT JOIN lrcat.AgInternedExifCameraSN csn ON csn.id_local = em.cameraSNRef"
+            " LEFT JOIN lrcat.AgInternedExifLens el ON el.id_local = em.lensRef"
+            " LEFT JOIN lrcat.AgHarvestedIptcMetadata im ON i.id_local = im.image"
+            " LEFT JOIN lrcat.AgInternedIptcCreator iic ON im.creatorRef = iic.id_local"
+            " LEFT JOIN lrcat.AgInternedIptcLocation iptcloc ON iptcloc.id_local = im.locationRef"
+            " LEFT JOIN lrcat.AgInternedIptcCity iptccity ON iptccity.id_local = im.cityRef"
+            " LEFT JOIN lrcat.AgInternedIptcState iptcstate ON iptcstate.id_local = im.stateRef"
+            " LEFT JOIN lrcat.AgInternedIptcCountry iptccountry ON iptccountry.id_local = im.countryRef"
+            " LEFT JOIN lrcat.AgLibraryIPTC iptc ON i.id_local = iptc.image"
+            " LEFT JOIN lrcat.Adobe_AdditionalMetadata am ON i.id_local = am.image"
+            " LEFT JOIN lrcat.Adobe_imageDevelopSettings ids ON ids.image = i.id_local",
+            "CREATE INDEX facts_id_local ON facts(id_local)",
+            "CREATE INDEX facts_id_global ON facts(id_global)",
+            # with id_local for keyset pagination on capture time
+            "CREATE INDEX facts_captureTime ON facts(captureTime, id_local)",
+            "CREATE INDEX facts_gps ON facts(exifLatitude, exifLongitude)",
+        ],
+        "develop": build_develop,
+    }
+
+    def __init__(self, lrcat_file, cache_file=None):
+        """
+        Init
+        - lrcat_file : Lightroom catalog filename
+        - cache_file : cache filename. Default is catalog filename with extension CACHE_SUFFIX
+        """
+        self.lrcat_file = lrcat_file
+        if not cache_file:
+            cache_file = os.path.splitext(lrcat_file)[0] + CACHE_SUFFIX
+        self.cache_file = cache_file
+        # fingerprint of catalog at last check, and parts fresh for it
+        self._checked_fingerprint = None
+        self._fresh_parts = set()
+
+    def fingerprint(self):
+        """
+        Return fingerprint of catalog file : size and modification time
+        """
+        return catalog_fingerprint(self.lrcat_file)
+
+    def fresh_parts(self):
+        """
+        Return set of cache parts up to date with catalog
+        """
+        fingerprint = self.fingerprint()
+        if fingerprint == self._checked_fingerprint:
+            return self._fresh_parts
+        fresh = set()
+        if os.path.exists(self.cache_file):
+            try:
+                conn = sqlite3.connect(f"file:{self.cache_file}?mode=ro", uri=True)
+                try:
+                    rows = conn.execute(
+                        "SELECT part FROM meta WHERE fingerprint = ? AND version = ?",
+                        (fingerprint, self.VERSION),
+                    ).fetchall()
+                finally:
+                    conn.close()
+                fresh = {part for (part,) in rows}
+            except sqlite3.DatabaseError as _e:
+                log.info('cache "%s" unreadable : %s', self.cache_file, _e)
+        self._fresh_parts = fresh
+        self._checked_fingerprint = fingerprint
+        return fresh
+
+    def is_fresh(self, part):
+        """
+        Return True if cache part is up to date with catalog
+        """
+        return part in self.fresh_parts()
+
+    def build(self, parts=None, force=False):
+        """
+        Build cache parts not up to date with catalog
+        - parts : list of parts names, or None for all parts
+        - force : build parts even if up to date. Parts built by a function are refreshed incrementally, unless forced
+        Return list of parts built
+        """
+        if parts is None:
+            parts = list(self.PARTS)
+        for part in parts:
+            if part not in self.PARTS:
+                raise LRCacheException(f'Invalid cache part "{part}"')
+        # fingerprint is taken before build : a catalog modified meanwhile invalidates the cache
+        fingerprint = self.fingerprint()
+        fresh = self.fresh_parts()
+        built = []
+        try:
+            # uri=True for attach of catalog with URI parameters
+            conn = sqlite3.connect(f"file:{self.cache_file}", uri=True)
+        except sqlite3.OperationalError as _e:
+            raise LRCacheException(
+                f'Unable to create cache "{self.cache_file}": {_e}'
+            ) from _e
+        try:
+            conn.execute(
+                "ATTACH DATABASE ? AS lrcat",
+                (f"file:{self.lrcat_file}?mode=ro&cache=private&immutable=1",),
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (part TEXT PRIMARY KEY, fingerprint TEXT, version INTEGER, built REAL)"
+            )
+            conn.commit()
+            for part in parts:
+                if part in fresh and not force:
+                    continue
+                start = time.perf_counter()
+                # part is stale until completely built
+                conn.execute("DELETE FROM meta WHERE part = ?", (part,))
+                conn.commit()
+                if callable(self.PARTS[part]):
+                    self.PARTS[part](conn, force)
+                else:
+                    for sql in self.PARTS[part]:
+                        conn.execute(sql)
+                conn.execute(
+                    "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?)",
+                    (part, fingerprint, self.VERSION, time.time()),
+                )
+                conn.commit()
+                built.append(part)
+                log.info(
+                    'cache part "%s" built in %.3f s',
+                    part,
+                    time.perf_counter() - start,
+                )
+        except sqlite3.DatabaseError as _e:
+            conn.rollback()
+            raise LRCacheException(f"Cache build failed: {_e}") from _e
+        finally:
+            conn.close()
+        # force check on next use
+        self._checked_fingerprint = None
+        return built
+
+    def attach(self, conn):
+        """
+        Attach cache to a catalog connection, as database CACHE_ALIAS
+        Return True if cache is attached
+        """
+        if any(
+            name == CACHE_ALIAS
+            for _, name, _ in conn.execute("PRAGMA database_list").fetchall()
+        ):
+            return True
+        if not os.path.exists(self.cache_file):
+            return False
+        try:
+            conn.execute(
+                f"ATTACH DATABASE ? AS {CACHE_ALIAS}",
+                (f"file:{self.cache_file}?mode=ro",),
+            )
+        except sqlite3.OperationalError as _e:
+            log.info('attach of cache "%s" failed : %s', self.cache_file, _e)
+            return False
+        return True
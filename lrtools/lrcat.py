@@ -8,12 +8,18 @@ Main class LRCatDB for Lightroom database manipulations
 import os
 import sqlite3
 import logging
+import threading
+import tempfile
+import time
+import atexit
 from datetime import datetime, timezone
 from dateutil import parser
 import tzlocal
 import pytz
 
 from .slpp import SLPP
+from .lrcache import LRCacheDB, LRCacheException, catalog_fingerprint
+from .lrkeyword import LRKeywordsModel
 
 log = logging.getLogger(__name__)
 
@@ -22,6 +28,13 @@ LIGHTROOM_EPOCH = datetime(2001, 1, 1, 0, 0, 0, tzinfo=timezone.utc)
 # unix timestamp for LR epoch (2001,1,1,0,0,0)
 TIMESTAMP_LR_EPOCH = 978307200
 
+# snapshot in a temporary file
+SNAPSHOT_TEMPFILE = "tempfile"
+# pages number copied by each step of snapshot
+SNAPSHOT_BATCH_PAGES = 4096
+# rows number fetched by each step of iterators on results
+FETCH_BATCH_ROWS = 500
+
 
 def date_to_lrstamp(config, mydate, localtz=True):
     """
@@ -42,6 +55,17 @@ def date_to_lrstamp(config, mydate, localtz=True):
     return ts if ts >= 0 else 0
 
 
+def iter_cursor(cursor, batch_size=FETCH_BATCH_ROWS):
+    """
+    Iterate on rows of an executed cursor, fetched by batches of batch_size rows
+    """
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield from rows
+
+
 def lr_strptime(lrdate):
     """
     Convert LR date string to datetime
@@ -83,23 +107,63 @@ class LRCatDB:
     The database is opened by default in read-only, with cache local and as immutable (needed by Lightroom >= version 8).
     So Lightroom can be opened while running python scripts using this module.
 
+    In pooled mode (pooled=True), each thread gets its own read-only connection, so requests
+    can run in parallel threads. Use new_cursor() for independent cursors on the same connection.
+
     """
 
     ALL_COLL = 1
     STND_COLL = 2
     SMART_COLL = 3
 
+    # keywords models shared in process by all instances : catalog real path -> LRKeywordsModel
+    _keywords_models = {}
+    _keywords_models_lock = threading.Lock()
+
     def __init__(
-        self, config, lrcat_file, open_options="mode=ro&cache=private&immutable=1"
+        self,
+        config,
+        lrcat_file,
+        open_options="mode=ro&cache=private&immutable=1",
+        pooled=False,
+        snapshot=None,
+        progress=None,
+        cache=None,
     ):
+        """
+        Open catalog
+        - config : LRToolConfig instance
+        - lrcat_file : Lightroom catalog filename
+        - open_options : sqlite URI parameters
+        - pooled : if True, each thread uses its own connection (and its own cursor and LRSelectPhoto).
+            Connections are opened on first use by a thread, and closed by method close()
+        - snapshot : if set, catalog is copied (sqlite backup API) and all requests are executed on the copy :
+            ":memory:" for a copy in memory, SNAPSHOT_TEMPFILE for a temporary file, or a filename
+        - progress : function called during snapshot copy with parameters (pages_copied, pages_total)
+        - cache : if set, use acceleration cache (see LRCacheDB) for some criteria :
+            True for the default cache file next to catalog, or a cache filename
+        """
         self.config = config
-        self.conn = self.cursor = self.lrdb_version = None
+        self.pooled = pooled
+        self._conn = self._cursor = self._lrphoto = self.lrdb_version = None
+        # pooled mode : per thread connection, cursor and LRSelectPhoto, and all connections opened
+        self._local = threading.local()
+        self._pool = []
+        self._pool_lock = threading.Lock()
+        # snapshot mode : connection keeping the shared memory database alive, temporary file to remove
+        self.snapshot = snapshot
+        self._snapshot_keeper = self._snapshot_tempfile = None
+        # acceleration cache, attached to connections on first use
+        self.cache = None
+        # readiness of cache parts by connection, checked again after each build_cache
+        self._cache_ready_parts = None
+        self._cache_generation = 0
 
         def open_db(uri):
+            conn = None
             try:
-                self.conn = sqlite3.connect(uri, uri="?" in uri)
-                self.cursor = self.conn.cursor()
-                (self.lrdb_version,) = self.cursor.execute(
+                conn = self._connect(uri)
+                (self.lrdb_version,) = conn.execute(
                     'SELECT value FROM Adobe_variablesTable WHERE name="Adobe_DBVersion"'
                 ).fetchone()
                 log.info(
@@ -108,9 +172,11 @@ class LRCatDB:
                     uri,
                 )
                 log.info("Adobe_DBVersion : %s", self.lrdb_version)
+                self._register_connection(conn)
                 return True, ""
             except (sqlite3.OperationalError, sqlite3.DatabaseError) as _e:
-                self.conn.close()
+                if conn:
+                    conn.close()
                 log.info('open "%s" failed : %s', self.lrcat_file, str(_e))
                 return False, "Not an Lightroom catalog"
 
@@ -118,13 +184,18 @@ class LRCatDB:
         if not os.path.exists(self.lrcat_file):
             raise LRCatException("LR catalog doesn't exist: %s" % (
                 self.lrcat_file))
+        if cache:
+            self.cache = LRCacheDB(
+                self.lrcat_file, cache if isinstance(cache, str) else None
+            )
         log.info(
             "sqlite3 binding version : %s , sqlite3 version : %s",
             sqlite3.version,
             sqlite3.sqlite_version,
         )
         modes = f"?{open_options if open_options else ''}"
-        done, reason = open_db(f"file:{self.lrcat_file}{modes}")
+        self.uri = f"file:{self.lrcat_file}{modes}"
+        done, reason = open_db(self.uri)
         if not done:
             if reason:
                 reason = f" reason: {reason}"
@@ -135,7 +206,231 @@ class LRCatDB:
                 reason,
             )
             raise LRCatException("Unable to open LR catalog")
-        self.lrphoto = LRSelectPhoto(config, self)
+        if self.snapshot:
+            self._open_snapshot(progress)
+        if not self.pooled:
+            self._lrphoto = LRSelectPhoto(config, self)
+
+    def _open_snapshot(self, progress=None):
+        """
+        Copy catalog by pages batches in snapshot database, and use the copy for all requests
+        """
+
+        def _progress(_status, remaining, total):
+            log.info("snapshot: %s/%s pages copied", total - remaining, total)
+            if progress:
+                progress(total - remaining, total)
+
+        if self.snapshot == ":memory:":
+            # pooled connections need a named memory database with shared cache
+            uri = (
+                f"file:lrtools_snapshot_{id(self)}?mode=memory&cache=shared"
+                if self.pooled
+                else ":memory:"
+            )
+        else:
+            if self.snapshot == SNAPSHOT_TEMPFILE:
+                fd, self._snapshot_tempfile = tempfile.mkstemp(
+                    prefix="lrtools_snapshot_", suffix=".lrcat"
+                )
+                os.close(fd)
+                atexit.register(self.close)
+                filename = self._snapshot_tempfile
+            else:
+                filename = self.snapshot
+            uri = f"file:{filename}"
+        start = time.perf_counter()
+        try:
+            dest = sqlite3.connect(uri, uri=True, check_same_thread=not self.pooled)
+            self.conn.backup(
+                dest, pages=SNAPSHOT_BATCH_PAGES, progress=_progress
+            )
+        except (sqlite3.OperationalError, sqlite3.DatabaseError) as _e:
+            raise LRCatException(f"Snapshot of LR catalog failed: {_e}") from _e
+        log.info(
+            'snapshot of "%s" in "%s" done in %.3f s',
+            self.lrcat_file,
+            self.snapshot,
+            time.perf_counter() - start,
+        )
+        # from now, use the snapshot
+        self._close_connections()
+        if uri == ":memory:":
+            self._register_connection(dest)
+            return
+        if self.pooled and "mode=memory" in uri:
+            self._snapshot_keeper = dest
+            self.uri = uri
+        else:
+            dest.close()
+            self.uri = f"{uri}?mode=ro&immutable=1"
+        self._register_connection(self._connect())
+
+    def _connect(self, uri=None):
+        """
+        Open a new connection to catalog
+        """
+        if uri is None:
+            uri = self.uri
+        # in pooled mode, connections can be closed by any thread (see close())
+        return sqlite3.connect(
+            uri, uri="?" in uri, check_same_thread=not self.pooled
+        )
+
+    def _register_connection(self, conn):
+        """
+        Set connection as the shared connection, or as the connection of current thread in pooled mode
+        """
+        if not self.pooled:
+            self._conn = conn
+            self._cursor = conn.cursor()
+            self._cache_ready_parts = None
+            return
+        self._local.conn = conn
+        self._local.cursor = conn.cursor()
+        self._local.cache_ready_parts = None
+        with self._pool_lock:
+            self._pool.append(conn)
+        log.info(
+            "pooled connection opened for thread %s",
+            threading.current_thread().name,
+        )
+
+    @property
+    def conn(self):
+        """
+        Connection to catalog : the shared one, or the one of current thread in pooled mode
+        """
+        if not self.pooled:
+            return self._conn
+        if getattr(self._local, "conn", None) is None:
+            self._register_connection(self._connect())
+        return self._local.conn
+
+    @property
+    def cursor(self):
+        """
+        Default cursor : the shared one, or the one of current thread in pooled mode
+        """
+        if not self.pooled:
+            return self._cursor
+        if getattr(self._local, "cursor", None) is None:
+            self._register_connection(self._connect())
+        return self._local.cursor
+
+    @property
+    def lrphoto(self):
+        """
+        LRSelectPhoto instance : the shared one, or the one of current thread in pooled mode
+        (LRSelectPhoto keeps state of the last request built)
+        """
+        if not self.pooled:
+            return self._lrphoto
+        if getattr(self._local, "lrphoto", None) is None:
+            self._local.lrphoto = LRSelectPhoto(self.config, self)
+        return self._local.lrphoto
+
+    def build_cache(self, parts=None, force=False):
+        """
+        Build or refresh parts of acceleration cache not up to date with catalog
+        - parts : list of parts names (see LRCacheDB.PARTS), or None for all parts
+        - force : build parts even if up to date
+        Return list of parts built
+        """
+        if not self.cache:
+            raise LRCatException("No cache defined for catalog")
+        try:
+            return self.cache.build(parts, force)
+        except LRCacheException as _e:
+            raise LRCatException(str(_e)) from _e
+        finally:
+            # readiness of parts checked again by all connections
+            self._cache_generation += 1
+
+    def cache_ready(self, part):
+        """
+        Return True if part of cache is up to date, and cache attached to connection (of current thread in pooled mode)
+        Readiness is checked once by part and connection (catalog is opened as immutable), and again after build_cache
+        """
+        if not self.cache:
+            return False
+        conn = self.conn
+        if self.pooled:
+            ready_parts = getattr(self._local, "cache_ready_parts", None)
+        else:
+            ready_parts = self._cache_ready_parts
+        if not ready_parts or ready_parts[0] != self._cache_generation:
+            ready_parts = (self._cache_generation, {})
+            if self.pooled:
+                self._local.cache_ready_parts = ready_parts
+            else:
+                self._cache_ready_parts = ready_parts
+        ready = ready_parts[1]
+        if part not in ready:
+            ready[part] = self.cache.is_fresh(part) and self.cache.attach(conn)
+        return ready[part]
+
+    def keywords_model(self):
+        """
+        Return keywords model of catalog (see LRKeywordsModel), shared by all LRKeywords instances in process.
+        A new empty model replaces the previous one when the catalog file changed (size or modification time).
+        """
+        fingerprint = catalog_fingerprint(self.lrcat_file)
+        key = os.path.realpath(self.lrcat_file)
+        with self._keywords_models_lock:
+            model = self._keywords_models.get(key)
+            if model is None or model.fingerprint != fingerprint:
+                model = LRKeywordsModel(fingerprint)
+                self._keywords_models[key] = model
+        return model
+
+    def new_cursor(self):
+        """
+        Return a new cursor, independent of the default cursor.
+        Results of a request executed on it are not clobbered by others requests.
+        In pooled mode, the cursor must be used by the calling thread only.
+        """
+        return self.conn.cursor()
+
+    def iter_sql(self, sql, params=(), batch_size=FETCH_BATCH_ROWS):
+        """
+        Execute SQL request on a new cursor, and return an iterator on rows fetched by batches of batch_size rows.
+        Rows are not all kept in memory, and the first rows are available as soon as sqlite returns them
+        """
+        cursor = self.new_cursor()
+        cursor.execute(sql, params)
+        return iter_cursor(cursor, batch_size)
+
+    def close(self):
+        """
+        Close connection(s) to catalog, and release snapshot
+        """
+        self._close_connections()
+        if self._snapshot_keeper:
+            self._snapshot_keeper.close()
+            self._snapshot_keeper = None
+        if self._snapshot_tempfile:
+            try:
+                os.remove(self._snapshot_tempfile)
+            except OSError:
+                pass
+            self._snapshot_tempfile = None
+
+    def _close_connections(self):
+        """
+        Close connection(s) to catalog
+        """
+        if not self.pooled:
+            if self._conn:
+                self._conn.close()
+            self._conn = self._cursor = None
+            return
+        with self._pool_lock:
+            for conn in self._pool:
+                conn.close()
+            self._pool = []
+        # connections of other threads are closed too : force reopen on next use
+        self._local = threading.local()
 
     def has_basename(self, name):
         """
@@ -234,6 +529,34 @@ class LRCatDB:
         except TypeError:
             return None
 
+    def get_smartcolls_data(self, collname=""):
+        """
+        Return smart collections lua requests in python structures, loaded by a single request
+          collname : partial (including a %) or complete name of collection, or empty for all collections
+        Return list of (id_local, name, structure), ordered by name. structure is None if lua request is invalid
+        """
+        where = ""
+        params = ()
+        if collname:
+            oper = "LIKE" if "%" in collname else "="
+            where = f" AND col.name {oper} ? COLLATE NOCASE"
+            params = (collname,)
+        rows = self.new_cursor().execute(
+            "SELECT col.id_local, col.name, cont.content FROM AgLibraryCollectionContent cont"
+            " JOIN AgLibraryCollection col ON col.id_local = cont.collection"
+            f' WHERE cont.owningModule = "ag.library.smart_collection"{where} ORDER BY col.name ASC',
+            params,
+        )
+        lua = SLPP()
+        smarts = []
+        for id_local, name, content in rows:
+            try:
+                data = lua.decode(content[4:])
+            except (TypeError, ValueError, IndexError):
+                data = None
+            smarts.append((id_local, name, data))
+        return smarts
+
     def select_count_by_date(self, mode, date_start, date_end=None, **kwargs):
         """
         Returns photos number by year or month
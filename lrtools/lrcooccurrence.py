@@ -0,0 +1,154 @@
+# # -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+
+"""
+LRCooccurrence class for keywords appearing together on photos
+
+Counts of photos by pair of keywords are stored as a sparse symmetric matrix, in compressed rows (CSR) arrays :
+rows and columns are positions of keywords in LRKeywordsModel. The matrix can be converted to a scipy sparse matrix
+if scipy is installed.
+"""
+
+import csv
+from array import array
+from heapq import nlargest
+from itertools import accumulate
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
+
+class LRCooccurrence:
+    """
+    Co-occurrence of keywords : count of photos by pair of keywords
+    """
+
+    def __init__(self, lrkeywords, include_persons=True):
+        """
+        Init
+        - lrkeywords : LRKeywords instance
+        - include_persons : (bool) include keywordType="person"
+        """
+        self.lrkeywords = lrkeywords
+        self.include_persons = include_persons
+        # keyword ids by position
+        self.ids = None
+        # compressed rows : columns and counts of row r are indices[indptr[r]:indptr[r+1]] and counts[...]
+        self.indptr = None
+        self.indices = None
+        self.counts = None
+
+    def build(self, **kwargs):
+        """
+        Count photos by pair of keywords, in a single request
+        kwargs :
+            - batch_size : number of rows fetched by batch (see LRCatDB.iter_sql)
+        Return self
+        """
+        lrk = self.lrkeywords
+        self.ids = lrk.hierarchy_model().ids
+        size = len(self.ids)
+        positions = {idkey: pos for pos, idkey in enumerate(self.ids)}
+        excluded = ""
+        if not self.include_persons:
+            excluded = " AND {0}.tag NOT IN (SELECT id_local FROM AgLibraryKeyword WHERE keywordType=\"person\")"
+            excluded = excluded.format("a") + excluded.format("b")
+
+        # pairs of keywords counted by sqlite : links scanned in table order, joined to links of the same photo
+        # (index on image), and rows sorted by keywords, so matrix is filled row by row
+        rows = lrk.lrdb.iter_sql(
+            "SELECT a.tag, b.tag, COUNT(*) FROM AgLibraryKeywordImage a NOT INDEXED"
+            " CROSS JOIN AgLibraryKeywordImage b ON a.image = b.image AND a.tag != b.tag"
+            f"{excluded} GROUP BY a.tag, b.tag ORDER BY a.tag, b.tag",
+            **kwargs,
+        )
+        self.indptr = array("q", [0]) * (size + 1)
+        self.indices = array("l")
+        self.counts = array("q")
+        for idkey1, idkey2, count in rows:
+            if idkey1 not in positions or idkey2 not in positions:
+                # link to unknown keyword
+                continue
+            self.indptr[positions[idkey1] + 1] += 1
+            self.indices.append(positions[idkey2])
+            self.counts.append(count)
+        self.indptr = array("q", accumulate(self.indptr))
+        return self
+
+    def _row(self, idkey):
+        """
+        Return columns and counts of keyword idkey row
+        """
+        if self.indptr is None:
+            self.build()
+        pos = self.lrkeywords.model.position(idkey)
+        beg, end = self.indptr[pos], self.indptr[pos + 1]
+        return self.indices[beg:end], self.counts[beg:end]
+
+    def count(self, idkey1, idkey2):
+        """
+        Return count of photos with both keywords idkey1 and idkey2
+        """
+        indices, counts = self._row(idkey1)
+        pos = self.lrkeywords.model.position(idkey2)
+        for index, count in zip(indices, counts):
+            if index == pos:
+                return count
+        return 0
+
+    def related(self, idkey, top=10):
+        """
+        Return list of (keyword_id, count of photos) of the top keywords appearing with keyword idkey, by descending count
+        """
+        indices, counts = self._row(idkey)
+        best = nlargest(top, zip(counts, indices), key=lambda item: (item[0], -item[1]))
+        return [(self.ids[index], count) for count, index in best]
+
+    def items(self):
+        """
+        Iterate on pairs of keywords, as tuples (keyword_id1, keyword_id2, count of photos) with keyword_id1 < keyword_id2
+        """
+        if self.indptr is None:
+            self.build()
+        for pos in range(len(self.ids)):
+            for i in range(self.indptr[pos], self.indptr[pos + 1]):
+                if self.indices[i] > pos:
+                    yield self.ids[pos], self.ids[self.indices[i]], self.counts[i]
+
+    def export(self, filename, min_count=1):
+        """
+        Export pairs of keywords in CSV file : hierarchical keywords names and count of photos
+        Return number of pairs exported
+        """
+        lrk = self.lrkeywords
+        exported = 0
+        with open(filename, "w", encoding="utf-8", newline="") as fcsv:
+            writer = csv.writer(fcsv)
+            writer.writerow(["keyword1", "keyword2", "photos"])
+            for idkey1, idkey2, count in self.items():
+                if count < min_count:
+                    continue
+                writer.writerow(
+                    [
+                        lrk.get_hierarchical_name(idkey1),
+                        lrk.get_hierarchical_name(idkey2),
+                        count,
+                    ]
+                )
+                exported += 1
+        return exported
+
+    def to_sparse(self):
+        """
+        Return matrix as scipy.sparse.csr_matrix. Rows and columns are keywords positions, see attribute ids
+        """
+        if sparse is None:
+            raise ImportError("scipy is required for sparse matrix")
+        if self.indptr is None:
+            self.build()
+        size = len(self.ids)
+        return sparse.csr_matrix(
+            (self.counts, self.indices, self.indptr), shape=(size, size)
+        )
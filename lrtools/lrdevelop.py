@@ -0,0 +1,213 @@
+# # -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+
+"""
+Develop settings of photos for the acceleration cache (see LRCacheDB, part "develop")
+
+Develop settings are stored by Lightroom as Lua text (Adobe_imageDevelopSettings.text). A selection of them is decoded
+once, by worker processes, and kept in cache table develop : one row by photo and setting, indexed by setting and value.
+Table develop_images keeps touchTime of photos decoded : a refresh decodes only photos new or touched since.
+"""
+
+import os
+import sqlite3
+import logging
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from .slpp import SLPP
+
+log = logging.getLogger(__name__)
+
+# settings kept in cache (numbers, strings or booleans)
+DEVELOP_SETTINGS = (
+    "ProcessVersion",
+    "CameraProfile",
+    "WhiteBalance",
+    "Temperature",
+    "Tint",
+    "Exposure2012",
+    "Contrast2012",
+    "Highlights2012",
+    "Shadows2012",
+    "Whites2012",
+    "Blacks2012",
+    "Texture",
+    "Clarity2012",
+    "Dehaze",
+    "Vibrance",
+    "Saturation",
+    "Sharpness",
+    "LuminanceSmoothing",
+    "ColorNoiseReduction",
+    "PostCropVignetteAmount",
+    "GrainAmount",
+    "ConvertToGrayscale",
+    "LensProfileEnable",
+    "AutoLateralCA",
+    "HasCrop",
+    "CropAngle",
+)
+
+# settings derived from others, stored as 0 or 1
+DERIVED_SETTINGS = {
+    "hasLensProfile": lambda settings: settings.get("LensProfileEnable") == 1,
+    "hasRetouch": lambda settings: bool(settings.get("RetouchInfo")),
+    "hasLocalAdjustments": lambda settings: any(
+        settings.get(name)
+        for name in (
+            "PaintBasedCorrections",
+            "GradientBasedCorrections",
+            "CircularGradientBasedCorrections",
+            "MaskGroupBasedCorrections",
+        )
+    ),
+}
+
+# all settings names of cache
+DEVELOP_NAMES = DEVELOP_SETTINGS + tuple(DERIVED_SETTINGS)
+
+# number of photos decoded by a worker process task
+BATCH_SIZE = 500
+# number of batches in flight by worker process
+MAX_PENDING_BATCHES = 2
+
+SCHEMA = [
+    "DROP TABLE IF EXISTS develop",
+    "DROP TABLE IF EXISTS develop_images",
+    "DROP TABLE IF EXISTS develop_settings",
+    "CREATE TABLE develop (image INTEGER, setting TEXT COLLATE NOCASE, value NUMERIC, PRIMARY KEY (image, setting)) WITHOUT ROWID",
+    "CREATE TABLE develop_images (image INTEGER PRIMARY KEY, touchTime REAL)",
+    "CREATE TABLE develop_settings (setting TEXT PRIMARY KEY)",
+]
+# index for criteria, created after build for speed
+SCHEMA_INDEXES = [
+    "CREATE INDEX IF NOT EXISTS develop_setting_value ON develop(setting, value)",
+]
+
+
+def decode_settings(text):
+    """
+    Return list of (setting, value) of Lua text of develop settings, for settings kept in cache
+    """
+    if not text or "{" not in text:
+        return []
+    settings = SLPP().decode(text[text.find("{") :])
+    if not isinstance(settings, dict):
+        return []
+    rows = []
+    for name in DEVELOP_SETTINGS:
+        value = settings.get(name)
+        if isinstance(value, bool):
+            value = int(value)
+        if isinstance(value, (int, float, str)):
+            rows.append((name, value))
+    for name, func in DERIVED_SETTINGS.items():
+        rows.append((name, int(func(settings))))
+    return rows
+
+
+def _decode_batch(rows):
+    """
+    Decode develop settings of list of (image, text), in worker process
+    Return list of (image, setting, value)
+    """
+    return [
+        (image, name, value)
+        for image, text in rows
+        for name, value in decode_settings(text)
+    ]
+
+
+def build_develop(conn, force=False, jobs=None):
+    """
+    Build or refresh cache tables of develop settings, in current transaction
+    - conn : connection to cache, with catalog attached as "lrcat"
+    - force : decode settings of all photos, instead of photos new or touched since last build
+    - jobs : number of worker processes decoding settings. Default is number of CPUs
+    Return number of photos decoded
+    """
+    start = time.perf_counter()
+    try:
+        kept = {
+            name for name, in conn.execute("SELECT setting FROM develop_settings")
+        }
+    except sqlite3.OperationalError:
+        kept = None
+    if force or kept != set(DEVELOP_NAMES):
+        # first build, or settings kept changed
+        for sql in SCHEMA:
+            conn.execute(sql)
+        conn.executemany(
+            "INSERT INTO develop_settings VALUES (?)",
+            ((name,) for name in DEVELOP_NAMES),
+        )
+
+    touched = dict(
+        conn.execute("SELECT id_local, touchTime FROM lrcat.Adobe_images")
+    )
+    indexed = dict(conn.execute("SELECT image, touchTime FROM develop_images"))
+    deleted = [image for image in indexed if image not in touched]
+    images = [
+        image for image, touch in touched.items() if indexed.get(image) != touch
+    ]
+    conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS develop_changed (image INTEGER PRIMARY KEY)"
+    )
+    conn.execute("DELETE FROM temp.develop_changed")
+    conn.executemany(
+        "INSERT INTO temp.develop_changed VALUES (?)",
+        ((image,) for image in deleted + images),
+    )
+    conn.execute(
+        "DELETE FROM develop WHERE image IN (SELECT image FROM temp.develop_changed)"
+    )
+    conn.execute(
+        "DELETE FROM develop_images WHERE image IN (SELECT image FROM temp.develop_changed)"
+    )
+
+    # texts are decoded by batches, in worker processes when there are enough batches
+    cursor = conn.execute(
+        "SELECT ids.image, ids.text FROM lrcat.Adobe_imageDevelopSettings ids"
+        " JOIN temp.develop_changed c ON c.image = ids.image"
+        " JOIN lrcat.Adobe_images i ON i.id_local = ids.image"
+    )
+    batches = iter(lambda: cursor.fetchmany(BATCH_SIZE), [])
+    jobs = jobs or os.cpu_count() or 1
+    if jobs > 1 and len(images) > BATCH_SIZE:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            # tasks in flight are bounded, so texts are fetched as batches are decoded (executor.map would submit
+            # all batches at once), and results are inserted in order
+            pending = deque()
+            for batch in batches:
+                pending.append(executor.submit(_decode_batch, batch))
+                if len(pending) >= MAX_PENDING_BATCHES * jobs:
+                    conn.executemany(
+                        "INSERT OR REPLACE INTO develop VALUES (?, ?, ?)",
+                        pending.popleft().result(),
+                    )
+            while pending:
+                conn.executemany(
+                    "INSERT OR REPLACE INTO develop VALUES (?, ?, ?)",
+                    pending.popleft().result(),
+                )
+    else:
+        for rows in map(_decode_batch, batches):
+            conn.executemany(
+                "INSERT OR REPLACE INTO develop VALUES (?, ?, ?)", rows
+            )
+
+    conn.executemany(
+        "INSERT OR REPLACE INTO develop_images VALUES (?, ?)",
+        ((image, touched[image]) for image in images),
+    )
+    for sql in SCHEMA_INDEXES:
+        conn.execute(sql)
+    log.info(
+        "develop settings of %s photos decoded in %.3f s (%s deleted)",
+        len(images),
+        time.perf_counter() - start,
+        len(deleted),
+    )
+    return len(images)
@@ -2,120 +2,294 @@
 # pylint: disable=line-too-long
 
 """
-LRKeywords class for Lightroom keywords manipulation
+LRKeywords class for Lightroom keywords manipulation, and LRKeywordsModel for keywords loaded in memory
 """
 
+import sys
+import sqlite3
+from array import array
+from bisect import bisect_left
+from functools import lru_cache
+from collections import Counter
+from itertools import groupby
+from operator import itemgetter
+
+# number of hierarchical names kept by LRKeywordsModel
+HNAME_CACHE_SIZE = 4096
+
+
+class LRKeywordsModel:
+    """
+    Keywords of a catalog loaded in memory, shared by all LRKeywords instances on the catalog (see LRCatDB.keywords_model)
+    Each part is loaded on first use, by a single request.
+
+    Hierarchy is stored by position of keywords (sorted by id) in integer arrays : position of parent,
+    of first child and of next sibling (-1 if none). Hierarchical names are built on demand.
+    """
+
+    def __init__(self, fingerprint=None):
+        """
+        Init
+        - fingerprint : fingerprint of catalog file when model was created
+        """
+        self.fingerprint = fingerprint
+        # hierarchy : keyword ids sorted, and by position : name, parent, first child and next sibling positions
+        self.ids = None
+        self.names = None
+        self.parents = None
+        self.first_child = None
+        self.next_sibling = None
+        # position of root keyword (the keyword without parent)
+        self.rootpos = -1
+        # dict keyword_id -> list of descendants keyword_id, computed on demand
+        self.descendants_cache = {}
+        # sorted lists of (token, keyword_id) from keyword names and synonyms, and same with reversed tokens
+        self.tokens = None
+        self.reversed_tokens = None
+        self.hierarchical_name = lru_cache(maxsize=HNAME_CACHE_SIZE)(
+            self._hierarchical_name
+        )
+
+    def load_hierarchy(self, cursor):
+        """
+        Load keywords hierarchy
+        """
+        rows = cursor.execute(
+            "SELECT id_local, name, parent FROM AgLibraryKeyword ORDER BY id_local"
+        ).fetchall()
+        ids = array("q", (pid for pid, _, _ in rows))
+        positions = {pid: pos for pos, pid in enumerate(ids)}
+        names = []
+        parents = array("l", [-1]) * len(rows)
+        first_child = array("l", [-1]) * len(rows)
+        next_sibling = array("l", [-1]) * len(rows)
+        for pos, (_, name, parent) in enumerate(rows):
+            names.append(sys.intern(name) if name else "")
+            if not parent:
+                self.rootpos = pos
+            else:
+                parents[pos] = positions.get(parent, -1)
+        # children linked in reverse order, so siblings are sorted by id
+        for pos in range(len(rows) - 1, -1, -1):
+            parent = parents[pos]
+            if parent >= 0:
+                next_sibling[pos] = first_child[parent]
+                first_child[parent] = pos
+        self.names = names
+        self.parents = parents
+        self.first_child = first_child
+        self.next_sibling = next_sibling
+        self.hierarchical_name.cache_clear()
+        self.ids = ids
+
+    def position(self, idkey):
+        """
+        Return position of keyword idkey in hierarchy arrays, KeyError if not found
+        """
+        pos = bisect_left(self.ids, idkey)
+        if pos == len(self.ids) or self.ids[pos] != idkey:
+            raise KeyError(idkey)
+        return pos
+
+    def iter_subtree(self, pos):
+        """
+        Iterate on keywords positions under keyword at position pos (depth-first order), as tuples (position, depth)
+        """
+        stack = []
+        node = self.first_child[pos]
+        while node != -1:
+            yield node, len(stack)
+            if self.first_child[node] != -1:
+                stack.append(self.next_sibling[node])
+                node = self.first_child[node]
+                continue
+            node = self.next_sibling[node]
+            while node == -1 and stack:
+                node = stack.pop()
+
+    def _hierarchical_name(self, idkey):
+        """
+        Build hierarchical name of keyword idkey, KeyError if not under root keyword
+        """
+        pos = self.position(idkey)
+        parts = []
+        while pos != self.rootpos:
+            if pos == -1:
+                raise KeyError(idkey)
+            parts.append(self.names[pos])
+            pos = self.parents[pos]
+        if not parts:
+            raise KeyError(idkey)
+        return "|".join(reversed(parts))
+
+    def load_tokens(self, cursor):
+        """
+        Load tokens index of keywords : words of keyword names and synonyms
+        """
+        pairs = set()
+        for idkey, lc_name in cursor.execute(
+            "SELECT id_local, lc_name FROM AgLibraryKeyword"
+        ).fetchall():
+            for word in (lc_name or "").split():
+                pairs.add((word, idkey))
+        try:
+            synonyms = cursor.execute(
+                "SELECT keyword, lc_name FROM AgLibraryKeywordSynonym"
+            ).fetchall()
+        except sqlite3.OperationalError:
+            # no synonyms table
+            synonyms = []
+        for idkey, lc_name in synonyms:
+            for word in (lc_name or "").lower().split():
+                pairs.add((word, idkey))
+        self.reversed_tokens = sorted((word[::-1], idkey) for word, idkey in pairs)
+        self.tokens = sorted(pairs)
+
 
 class LRKeywords:
     """
     Keywords manipulation
     """
 
-    def __init__(self, lrdb):
+    def __init__(self, lrdb, recursive_cte=False):
         """
         Init
         - lrdb : LRCatDB instance
+        - recursive_cte : find sub keywords by a recursive SQL request, instead of the in-memory children index
         """
         self.lrdb = lrdb
-        self.tree = None
-        self.rootid = None
-        self.id2keyname = None
-        self.hierachical_keywords = None
-        self.hkeyname2id = None
+        self.recursive_cte = recursive_cte
+        # keywords loaded once by process for the catalog
+        self.model = lrdb.keywords_model()
 
-    def _init_hierarchical_keywords(self):
+    def token_indexes(self, key_part, operation):
         """
-        Initialize and build  hierarchical keywords
+        Return sorted keyword indexes with a word (in name or synonyms) matching key_part
+        - key_part : (str) lowercase word or part of word
+        - operation : "words" (complete word), "beginsWith" (word begins with key_part) or "endsWith" (word ends with key_part)
         """
-        self.lrdb.cursor.execute(
-            "SELECT id_local, name, parent FROM AgLibraryKeyword"
-        )
-        self.tree = {}
-        self.id2keyname = {}
-        for pid, name, parent in self.lrdb.cursor.fetchall():
-            if not name:
-                name = ""
-            self.id2keyname[pid] = name
-            if not parent:
-                self.rootid = pid
-                parent = ""
-            if parent not in self.tree:
-                self.tree[parent] = []
-            self.tree[parent].append(pid)
-
-        # dict keyword_id -> hierarchical name
-        self.hierachical_keywords = self._build_hierachical_keywords()
-        # dict hierarchical name -> keyword_id
-        self.hkeyname2id = {v: k for k, v in self.hierachical_keywords.items()}
+        if self.model.tokens is None:
+            self.model.load_tokens(self.lrdb.cursor)
+        if operation == "endsWith":
+            tokens = self.model.reversed_tokens
+            key_part = key_part[::-1]
+        else:
+            tokens = self.model.tokens
+        indexes = set()
+        pos = bisect_left(tokens, (key_part,))
+        while pos < len(tokens):
+            word, idkey = tokens[pos]
+            if operation == "words":
+                if word != key_part:
+                    break
+            elif not word.startswith(key_part):
+                break
+            indexes.add(idkey)
+            pos += 1
+        return sorted(indexes)
 
-    def _showtree(self, pid, level):
+    def descendants(self, idkey):
         """
-        Display keywords in hierachical format
+        Return list of keyword indexes hierachically under keyword idkey (depth-first order)
         """
-        if not self.tree:
+        descendants_cache = self.model.descendants_cache
+        if idkey in descendants_cache:
+            return descendants_cache[idkey]
+        if self.recursive_cte:
+            indexes = [
+                index
+                for (index,) in self.lrdb.cursor.execute(
+                    "WITH RECURSIVE sub(id) AS ("
+                    " SELECT id_local FROM AgLibraryKeyword WHERE parent = ?"
+                    " UNION ALL SELECT k.id_local FROM AgLibraryKeyword k JOIN sub ON k.parent = sub.id)"
+                    " SELECT id FROM sub",
+                    (idkey,),
+                ).fetchall()
+            ]
+        else:
             self._init_hierarchical_keywords()
-        if not pid:
-            pid = self.rootid
-        for k in self.tree[pid]:
-            print(level * " ", self.id2keyname[k])
-            if k in self.tree:
-                self._showtree(k, level + 2)
+            model = self.model
+            try:
+                indexes = [
+                    model.ids[pos]
+                    for pos, _ in model.iter_subtree(model.position(idkey))
+                ]
+            except KeyError:
+                indexes = []
+        descendants_cache[idkey] = indexes
+        return indexes
 
-    def show_hierarchical_indented(self):
+    def _init_hierarchical_keywords(self):
         """
-        Display keywords in hierachical indented format
+        Initialize keywords hierarchy, if not already loaded
         """
-        self._showtree(self.rootid, 0)
+        if self.model.ids is None:
+            self.model.load_hierarchy(self.lrdb.cursor)
 
-    def _build_hierachical_keywords(self):
+    def hierarchy_model(self):
         """
-        Build list of keywords in hierachical form
+        Return keywords model (see LRKeywordsModel), with keywords hierarchy loaded
         """
+        self._init_hierarchical_keywords()
+        return self.model
 
-        def _build(pid, hname, hkeys):
-            hname_next = hname
-            if hname:
-                hname_next += "|"
-            for k in self.tree[pid]:
-                if k in self.tree:
-                    _build(k, f"{hname_next}{self.id2keyname[k]}", hkeys)
-                hkeys[k] = f"{hname_next}{self.id2keyname[k]}"
-
-        if not self.tree:
-            self._init_hierarchical_keywords()
-        hkeywords = {}
-        _build(self.rootid, "", hkeywords)
-        return hkeywords
+    def show_hierarchical_indented(self):
+        """
+        Display keywords in hierachical indented format
+        """
+        self._init_hierarchical_keywords()
+        model = self.model
+        if model.rootpos < 0:
+            return
+        for pos, depth in model.iter_subtree(model.rootpos):
+            print(2 * depth * " ", model.names[pos])
 
     def get_hierarchical_list(self):
         """
         Return hierarchical list sorted by keywords
         """
-        if not self.hierachical_keywords:
-            self._init_hierarchical_keywords()
-        return sorted(self.hierachical_keywords.values())
+        self._init_hierarchical_keywords()
+        model = self.model
+        if model.rootpos < 0:
+            return []
+        hkeys = []
+        path = []
+        for pos, depth in model.iter_subtree(model.rootpos):
+            del path[depth:]
+            path.append(model.names[pos])
+            hkeys.append("|".join(path))
+        return sorted(hkeys)
 
     def get_hierarchical_name(self, idkey):
         """
         Return hierarchical name of key index
         """
-        if not self.hierachical_keywords:
-            self._init_hierarchical_keywords()
-        return self.hierachical_keywords[idkey]
+        self._init_hierarchical_keywords()
+        return self.model.hierarchical_name(idkey)
 
     def get_name(self, idkey):
         """
         Return name of key index
         """
-        if not self.hierachical_keywords:
-            self._init_hierarchical_keywords()
-        return self.hierachical_keywords[idkey].split("|")[-1]
+        self._init_hierarchical_keywords()
+        return self.model.names[self.model.position(idkey)]
 
     def get_id(self, hkname):
         """
         Return key id from hiecharchical key name
         """
-        return self.hkeyname2id[hkname]
+        self._init_hierarchical_keywords()
+        model = self.model
+        pos = model.rootpos
+        for name in hkname.split("|"):
+            if pos < 0:
+                raise KeyError(hkname)
+            pos = model.first_child[pos]
+            while pos != -1 and model.names[pos] != name:
+                pos = model.next_sibling[pos]
+        if pos < 0:
+            raise KeyError(hkname)
+        return model.ids[pos]
 
     def all_persons(self):
         """Select all persons keywords"""
@@ -138,14 +312,15 @@ class LRKeywords:
         hkeynames = []
         if include_persons:
             self.lrdb.cursor.execute(
-                f"SELECT tag FROM AgLibraryKeywordImage WHERE image={idphoto}"
+                "SELECT tag FROM AgLibraryKeywordImage WHERE image=?", (idphoto,)
             )
             for (idkey,) in self.lrdb.cursor.fetchall():
                 hkeynames.append(self.get_hierarchical_name(idkey))
                 keynames.append(self.get_name(idkey))
         else:
             self.lrdb.cursor.execute(
-                f"SELECT tag, name, keywordType FROM AgLibraryKeywordImage ki JOIN AgLibraryKeyword k ON ki.tag = k.id_local WHERE image={idphoto}"
+                "SELECT tag, name, keywordType FROM AgLibraryKeywordImage ki JOIN AgLibraryKeyword k ON ki.tag = k.id_local WHERE image=?",
+                (idphoto,),
             )
             for idkey, name, ktype in self.lrdb.cursor.fetchall():
                 if ktype == "person":
@@ -154,55 +329,112 @@ class LRKeywords:
                 keynames.append(name)
         return hkeynames, keynames
 
+    def photos_keys(self, images, include_persons=True, **kwargs):
+        """
+        Get keywords of many photos, from a single request
+
+        Parameters:
+            images : iterable of (int) local_id from table Adobe_Image,
+                or (str) SQL request returning local_id in first column (ex: from LRSelectPhoto.select_generic with kwarg sql=True)
+            include_persons : (bool) include keywordType="person" if True
+            kwargs :
+                - batch_size : number of rows fetched by batch (see LRCatDB.iter_sql)
+        Return :
+            iterator on tuples (idphoto, list_hierarchical_keywords, list_keywords), in order of images
+        """
+        if isinstance(images, str):
+            images = [idphoto for (idphoto,) in self.lrdb.iter_sql(images)]
+        # images ids loaded in temporary table (see LRSelectGeneric.load_values), joined to keywords
+        self.lrdb.lrphoto.load_values(images, func=int)
+        rows = self.lrdb.iter_sql(
+            "SELECT v.pos, v.value, ki.tag FROM temp.select_values v"
+            " LEFT JOIN AgLibraryKeywordImage ki ON ki.image = v.value"
+            " ORDER BY v.pos, ki.id_local",
+            **kwargs,
+        )
+        excluded = set()
+        if not include_persons:
+            excluded = {
+                idkey
+                for (idkey,) in self.lrdb.new_cursor().execute(
+                    'SELECT id_local FROM AgLibraryKeyword WHERE keywordType="person"'
+                )
+            }
+        # keyword_id -> (hierarchical name, name), for keywords already seen
+        names = {}
+        current = None
+        for pos, idphoto, idkey in rows:
+            if pos != current:
+                if current is not None:
+                    yield current_photo, hkeynames, keynames
+                current, current_photo = pos, idphoto
+                keynames = []
+                hkeynames = []
+            if idkey is None or idkey in excluded:
+                continue
+            if idkey not in names:
+                names[idkey] = (self.get_hierarchical_name(idkey), self.get_name(idkey))
+            hkeyname, keyname = names[idkey]
+            hkeynames.append(hkeyname)
+            keynames.append(keyname)
+        if current is not None:
+            yield current_photo, hkeynames, keynames
+
+    def usage_counts(self):
+        """
+        Count photos by keyword, and photos by keyword including keywords under it in hierarchy
+
+        Counts by keyword are computed by a single request grouped by keyword. Counts in hierarchy are computed
+        in one pass on keywords links ordered by photo : each photo is counted once for the union of its keywords
+        and their parents, so a photo with several keywords under the same parent is counted once for it.
+
+        Return :
+            dict keyword_id -> (count of photos with keyword, count of photos with keyword or a keyword under it)
+        """
+        self._init_hierarchical_keywords()
+        model = self.model
+        # keyword_id -> tuple of keyword_id and ids of its parents, built from parents (depth first order)
+        lineages = {}
+        for root in range(len(model.ids)):
+            if model.parents[root] != -1:
+                continue
+            lineages[model.ids[root]] = (model.ids[root],)
+            for pos, _ in model.iter_subtree(root):
+                lineages[model.ids[pos]] = (model.ids[pos],) + lineages[
+                    model.ids[model.parents[pos]]
+                ]
+
+        direct = dict(
+            self.lrdb.new_cursor().execute(
+                "SELECT tag, COUNT(*) FROM AgLibraryKeywordImage GROUP BY tag"
+            )
+        )
+        totals = Counter()
+        rows = self.lrdb.iter_sql(
+            "SELECT image, tag FROM AgLibraryKeywordImage ORDER BY image"
+        )
+        for _, links in groupby(rows, itemgetter(0)):
+            totals.update(set().union(*[lineages.get(tag, ()) for _, tag in links]))
+        return {
+            idkey: (direct.get(idkey, 0), totals.get(idkey, 0))
+            for idkey in model.ids
+        }
+
     def hierachical_indexes(self, key_part, operation):
         """
         Find keywords containing key_part, and returns all keyword indexes hierachically under these keywords
         - key_part : (str) keyword or part of keyword without joker '%'
         - operation : operation of smart function. Can be: all, any, noneOf, words, beginsWith, endsWith
-            * words : find complete word in keywords (ex: key_part="sport", returns "sport", "professional sport" , but not "sporting", "transport")
-            * beginsWith : complete word in each keyword begins with key_part
-            * endsWith : complete word in each keyword ends with key_part
+            * words : find complete word in keywords or synonyms (ex: key_part="sport", returns "sport", "professional sport" , but not "sporting", "transport")
+            * beginsWith : complete word in each keyword or synonym begins with key_part
+            * endsWith : complete word in each keyword or synonym ends with key_part
             * all, any, noneOf : find all occurences of key_part in keywords
         """
         key_part = key_part.lower()
         key = f'"%{key_part}%"'
 
-        def find_sub_indexes(index, indexes):
-            self.lrdb.cursor.execute(
-                f"SELECT id_local FROM AgLibraryKeyword WHERE parent = {index}"
-            )
-            sub_indexes = self.lrdb.cursor.fetchall()
-            for (sub_index,) in sub_indexes:
-                indexes.append(int(sub_index))
-                find_sub_indexes(int(sub_index), indexes)
-
-        if operation == "words":
-            self.lrdb.cursor.execute(
-                f"SELECT id_local, lc_name FROM AgLibraryKeyword WHERE lc_name LIKE {key}"
-            )
-            rows = []
-            for row in self.lrdb.cursor.fetchall():
-                # check if complete word in keyword
-                if key_part.lower() in row[1].split():
-                    rows.append((row[0],))
-        elif operation == "endsWith":
-            self.lrdb.cursor.execute(
-                f"SELECT id_local, lc_name FROM AgLibraryKeyword WHERE lc_name LIKE {key}"
-            )
-            rows = []
-            for row in self.lrdb.cursor.fetchall():
-                for word in row[1].split():
-                    if word.endswith(key_part):
-                        rows.append((row[0],))
-        elif operation == "beginsWith":
-            self.lrdb.cursor.execute(
-                f"SELECT id_local, lc_name FROM AgLibraryKeyword WHERE lc_name LIKE {key}"
-            )
-            rows = []
-            for row in self.lrdb.cursor.fetchall():
-                for word in row[1].split():
-                    if word.startswith(key_part):
-                        rows.append((row[0],))
+        if operation in ("words", "beginsWith", "endsWith"):
+            rows = [(index,) for index in self.token_indexes(key_part, operation)]
         else:
             rows = self.lrdb.cursor.execute(
                 f"SELECT id_local FROM AgLibraryKeyword WHERE lc_name LIKE {key}"
@@ -213,5 +445,5 @@ class LRKeywords:
         for row in rows:
             (key_part,) = row
             indexes += [key_part]
-            find_sub_indexes(key_part, indexes)
+            indexes += self.descendants(key_part)
         return indexes
@@ -16,6 +16,7 @@ class LRSelectCollection(LRSelectGeneric):
     """
 
     MAIN_TABLE = "AgLibraryCollection col"
+    KEY_COLUMN = "col.id_local"
 
     def __init__(self, config, lrdb):
         """ """
@@ -70,6 +71,10 @@ class LRSelectCollection(LRSelectGeneric):
                 ],
             },
         )
+        self.values_description = {
+            "id": ["", "col.id_local = v.value", int],
+            "name": ["", "col.name = v.value"],
+        }
 
     def func_type(self, value):
         """convert value for "type" criteria (creationId)"""
@@ -100,6 +105,12 @@ class LRSelectCollection(LRSelectGeneric):
         kwargs :
             - print : print sql and return None
             - sql : return SQL string only
+            - cursor : cursor used for execute request (see LRCatDB.new_cursor), instead of default cursor
+            - count : request only the count of results
+            - limit : (int) max number of results
+            - page_size : (int) number of rows by page, the request returns then a tuple (rows, next_token)
+            - page_token : token returned by previous page, None for first page
+            - values : key of values ("id" or "name"), see select_by_values
         """
 
         if not columns:
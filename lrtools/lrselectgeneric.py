@@ -8,11 +8,14 @@ Base class for building simple SQL select from a table
 """
 
 import re
+import json
+import base64
+import zlib
 import logging
 from datetime import datetime
 from dateutil import parser
 
-from .lrcat import date_to_lrstamp
+from .lrcat import date_to_lrstamp, iter_cursor, FETCH_BATCH_ROWS
 from .criterlexer import CriterLexer
 
 
@@ -20,6 +23,10 @@ class LRSelectException(Exception):
     """LRSelect Exception"""
 
 
+# temporary table of values list (see LRSelectGeneric.load_values)
+VALUES_TABLE = "select_values"
+
+
 # sqlite date modifiers accordigf parts of date string
 STARTS_OF_DATE = {
     1: "start of year",
@@ -51,6 +58,31 @@ def to_bool(value):
     raise LRSelectException("Invalid bool value")
 
 
+def sql_literal(value):
+    """convert python value (None, number, string) to SQL literal"""
+    if value is None:
+        return "NULL"
+    if isinstance(value, (int, float)):
+        return repr(value)
+    value = str(value).replace("'", "''")
+    return f"'{value}'"
+
+
+def encode_page_token(data):
+    """encode pagination data (a dictionnary) to an opaque string token"""
+    return base64.urlsafe_b64encode(
+        json.dumps(data, separators=(",", ":")).encode("utf-8")
+    ).decode("ascii")
+
+
+def decode_page_token(token):
+    """decode string token built by encode_page_token"""
+    try:
+        return json.loads(base64.urlsafe_b64decode(token.encode("ascii")))
+    except (ValueError, UnicodeError) as _e:
+        raise LRSelectException("Invalid page token") from _e
+
+
 class LRSelectGeneric:
     """
     Build select SQL requests for a specific table from columns and criteria strings
@@ -66,6 +98,9 @@ class LRSelectGeneric:
     # specific key for column specification
     _VAR_FIELD = "var:"
 
+    # unique key column of main table, used for pagination (None if unsupported)
+    KEY_COLUMN = None
+
     def __init__(self, config, lrdb, main_table, columns, criteria):
         """
         * param lrdb : LRCatDB instance
@@ -108,6 +143,12 @@ class LRSelectGeneric:
         self.having_criters = []
         self.sql_column_names = []
         self.raw_column_names = []
+        # keys for selection on a list of values (see select_by_values) :
+        #   key : [ SQL_JOIN_TABLES, SQL_CONDITION on value "v.value", (optional) function converting values ]
+        self.values_description = {}
+        # negated criteria compiled without joins, as anti-joins "NOT EXISTS (...)" (see negated_criterion_description) :
+        #   criter_name : [ "", SQL_WHERES, (optional) parser_value_function ], as in criteria description
+        self.negated_criteria_description = {}
 
     def selected_column_names(self):
         """column names from SQL statement executed"""
@@ -117,8 +158,8 @@ class LRSelectGeneric:
     # Some general functions called for convert value key in value sql
     #
 
-    def func_oper_parsedate(self, value):
-        """parse opration and date value"""
+    def parse_oper_date(self, value):
+        """parse operation and date value, returns operator, date and number of date parts"""
         oper = False
         for index, char in enumerate(value):
             if char.isnumeric():
@@ -132,6 +173,11 @@ class LRSelectGeneric:
             raise LRSelectException("Incorrect date")
         # value is it year, month/year or day/month/year ?
         nparts = len(re.findall(r"\d+", value))
+        return oper, date, nparts
+
+    def func_oper_parsedate(self, value):
+        """parse opration and date value"""
+        oper, date, nparts = self.parse_oper_date(value)
         if nparts <= 3:
             sql = f'DATE(i.captureTime, "{STARTS_OF_DATE[nparts]}") {oper} DATE("{date}", "{STARTS_OF_DATE[nparts]}")'
         else:
@@ -332,6 +378,69 @@ class LRSelectGeneric:
                 continue
             _column_to_sql(keyval)
 
+    def criterion_description(self, key):
+        """
+        Return description of criterion (see criteria in __init__)
+        Can be redefined in derived class, for an alternate description (ex: using cache)
+        """
+        if key not in self.criteria_description:
+            raise LRSelectException(f'No existent criterion "{key}"')
+        return self.criteria_description[key]
+
+    def negated_criterion_description(self, key):
+        """
+        Return description of negated criterion (see negated_criteria_description), or None if criterion
+        has no specific negation
+        Can be redefined in derived class, for an alternate description (ex: using cache)
+        """
+        return self.negated_criteria_description.get(key)
+
+    def _sort_expression(self, value, fields):
+        """
+        Return SQL expression of sort criterion value : a column index (one based) or a column name
+        """
+        expr = value
+        if value.isdigit():
+            if not 0 < int(value) <= len(fields):
+                raise LRSelectException(f'Invalid sort column "{value}"')
+            expr = fields[int(value) - 1]
+        else:
+            for field in fields:
+                match = re.match(r"(.*)\s+AS\s+(\w+)\s*$", field, re.I | re.S)
+                if match and match.group(2) == value:
+                    expr = field
+                    break
+        # remove column alias
+        match = re.match(r"(.*)\s+AS\s+\w+\s*$", expr, re.I | re.S)
+        return match.group(1) if match else expr
+
+    def _page_wheres(self, page, way, sort_expr):
+        """
+        Return SQL conditions selecting rows after the last row of previous page (keyset pagination),
+        as a list of segments to request successively in sort order. Each condition is a seek on sort key,
+        for an index use : sqlite sorts NULL values first in ascending order, so they are requested separately.
+        - page : decoded page token (keys "k" : sort value, "i" : key column value)
+        - way : sort way, "ASC" or "DESC"
+        - sort_expr : SQL expression of sort, None if sort on key column only
+        """
+        key = self.KEY_COLUMN
+        last_id = sql_literal(page["i"])
+        oper = ">" if way == "ASC" else "<"
+        if not sort_expr:
+            return [f"{key} {oper} {last_id}"]
+        if page.get("k") is None:
+            after_nulls = [f"{sort_expr} IS NULL AND {key} {oper} {last_id}"]
+            if way == "ASC":
+                after_nulls.append(f"{sort_expr} IS NOT NULL")
+            return after_nulls
+        last_value = sql_literal(page["k"])
+        after_value = [
+            f"{sort_expr} {oper}= {last_value} AND ({sort_expr} {oper} {last_value} OR {key} {oper} {last_id})"
+        ]
+        if way == "DESC":
+            after_value.append(f"{sort_expr} IS NULL")
+        return after_value
+
     def select_predefined(self, _columns, _criters):
         """
         To be redefined in derived class
@@ -348,14 +457,29 @@ class LRSelectGeneric:
         criteria :
             - 'CRITERION' = 'OPERATION+VALUE'
             - ....
+            combined by "," (AND), "|" (OR) and parenthesis, negated by "!" or "not(...)" :
+            criteria with a negated description (see negated_criteria_description) are compiled as anti-joins,
+            others as exclusion of rows matching them
         kwargs :
             - distinct : request SELECT DISTINCT
             - debug : print sql
             - print : print sql and return None
             - sql : return SQL string only
+            - cursor : cursor used for execute request (see LRCatDB.new_cursor), instead of default cursor
+            - count : request only the count of results : SELECT COUNT(*) FROM (request without sort)
+            - limit : (int) max number of results (SQL LIMIT), allows sqlite a top-k sort
+            - page_size : (int) number of rows by page. The request returns then a tuple (rows, next_token),
+                next_token being None for the last page
+            - page_token : token returned by previous page, None for first page
+            - values : key of values (see values_description), selects only rows matching values loaded
+                by load_values, in order of values
         """
 
         def _finalize(sql):
+            if kwargs.get("count"):
+                sql = f"SELECT COUNT(*) FROM ({sql})"
+            elif kwargs.get("limit") is not None and not page_size:
+                sql = f"{sql} LIMIT {int(kwargs['limit'])}"
             if kwargs.get("debug") or kwargs.get("print"):
                 print("SQL =", sql)
             if kwargs.get("print"):
@@ -363,10 +487,34 @@ class LRSelectGeneric:
             if kwargs.get("sql"):
                 return sql
             log.info("SQL = %s", sql)
-            self.lrdb.cursor.execute(sql)
-            # retrieve columns names as detected by sqlite
-            self.sql_column_names = [d[0] for d in self.lrdb.cursor.description]
-            return self.lrdb.cursor
+            cursor = kwargs.get("cursor") or self.lrdb.cursor
+            cursor.execute(sql)
+            if not kwargs.get("count"):
+                # retrieve columns names as detected by sqlite
+                self.sql_column_names = [d[0] for d in cursor.description]
+            return cursor
+
+        def _finalize_page(sqls):
+            # request segments of page until page_size + 1 rows
+            rows = []
+            for sql in sqls:
+                cursor = _finalize(f"{sql} LIMIT {page_size + 1 - len(rows)}")
+                if kwargs.get("print") or kwargs.get("sql"):
+                    return cursor
+                rows += cursor.fetchall()
+                if len(rows) > page_size:
+                    break
+            # remove columns page_key, page_id, and build token from last row
+            nb_keys = 2 if sort_expr else 1
+            self.sql_column_names = self.sql_column_names[:-nb_keys]
+            next_token = None
+            if len(rows) > page_size:
+                rows = rows[:page_size]
+                page = {"s": page_sign, "i": rows[-1][-1]}
+                if sort_expr:
+                    page["k"] = rows[-1][-2]
+                next_token = encode_page_token(page)
+            return [row[:-nb_keys] for row in rows], next_token
 
         # logging
         log = logging.getLogger(__name__)
@@ -377,12 +525,20 @@ class LRSelectGeneric:
         self.froms = [self.from_table]
         wheres = []
         sort = ""
+        sort_value = None
+        way = "ASC"
         nb_wheres = {}
         select_type = None
         self.groupby = ""
         self.having_criters = []
         self.sql_column_names = []
         self.raw_column_names = []
+        page_size = None if kwargs.get("count") else kwargs.get("page_size")
+        sort_expr = page_sign = None
+        if page_size:
+            if not self.KEY_COLUMN:
+                raise LRSelectException("Pagination unsupported on this table")
+            page_size = int(page_size)
 
         #
         # process predefined sql functions
@@ -390,6 +546,8 @@ class LRSelectGeneric:
         # pylint: disable=assignment-from-none
         sql = self.select_predefined(columns, criters)
         if sql:
+            if page_size:
+                raise LRSelectException("Pagination unsupported on predefined request")
             return _finalize(sql)
 
         #
@@ -399,30 +557,17 @@ class LRSelectGeneric:
         lex = CriterLexer(criters)
         if criters and not lex.parse():
             raise LRSelectException(f"Criteria syntax error : {lex.last_error}")
-        token2sql = {"LPAR": "(", "RPAR": ")", "AND": "AND", "OR": "OR"}
-
-        # process tokens
-        prev_optoken = None
-        has_where = False
-        for token, data in lex.tokens:
-            if token in token2sql:
-                # add previous token if any
-                if prev_optoken:
-                    wheres.append(token2sql[prev_optoken])
-                prev_optoken = token
-                continue
 
-            if token != "KEYVAL":
-                raise LRSelectException(f'Invalid Token : "{token}"')
-            key, value = data
+        def _criterion_where(key, value, criter_desc=None):
+            # return where string of criterion, or None for specific keys sort, distinct and count
+            nonlocal sort, sort_value, way, select_type
             value = self.remove_quotes(value)
             if key not in nb_wheres:
                 nb_wheres[key] = 1
             else:
                 nb_wheres[key] += 1
-            if key not in self.criteria_description:
-                raise LRSelectException(f'No existent criterion "{key}"')
-            criter_desc = self.criteria_description[key]
+            if criter_desc is None:
+                criter_desc = self.criterion_description(key)
             if len(criter_desc) == 2:
                 _from, _where = criter_desc
             else:
@@ -435,21 +580,22 @@ class LRSelectGeneric:
                     ) from _e
             # some specific keywords for SQL
             if key == "sort":  # specific key for sql 'ORDER BY'
+                if kwargs.get("count"):
+                    # sort is useless for a count
+                    return None
                 way = "DESC"
                 if value[0] == "-":
                     way = "ASC"
                     value = value[1:]
                 sort = f"ORDER BY {value} {way}"
-                prev_optoken = None
-                continue
+                sort_value = value
+                return None
             if key == "distinct":  # specific key for sql 'SELECT DISTINCT'
                 select_type = _where
-                prev_optoken = None
-                continue
+                return None
             if key == "count":  # key for sql 'COUNT (*) ... HAVING'
                 self.having_criters.append(f"count_{value}")
-                prev_optoken = None
-                continue
+                return None
 
             if _from:
                 if isinstance(_from, str):
@@ -461,19 +607,54 @@ class LRSelectGeneric:
             _where = _where.replace("<NUM>", f"{nb_wheres[key]}")
             if "%s" in _where:
                 _where = _where % value
-
-            # append the operation token if any
-            if prev_optoken:
-                if prev_optoken == "LPAR" or has_where:
-                    wheres.append(token2sql[prev_optoken])
-                prev_optoken = None
-            # and the "where" string
-            wheres.append(_where)
-            has_where = True
-
-        # finally: last operation token (a parenthesis)
-        if prev_optoken:
-            wheres.append(token2sql[prev_optoken])
+            return _where
+
+        def _tree_wheres(node):
+            # return list of where strings and operators of syntax tree node, criteria processed in order
+            token, data = node
+            if token == "KEYVAL":
+                _where = _criterion_where(*data)
+                return [] if _where is None else [_where]
+            if token == "PAR":
+                par_wheres = _tree_wheres(data)
+                return ["(", *par_wheres, ")"] if par_wheres else []
+            if token == "NOT":
+                return _not_wheres(data)
+            if token not in ("AND", "OR"):
+                raise LRSelectException(f'Invalid Token : "{token}"')
+            node_wheres = []
+            for item in data:
+                item_wheres = _tree_wheres(item)
+                if item_wheres and node_wheres:
+                    node_wheres.append(token)
+                node_wheres += item_wheres
+            return node_wheres
+
+        def _not_wheres(node):
+            # return where string of negated node : anti-join of criterion if any, else exclusion of keys
+            # of rows matching node, selected with their own joins (joins of criteria may multiply rows)
+            token, data = node
+            if token == "KEYVAL":
+                criter_desc = self.negated_criterion_description(data[0])
+                if criter_desc:
+                    return [_criterion_where(*data, criter_desc)]
+            if not self.KEY_COLUMN:
+                raise LRSelectException("Operator NOT unsupported on this table")
+            froms = self.froms
+            self.froms = [self.from_table]
+            try:
+                not_wheres = _tree_wheres(node)
+                not_froms = " ".join(self.froms)
+            finally:
+                self.froms = froms
+            if not not_wheres:
+                return []
+            return [
+                f'{self.KEY_COLUMN} NOT IN (SELECT {self.KEY_COLUMN} {not_froms} WHERE {" ".join(not_wheres)})'
+            ]
+
+        if lex.tree:
+            wheres = _tree_wheres(lex.tree)
 
         #
         # process columns :
@@ -483,26 +664,144 @@ class LRSelectGeneric:
         #
         # finalize request
         #
-        if fields:
-            fields = ", ".join(fields)
-        else:
-            fields = 'rf.absolutePath || fo.pathFromRoot || fi.baseName || "." || fi.extension '
-        self.froms = " ".join(self.froms)
-        if wheres:
-            wheres = f'WHERE {" ".join(wheres)}'
-        else:
-            wheres = ""
-
+        if not fields:
+            fields = [
+                'rf.absolutePath || fo.pathFromRoot || fi.baseName || "." || fi.extension '
+            ]
         if kwargs.get("distinct"):
             select_type = "SELECT DISTINCT"
         elif not select_type:
             select_type = "SELECT"
 
+        if kwargs.get("values"):
+            # join on temporary table of values, joined last as its condition can use other joins
+            _from, _on = self.value_description(kwargs["values"])[:2]
+            if _from:
+                self._add_from(_from, self.froms)
+            self.froms.append(f"JOIN temp.{VALUES_TABLE} v ON {_on}")
+            if not sort:
+                sort = "ORDER BY v.pos"
+
+        if page_size:
+            # keyset pagination : sort on sort criterion then on key column, and seek after last row of previous page
+            if select_type != "SELECT" or self.groupby or self.having_criters:
+                raise LRSelectException(
+                    "Pagination unsupported with distinct or count"
+                )
+            if sort_value:
+                sort_expr = self._sort_expression(sort_value, fields)
+                fields.append(f"{sort_expr} AS page_key")
+                sort = f"ORDER BY page_key {way}, page_id {way}"
+            else:
+                sort = "ORDER BY page_id ASC"
+            fields.append(f"{self.KEY_COLUMN} AS page_id")
+            page_sign = zlib.crc32(f"{sort_expr} {way}".encode("utf-8"))
+            page_wheres = [None]
+            if kwargs.get("page_token"):
+                page = decode_page_token(kwargs["page_token"])
+                if page.get("s") != page_sign or "i" not in page:
+                    raise LRSelectException("Page token doesn't match request")
+                page_wheres = self._page_wheres(page, way, sort_expr)
+
+        fields = ", ".join(fields)
+        self.froms = " ".join(self.froms)
         having = (
             f"HAVING {' AND '.join(self.having_criters)}"
             if self.having_criters
             else ""
         )
 
+        if page_size:
+            sqls = []
+            for page_where in page_wheres:
+                if page_where and wheres:
+                    _wheres = f'WHERE ({" ".join(wheres)}) AND {page_where}'
+                elif page_where:
+                    _wheres = f"WHERE {page_where}"
+                else:
+                    _wheres = f'WHERE {" ".join(wheres)}' if wheres else ""
+                sqls.append(
+                    f"{select_type}  {fields} {self.froms} {_wheres} {self.groupby} {having} {sort}"
+                )
+            return _finalize_page(sqls)
+
+        if wheres:
+            wheres = f'WHERE {" ".join(wheres)}'
+        else:
+            wheres = ""
+
         sql = f"{select_type}  {fields} {self.froms} {wheres} {self.groupby} {having} {sort}"
         return _finalize(sql)
+
+    def value_description(self, key):
+        """
+        Return description of a key for selection on a list of values (see values_description)
+        """
+        if key not in self.values_description:
+            raise LRSelectException(f'Selection on list of "{key}" unsupported')
+        return self.values_description[key]
+
+    def load_values(self, values, cursor=None, func=None):
+        """
+        Load list of values in temporary table VALUES_TABLE of cursor connection, replacing previous values
+        - func : function converting each value before load (original value is kept in column "raw")
+        """
+        cursor = cursor or self.lrdb.cursor
+        try:
+            rows = [
+                (pos, func(value) if func else value, value)
+                for pos, value in enumerate(values, 1)
+            ]
+        except ValueError as _e:
+            raise LRSelectException(f"Invalid value in list : {_e}") from _e
+        cursor.execute(
+            f"CREATE TEMP TABLE IF NOT EXISTS {VALUES_TABLE} (pos INTEGER PRIMARY KEY, value, raw)"
+        )
+        cursor.execute(
+            f"CREATE INDEX IF NOT EXISTS temp.{VALUES_TABLE}_value ON {VALUES_TABLE}(value)"
+        )
+        cursor.execute(f"DELETE FROM temp.{VALUES_TABLE}")
+        cursor.executemany(f"INSERT INTO temp.{VALUES_TABLE} VALUES (?, ?, ?)", rows)
+
+    def missing_values(self, key, cursor=None):
+        """
+        Return values loaded by load_values without matching row, via an anti-join
+        """
+        cursor = cursor or self.lrdb.cursor
+        _from, _on = self.value_description(key)[:2]
+        if isinstance(_from, list):
+            _from = " ".join(_from)
+        # join computed once (not correlated to each value), with the same plan as select_generic
+        cursor.execute(
+            f"SELECT raw FROM temp.{VALUES_TABLE} WHERE pos NOT IN"
+            f" (SELECT v.pos {self.from_table} {_from or ''} JOIN temp.{VALUES_TABLE} v ON {_on}) ORDER BY pos"
+        )
+        return [value for (value,) in cursor.fetchall()]
+
+    def select_by_values(self, columns, key, values, **kwargs):
+        """
+        Execute request of columns on rows matching a list of values, in a single request
+        - key : key of values (see values_description), as "uuid"
+        - values : list of values
+        - kwargs : as select_generic
+        Return (result of select_generic, list of values without matching row)
+        """
+        cursor = kwargs.get("cursor") or self.lrdb.cursor
+        func = (self.value_description(key)[2:] or [None])[0]
+        self.load_values(values, cursor, func)
+        missing = self.missing_values(key, cursor)
+        kwargs["values"] = key
+        return self.select_generic(columns, "", **kwargs), missing
+
+    def select_iter(
+        self, columns, criters, batch_size=FETCH_BATCH_ROWS, **kwargs
+    ):
+        """
+        Execute request built from columns and criteria (see select_generic) on a dedicated cursor,
+        and return an iterator on rows, fetched by batches of batch_size rows
+        kwargs : as select_generic (except print and sql)
+        """
+        kwargs["cursor"] = kwargs.get("cursor") or self.lrdb.new_cursor()
+        return iter_cursor(
+            self.select_generic(columns, criters, **kwargs), batch_size
+        )
@@ -10,7 +10,13 @@ import re
 import logging
 from datetime import datetime
 
-from .lrselectgeneric import LRSelectGeneric, LRSelectException
+from .lrselectgeneric import (
+    LRSelectGeneric,
+    LRSelectException,
+    STARTS_OF_DATE,
+    sql_literal,
+)
+from .lrdevelop import DEVELOP_NAMES
 from .gps import geocodage, square_around_location
 
 
@@ -54,6 +60,8 @@ class LRSelectPhoto(LRSelectGeneric):
     Build select request for photo table Adobe_images
     """
 
+    KEY_COLUMN = "i.id_local"
+
     def __init__(self, config, lrdb):
         """ """
         super().__init__(
@@ -434,6 +442,14 @@ class LRSelectPhoto(LRSelectGeneric):
                         ],
                     ]
                 },
+                # develop settings in cache (see lrdevelop)
+                "develop": {
+                    name: [
+                        f"(SELECT d.value FROM lrcache.develop d WHERE d.image = i.id_local AND d.setting = '{name}') AS {name}",
+                        None,
+                    ]
+                    for name in DEVELOP_NAMES
+                },
             },
             #
             # Criteria description
@@ -719,6 +735,11 @@ class LRSelectPhoto(LRSelectGeneric):
                     "%s",
                     self.func_haskeywords,
                 ],
+                "develop": [
+                    "",
+                    "%s",
+                    self.func_develop,
+                ],
                 "exifindex": [
                     "LEFT JOIN AgMetadataSearchIndex msi ON i.id_local = msi.image",
                     "%s",
@@ -774,6 +795,145 @@ class LRSelectPhoto(LRSelectGeneric):
                 ],
             },
         )
+        #
+        # Keys for selection on a list of values
+        #
+        self.values_description = {
+            "uuid": ["", "i.id_global = v.value"],
+            "id": ["", "i.id_local = v.value", int],
+            "name": [
+                "LEFT JOIN AgLibraryFile fi ON i.rootFile = fi.id_local",
+                "v.value = UPPER(fi.baseName)",
+                str.upper,
+            ],
+        }
+        #
+        # Negated criteria on photos joined many times (keywords, collections...), as anti-joins :
+        #   indexed probe on photo, instead of joins multiplying rows
+        #
+        self.negated_criteria_description = {
+            "idkeyword": [
+                "",
+                "NOT EXISTS (SELECT 1 FROM AgLibraryKeywordImage kwi WHERE kwi.image = i.id_local AND kwi.tag = %s)",
+            ],
+            "keyword": [
+                "",
+                "NOT EXISTS (SELECT 1 FROM AgLibraryKeywordImage kwi JOIN AgLibraryKeyword kw ON kw.id_local = kwi.tag"
+                ' WHERE kwi.image = i.id_local AND kw.name LIKE "%s")',
+            ],
+            "idcollection": [
+                "",
+                "NOT EXISTS (SELECT 1 FROM AgLibraryCollectionImage ci WHERE ci.image = i.id_local AND ci.collection = %s)",
+            ],
+            "collection": [
+                "",
+                "NOT EXISTS (SELECT 1 FROM AgLibraryCollectionImage ci JOIN AgLibraryCollection col ON col.id_local = ci.collection"
+                ' WHERE ci.image = i.id_local AND col.name LIKE "%s")',
+            ],
+            "idpubcollection": [
+                "",
+                "NOT EXISTS (SELECT 1 FROM AgLibraryPublishedCollectionImage pci WHERE pci.image = i.id_local AND pci.collection = %s)",
+            ],
+            "pubcollection": [
+                "",
+                "NOT EXISTS (SELECT 1 FROM AgLibraryPublishedCollectionImage pci JOIN AgLibraryPublishedCollection pc"
+                " ON pc.id_local = pci.collection WHERE %s)",
+                self.func_published,
+            ],
+            "import": [
+                "",
+                "NOT EXISTS (SELECT 1 FROM AgLibraryImportImage impim WHERE impim.image = i.id_local AND impim.import = %s)",
+            ],
+        }
+        self.cached_negated_criteria_description = {
+            "keyword": [
+                "keywords",
+                [
+                    "",
+                    "NOT EXISTS (SELECT 1 FROM AgLibraryKeywordImage kwi WHERE kwi.image = i.id_local"
+                    ' AND kwi.tag IN (SELECT id FROM lrcache.keywords WHERE name LIKE "%s"))',
+                ],
+            ],
+        }
+        #
+        # Criteria description using acceleration cache (see LRCacheDB)
+        #
+        #   dictionnary of criterion, used when the cache part is up to date. Each criterion contains :
+        #       - cache part name
+        #       - criterion description, as in criteria description
+        self.cached_criteria_description = {
+            "name": [
+                "names",
+                [
+                    "",
+                    'i.id_local IN (SELECT image FROM lrcache.names WHERE name LIKE "%s")',
+                ],
+            ],
+            "exactname": [
+                "names",
+                [
+                    "",
+                    'i.id_local IN (SELECT image FROM lrcache.names WHERE ubase = "%s")',
+                ],
+            ],
+            "datecapt": [
+                "dates",
+                [
+                    "",
+                    "%s",
+                    self.func_oper_parsedate_cached,
+                ],
+            ],
+            "keyword": [
+                "keywords",
+                [
+                    [
+                        "LEFT JOIN AgLibraryKeywordImage kwi<NUM> ON i.id_local = kwi<NUM>.image",
+                        " LEFT JOIN AgLibraryKeyword kw<NUM> ON kw<NUM>.id_local = kwi<NUM>.tag",
+                    ],
+                    'kwi<NUM>.tag IN (SELECT id FROM lrcache.keywords WHERE name LIKE "%s")',
+                ],
+            ],
+            "gps": [
+                "gps",
+                [
+                    "",
+                    "%s",
+                    self.func_gps_cached,
+                ],
+            ],
+        }
+        # selector on table facts of cache, created on first use
+        self._facts = None
+
+    def criterion_description(self, key):
+        """
+        Return description of criterion, from cache criteria description if cache is up to date
+        """
+        if key in self.cached_criteria_description:
+            part, criter_desc = self.cached_criteria_description[key]
+            if self.lrdb.cache_ready(part):
+                return criter_desc
+        return super().criterion_description(key)
+
+    def negated_criterion_description(self, key):
+        """
+        Return description of negated criterion, from cache criteria description if cache is up to date
+        """
+        if key in self.cached_negated_criteria_description:
+            part, criter_desc = self.cached_negated_criteria_description[key]
+            if self.lrdb.cache_ready(part):
+                return criter_desc
+        return super().negated_criterion_description(key)
+
+    def func_oper_parsedate_cached(self, value):
+        """parse operation and date value, for dates in cache"""
+        oper, date, nparts = self.parse_oper_date(value)
+        if nparts <= 3:
+            column = {1: "year", 2: "month", 3: "day"}[nparts]
+            return f'i.id_local IN (SELECT image FROM lrcache.dates WHERE {column} {oper} DATE("{date}", "{STARTS_OF_DATE[nparts]}"))'
+        # Adobe_images.captureTime is indexed
+        return f'i.captureTime {oper} "{date.strftime("""%Y-%m-%dT%H:%M:%S""")}"'
 
     def func_metastatus(self, value):
         """specific value for metastatus"""
@@ -886,20 +1046,79 @@ class LRSelectPhoto(LRSelectGeneric):
         if value in ["True", "1"]:
             return "i.id_local IN (SELECT DISTINCT kwi.image FROM AgLibraryKeywordImage kwi)"
         if value in ["False", "0"]:
-            self._add_from(
-                [
-                    "LEFT JOIN AgLibraryKeywordImage kwi1 ON i.id_local = kwi1.image"
-                ],
-                self.froms,
-            )
-            return "kwi1.image IS NULL"
+            return "NOT EXISTS (SELECT 1 FROM AgLibraryKeywordImage kwi WHERE kwi.image = i.id_local)"
         raise LRSelectException("invalid haskeywords value")
 
+    def func_develop(self, value):
+        """
+        select photos on a develop setting in cache : setting name, and optional operator and value
+            ex: value=Exposure2012>1.0, value=WhiteBalance=As Shot, value=hasLensProfile
+        Setting name (case insensitive) is one of DEVELOP_NAMES
+        """
+        self._check_develop_cache()
+        match = re.match(r"\s*(\w+)\s*(?:(<=|>=|!=|<>|==|=|<|>)\s*(.*))?$", value)
+        if not match:
+            raise LRSelectException(f'invalid develop criterion "{value}"')
+        setting, oper, val = match.groups()
+        names = {name.lower(): name for name in DEVELOP_NAMES}
+        if setting.lower() not in names:
+            raise LRSelectException(
+                f'invalid develop setting "{setting}" (see settings of column "develop")'
+            )
+        setting = names[setting.lower()]
+        if not oper:
+            # setting is set : not zero, not empty
+            cond = "d.value NOT IN (0, '')"
+        else:
+            val = val.strip()
+            try:
+                val = int(val)
+            except ValueError:
+                try:
+                    val = float(val)
+                except ValueError:
+                    pass
+            if isinstance(val, str) and "%" in val and oper in ["=", "=="]:
+                oper = "LIKE"
+            cond = f"d.value {oper} {sql_literal(val)}"
+        return f"i.id_local IN (SELECT d.image FROM lrcache.develop d WHERE d.setting = {sql_literal(setting)} AND {cond})"
+
+    def _check_develop_cache(self):
+        """
+        Raise LRSelectException if develop settings are not in cache
+        """
+        if not self.lrdb.cache_ready("develop"):
+            raise LRSelectException(
+                'develop settings need cache part "develop" up to date (see --cache-build)'
+            )
+
+    def columns_to_sql(self, columns, sqlcols, sqlfroms):
+        """
+        Convert string of column names comma separated to sql string. Column develop needs cache
+        """
+        super().columns_to_sql(columns, sqlcols, sqlfroms)
+        if "develop" in self.raw_column_names:
+            self._check_develop_cache()
+
     def func_gps(self, value):
         """
         select photos within gps values
             ex: value=paris/lyon
         """
+        lat1, lat2, lon1, lon2 = self._gps_bounds(value)
+        return f"(em.hasGps = 1 AND em.gpsLatitude BETWEEN {lat1} AND {lat2} AND em.gpsLongitude BETWEEN {lon1} AND {lon2})"
+
+    def func_gps_cached(self, value):
+        """
+        select photos within gps values, for coordinates in cache
+        """
+        lat1, lat2, lon1, lon2 = self._gps_bounds(value)
+        return f"i.id_local IN (SELECT image FROM lrcache.gps WHERE lat BETWEEN {lat1} AND {lat2} AND lon BETWEEN {lon1} AND {lon2})"
+
+    def _gps_bounds(self, value):
+        """
+        Return GPS rectangle (lat_min, lat_max, lon_min, lon_max) from gps criterion value
+        """
 
         def reorder(val1, val2):
             return min(val1, val2), max(val1, val2)
@@ -974,7 +1193,7 @@ class LRSelectPhoto(LRSelectGeneric):
 
         lat1, lat2 = reorder(float(lat1), float(lat2))
         lon1, lon2 = reorder(float(lon1), float(lon2))
-        return f"(em.hasGps = 1 AND em.gpsLatitude BETWEEN {lat1} AND {lat2} AND em.gpsLongitude BETWEEN {lon1} AND {lon2})"
+        return lat1, lat2, lon1, lon2
 
     def func_published(self, value):
         """
@@ -1108,6 +1327,12 @@ class LRSelectPhoto(LRSelectGeneric):
             - 'city'       : location city name
             - 'location'   : location name
             - 'duration'   : video duration in seconds
+            - 'develop'    : develop setting, as "develop=Exposure2012". Needs cache (see --cache-build). Settings :
+                    ProcessVersion, CameraProfile, WhiteBalance, Temperature, Tint, Exposure2012, Contrast2012,
+                    Highlights2012, Shadows2012, Whites2012, Blacks2012, Texture, Clarity2012, Dehaze, Vibrance,
+                    Saturation, Sharpness, LuminanceSmoothing, ColorNoiseReduction, PostCropVignetteAmount,
+                    GrainAmount, ConvertToGrayscale, LensProfileEnable, AutoLateralCA, HasCrop, CropAngle,
+                    and flags (0 or 1) hasLensProfile, hasRetouch, hasLocalAdjustments
             - 'count(NAME)' : count not NULL value for column NAME (ex: "count(master)")
             - 'countby(NAME)' : count aggregated not NULL value for column NAME
         criterias :
@@ -1154,6 +1379,9 @@ class LRSelectPhoto(LRSelectGeneric):
             - 'idkeyword'  : (int) keyword id
             - 'keyword'    : (str) keyword name.
             - 'haskeywords': (bool) photos with or without keywords
+            - 'develop'    : (str) develop setting (see column 'develop') and optional operator (=,!=,<,<=,>,>=) and value.
+                    Without operator, setting is not 0 or empty. Needs cache (see --cache-build).
+                    ex: "develop=Exposure2012>1.0", "develop=ProcessVersion=11.0", "develop=hasLensProfile"
             - 'import'     : (int) import id
             - 'stacks'     : operation on stacks in :
                     'yes'    = photos in a stack
@@ -1178,13 +1406,188 @@ class LRSelectPhoto(LRSelectGeneric):
             - 'count(NAME) : (str) criter for column countby(NAME)
             - 'sort'       : (int|str) sort result: column index (one based) or column name
             - 'distinct'   : suppress similar lines of results
+
+            criteria are combined by "," (AND), "|" (OR), parenthesis, and negated by "!" or "not(...)".
+                ex: "!keyword=dog", "not(collection=Holidays|keyword=family), rating=>=3"
         kwargs :
             - distinct : request SELECT DISTINCT
             - debug : print sql
             - print : print sql and return None
             - sql : return SQL string only
+            - cursor : cursor used for execute request (see LRCatDB.new_cursor), instead of default cursor
+            - count : request only the count of results
+            - limit : (int) max number of results
+            - page_size : (int) number of rows by page, the request returns then a tuple (rows, next_token)
+            - page_token : token returned by previous page, None for first page
+            - values : key of values ("uuid", "id" or "name"), see select_by_values
+            - facts : use table facts of cache when up to date (default True)
         """
 
         if not columns:
             columns = "name=basext"
+        if kwargs.get("facts", True) and self.lrdb.cache_ready("facts"):
+            if self._facts is None:
+                self._facts = LRSelectFacts(self.config, self.lrdb)
+            result = self._facts.select_generic(columns, criters, **kwargs)
+            self.sql_column_names = self._facts.sql_column_names
+            self.raw_column_names = self._facts.raw_column_names
+            return result
         return super().select_generic(columns, criters, **kwargs)
+
+
+class LRSelectFacts(LRSelectPhoto):
+    """
+    Build select request for photo on table facts of cache (see LRCacheDB)
+
+    Table facts contains all columns of Adobe_images, so the columns and criteria of LRSelectPhoto
+    are valid. Those joining file, folder, exif, iptc, develop settings or additional metadata tables
+    are replaced by the denormalized columns of facts.
+    """
+
+    def __init__(self, config, lrdb):
+        """ """
+        super().__init__(config, lrdb)
+        self.from_table = "FROM lrcache.facts i"
+        #
+        # Column description replacing joins
+        #
+        self.column_description.update(
+            {
+                "name": {
+                    "full": [
+                        'i.folderPath || i.fileBaseName || "." || i.fileExtension AS name',
+                        None,
+                    ],
+                    "full_vc": [
+                        'i.folderPath || i.fileBaseName || COALESCE(i.copyName, "") || "." || i.fileExtension AS name',
+                        None,
+                    ],
+                    "base": ["i.fileBaseName AS name", None],
+                    "base_vc": [
+                        'i.fileBaseName || COALESCE(i.copyName, "") AS name',
+                        None,
+                    ],
+                    "True": [
+                        'i.fileBaseName || "." || i.fileExtension AS name',
+                        None,
+                    ],
+                    "basext": [
+                        'i.fileBaseName || "." || i.fileExtension AS name',
+                        None,
+                    ],
+                    "basext_vc": [
+                        'i.fileBaseName || COALESCE(i.copyName, "") || "." || i.fileExtension AS name',
+                        None,
+                    ],
+                },
+                "idfolder": {"True": ["i.folderId AS idfolder", None]},
+                "folder": {"True": ["i.folderPath AS folder", None]},
+                "camera": {"True": ["i.exifCamera AS camera", None]},
+                "camerasn": {"True": ["i.exifCameraSN AS camerasn", None]},
+                "lens": {"True": ["i.exifLens AS lens", None]},
+                "iso": {"True": ["i.exifIso AS iso", None]},
+                "focal": {"True": ["i.exifFocal AS focal", None]},
+                "aperture": {"True": ["i.exifAperture AS aperture", None]},
+                "speed": {"True": ["i.exifSpeed AS speed", None]},
+                "flash": {"True": ["i.exifFlash AS flash", None]},
+                "hasgps": {"True": ["i.exifHasGps AS hasgps", None]},
+                "latitude": {"True": ["i.exifLatitude AS latitude", None]},
+                "longitude": {"True": ["i.exifLongitude AS longitude", None]},
+                "monochrome": {"True": ["i.metaMonochrome AS monochrome", None]},
+                "grayscale": {"True": ["i.devGrayscale AS grayscale", None]},
+                "dims": {"True": ["i.devDims AS dims", None]},
+                "creator": {"True": ["i.iptcCreator AS creator", None]},
+                "caption": {"True": ["i.iptcCaption AS caption", None]},
+                "copyright": {"True": ["i.iptcCopyright AS copyright", None]},
+                "extfile": {"True": ["i.fileSidecarExtensions AS extfile", None]},
+                "location": {"True": ["i.iptcLocation AS location", None]},
+                "city": {"True": ["i.iptcCity AS city", None]},
+                "country": {"True": ["i.iptcCountry AS country", None]},
+                "state": {"True": ["i.iptcState AS state", None]},
+            }
+        )
+        #
+        # Criteria description replacing joins
+        #
+        self.criteria_description.update(
+            {
+                "name": [
+                    "",
+                    'UPPER(i.fileBaseName || COALESCE(i.copyName, "")) LIKE "%s"',
+                ],
+                "exactname": ["", ' UPPER(i.fileBaseName) = "%s"'],
+                "ext": ["", 'UPPER(i.fileExtension) LIKE "%s"'],
+                "exact_ext": ["", 'UPPER(i.fileExtension) = "%s"'],
+                "idfolder": ["", "i.folderId = %s"],
+                "folder": ["", 'UPPER(i.folderPath) LIKE "%s"'],
+                "caption": [
+                    "",
+                    "i.iptcCaption %s",
+                    self.func_like_value_or_null,
+                ],
+                "copyright": [
+                    "",
+                    "i.iptcCopyright %s",
+                    self.func_like_value_or_null,
+                ],
+                "creator": ["", 'i.iptcCreator LIKE "%s"'],
+                "iso": ["", "i.exifIso %s %s", self.func_oper_value],
+                "focal": ["", "i.exifFocal %s %s", self.func_oper_value],
+                "aperture": ["", "i.exifAperture %s", self.func_aperture],
+                "speed": ["", "i.exifSpeed %s", self.func_speed],
+                "flash": ["", "i.exifFlash %s", self.func_value_or_null],
+                "camera": ["", 'i.exifCamera LIKE "%s"'],
+                "camerasn": ["", 'i.exifCameraSN LIKE "%s"'],
+                "lens": ["", 'i.exifLens LIKE "%s"'],
+                "monochrome": ["", "i.metaMonochrome = %s", self.func_0_1],
+                "grayscale": ["", "i.devGrayscale = %s", self.func_0_1],
+                "hasgps": ["", "i.exifHasGps = %s", self.func_0_1],
+                "gps": ["", "%s", self.func_gps],
+                "metastatus": ["", "%s", self.func_metastatus],
+                "extfile": ["", ' UPPER(i.fileSidecarExtensions) LIKE "%s"'],
+                "country": [
+                    "",
+                    "i.iptcCountry %s",
+                    self.func_like_value_or_null,
+                ],
+                "state": [
+                    "",
+                    "i.iptcState %s",
+                    self.func_like_value_or_null,
+                ],
+                "city": ["", "i.iptcCity %s", self.func_like_value_or_null],
+                "location": [
+                    "",
+                    "i.iptcLocation %s",
+                    self.func_like_value_or_null,
+                ],
+            }
+        )
+        self.values_description["name"] = [
+            "",
+            "v.value = UPPER(i.fileBaseName)",
+            str.upper,
+        ]
+
+    def func_gps(self, value):
+        """
+        select photos within gps values
+        """
+        lat1, lat2, lon1, lon2 = self._gps_bounds(value)
+        return f"(i.exifHasGps = 1 AND i.exifLatitude BETWEEN {lat1} AND {lat2} AND i.exifLongitude BETWEEN {lon1} AND {lon2})"
+
+    def func_metastatus(self, value):
+        """specific value for metastatus"""
+        return (
+            super()
+            .func_metastatus(value)
+            .replace("am.externalXmpIsDirty", "i.metaXmpDirty")
+        )
+
+    def select_generic(self, columns, criters="", **kwargs):
+        """
+        Build SQL request on table facts (see LRSelectPhoto.select_generic)
+        """
+        if not columns:
+            columns = "name=basext"
+        return LRSelectGeneric.select_generic(self, columns, criters, **kwargs)
@@ -0,0 +1,163 @@
+# # -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+
+"""
+LRSmartBatch class for evaluation of many smart collections at once
+
+Criteria shared by smart collections (ex: "rating >= 3") are evaluated once : photos ids of each distinct criteria
+are kept in memory, and photos of a smart collection are computed by intersection or union of these sets.
+"""
+
+import logging
+import time
+from sqlite3 import OperationalError
+
+from .lrselectgeneric import LRSelectException
+from .lrsmartcoll import SQLSmartColl, SmartException
+
+log = logging.getLogger(__name__)
+
+
+class LRSmartBatch:
+    """
+    Evaluate smart collections of catalog, sharing results of identical criteria
+    """
+
+    def __init__(self, config, lrdb):
+        """
+        Init
+        - config : LRToolConfig instance
+        - lrdb : LRCatDB instance
+        """
+        self.config = config
+        self.lrdb = lrdb
+        # photos ids by criteria key (see criteria_key)
+        self.criteria_ids = {}
+        # evaluation restricted to photos of temporary table (see restrict)
+        self.restricted = False
+
+    def restrict(self, images=None):
+        """
+        Restrict evaluation of criteria to photos of ids images (iterable), or to all photos if images is None
+        Photos ids are loaded in a temporary table. Criteria already evaluated are forgotten
+        """
+        self.criteria_ids = {}
+        self.restricted = images is not None
+        if not self.restricted:
+            return
+        cursor = self.lrdb.new_cursor()
+        cursor.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS smartbatch_images (id INTEGER PRIMARY KEY)"
+        )
+        cursor.execute("DELETE FROM temp.smartbatch_images")
+        cursor.executemany(
+            "INSERT OR IGNORE INTO temp.smartbatch_images VALUES (?)",
+            ((idphoto,) for idphoto in images),
+        )
+
+    @staticmethod
+    def criteria_key(func):
+        """
+        Return canonical key of criteria func (an item of smart collection structure) :
+        criteria with same key select same photos.
+        Order of fields, spaces around strings and empty optional fields ("value2", "_units"...) are ignored
+        """
+        items = []
+        for key, value in func.items():
+            if isinstance(value, str):
+                value = value.strip()
+                if not value and key != "value":
+                    continue
+            items.append((key, repr(value)))
+        return tuple(sorted(items))
+
+    def criteria_photos(self, builder, func):
+        """
+        Return set of ids of photos matching criteria func, selected on first call for this criteria
+        - builder : SQLSmartColl instance
+        Return tuple (set of ids, True if criteria has been evaluated by this call)
+        """
+        key = self.criteria_key(func)
+        if key in self.criteria_ids:
+            return self.criteria_ids[key], False
+        sql = builder.build_criteria_sql(func)
+        if self.restricted:
+            sql += " AND i.id_local IN (SELECT id FROM temp.smartbatch_images)"
+        log.info("criteria sql: %s", sql)
+        ids = frozenset(idphoto for idphoto, in self.lrdb.iter_sql(sql))
+        self.criteria_ids[key] = ids
+        return ids, True
+
+    def evaluate(self, smart):
+        """
+        Return set of ids of photos of smart collection, from structure returned by LRCatDB.get_smartcoll_data
+        Return tuple (set of ids, number of criteria, number of criteria evaluated)
+        Raise SmartException, LRSelectException or sqlite3.OperationalError for unsupported or invalid criteria
+        """
+        builder = SQLSmartColl(self.config, self.lrdb, smart)
+        sets = []
+        evaluated = 0
+        fid = 0
+        while fid in smart:
+            ids, new = self.criteria_photos(builder, smart[fid])
+            sets.append(ids)
+            evaluated += new
+            fid += 1
+        if not sets:
+            raise SmartException("no criteria")
+        if len(sets) == 1:
+            return sets[0], 1, evaluated
+        if smart["combine"] == "union":
+            return frozenset().union(*sets), len(sets), evaluated
+        if smart["combine"] == "intersect":
+            # smallest set first
+            sets.sort(key=len)
+            return sets[0].intersection(*sets[1:]), len(sets), evaluated
+        raise SmartException(
+            f'"combine" operation unsupported: {smart["combine"]}'
+        )
+
+    def run(self, collname=""):
+        """
+        Evaluate smart collections of name collname (see LRCatDB.get_smartcolls_data), definitions loaded at once
+        Iterate on tuples (name, result) by smart collection name, result is a dictionary :
+            - ids : set of ids of photos, None if evaluation failed
+            - criteria : number of criteria
+            - evaluated : number of criteria evaluated, others are shared with previous smart collections
+            - duration : duration of evaluation in seconds
+            - error : error message if evaluation failed
+        """
+        for _, name, smart in self.lrdb.get_smartcolls_data(collname):
+            result = {
+                "ids": None,
+                "criteria": 0,
+                "evaluated": 0,
+                "duration": 0.0,
+                "error": "",
+            }
+            start = time.perf_counter()
+            if not smart:
+                result["error"] = "Invalid syntax"
+            else:
+                try:
+                    (
+                        result["ids"],
+                        result["criteria"],
+                        result["evaluated"],
+                    ) = self.evaluate(smart)
+                except (
+                    LRSelectException,
+                    SmartException,
+                    OperationalError,
+                ) as _e:
+                    result["error"] = str(_e)
+            result["duration"] = time.perf_counter() - start
+            log.info(
+                'smart "%s" : %s photos, %s criteria (%s evaluated) in %.3fs',
+                name,
+                len(result["ids"]) if result["ids"] is not None else "FAILED",
+                result["criteria"],
+                result["evaluated"],
+                result["duration"],
+            )
+            yield name, result
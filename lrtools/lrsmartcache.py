@@ -0,0 +1,216 @@
+# # -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+
+"""
+LRSmartCache class for SQL requests of smart collections built by previous executions
+
+Requests are stored in the acceleration cache file of catalog (see LRCacheDB), keyed by the smart collection
+definition as stored in catalog (AgLibraryCollectionContent.content) and the options of the request.
+"""
+
+import hashlib
+import sqlite3
+import logging
+import time
+
+from . import __version__
+from .lrcache import LRCacheDB, LRCacheException, catalog_fingerprint
+
+log = logging.getLogger(__name__)
+
+
+class LRSmartCache:
+    """
+    Persistent cache of SQL requests of smart collections
+
+    Table smart_sql in cache file : requests (select and count) by key (see key), with the hash of the definition
+    and the fingerprint of catalog tables read when building requests (see dependencies_fingerprint).
+    When the catalog changed since last check, entries of modified or deleted smart collections, and entries built
+    with other keywords or collections are evicted.
+    """
+
+    # name of cache in table meta of cache file
+    PART = "smartsql"
+    # format version of table smart_sql, increase it on any change in SCHEMA
+    VERSION = 1
+
+    SCHEMA = [
+        "DROP TABLE IF EXISTS smart_sql",
+        "CREATE TABLE smart_sql (key TEXT PRIMARY KEY, content TEXT, dependencies TEXT, sql TEXT, sql_count TEXT, built REAL)",
+    ]
+
+    # catalog tables resolved by smart collections criteria when building requests (keywords ids, collections ids)
+    DEPENDENCIES = [
+        "SELECT id_local, lc_name, parent FROM AgLibraryKeyword ORDER BY id_local",
+        "SELECT keyword, lc_name FROM AgLibraryKeywordSynonym ORDER BY keyword, lc_name",
+        "SELECT id_local, name, parent FROM AgLibraryCollection ORDER BY id_local",
+    ]
+
+    def __init__(self, lrdb, cache_file=None):
+        """
+        Init
+        - lrdb : LRCatDB instance
+        - cache_file : cache filename. Default is cache file of lrdb, or default cache file of catalog
+        """
+        self.lrdb = lrdb
+        if not cache_file:
+            cache_file = (
+                lrdb.cache.cache_file
+                if lrdb.cache
+                else LRCacheDB(lrdb.lrcat_file).cache_file
+            )
+        self.cache_file = cache_file
+        # connection to cache file, opened on first use
+        self.conn = None
+        # fingerprint of dependencies, computed on first need
+        self._dependencies = None
+
+    @staticmethod
+    def content_hash(content):
+        """
+        Return hash of smart collection definition content, as stored in catalog
+        """
+        return hashlib.md5(content.encode("utf-8")).hexdigest()
+
+    def dependencies_fingerprint(self):
+        """
+        Return fingerprint of contents of catalog tables read when building requests (see DEPENDENCIES)
+        """
+        if self._dependencies is None:
+            digest = hashlib.md5()
+            for sql in self.DEPENDENCIES:
+                try:
+                    for row in self.lrdb.iter_sql(sql):
+                        digest.update(repr(row).encode("utf-8"))
+                except sqlite3.OperationalError:
+                    # table missing in old catalogs
+                    digest.update(sql.encode("utf-8"))
+            self._dependencies = digest.hexdigest()
+        return self._dependencies
+
+    def key(self, content, columns, compiled=False):
+        """
+        Return key of requests of smart collection
+        - content : definition of smart collection, as stored in catalog
+        - columns : columns of select request
+        - compiled : requests built by SQLSmartColl.build_compiled_sql, instead of build_sql
+        Parts of acceleration cache used by requests are attached to catalog connection
+        """
+        parts = [part for part in LRCacheDB.PARTS if self.lrdb.cache_ready(part)]
+        return hashlib.md5(
+            "\0".join(
+                [
+                    __version__,
+                    self.content_hash(content),
+                    columns,
+                    "compiled" if compiled else "",
+                    ",".join(parts),
+                ]
+            ).encode("utf-8")
+        ).hexdigest()
+
+    def _connect(self):
+        """
+        Open cache file, create table or evict stale entries when catalog changed since last check
+        """
+        if self.conn:
+            return self.conn
+        fingerprint = catalog_fingerprint(self.lrdb.lrcat_file)
+        try:
+            conn = sqlite3.connect(self.cache_file)
+        except sqlite3.OperationalError as _e:
+            raise LRCacheException(
+                f'Unable to create cache "{self.cache_file}": {_e}'
+            ) from _e
+        try:
+            # write lock taken at once : check is not interleaved with another process
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (part TEXT PRIMARY KEY, fingerprint TEXT, version INTEGER, built REAL)"
+            )
+            row = conn.execute(
+                "SELECT fingerprint, version FROM meta WHERE part = ?",
+                (self.PART,),
+            ).fetchone()
+            if not row or row[1] != self.VERSION:
+                for sql in self.SCHEMA:
+                    conn.execute(sql)
+            elif row[0] != fingerprint:
+                self._evict(conn)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?)",
+                (self.PART, fingerprint, self.VERSION, time.time()),
+            )
+            conn.commit()
+        except sqlite3.DatabaseError as _e:
+            conn.close()
+            raise LRCacheException(f"Smart SQL cache check failed: {_e}") from _e
+        self.conn = conn
+        return conn
+
+    def _evict(self, conn):
+        """
+        Delete entries of smart collections modified or deleted, or built with others dependencies
+        """
+        contents = {
+            self.content_hash(content)
+            for content, in self.lrdb.iter_sql(
+                'SELECT content FROM AgLibraryCollectionContent WHERE owningModule = "ag.library.smart_collection"'
+            )
+            if content
+        }
+        dependencies = self.dependencies_fingerprint()
+        stale = [
+            (key,)
+            for key, content, entry_dependencies in conn.execute(
+                "SELECT key, content, dependencies FROM smart_sql"
+            )
+            if content not in contents or entry_dependencies != dependencies
+        ]
+        conn.executemany("DELETE FROM smart_sql WHERE key = ?", stale)
+        log.info("smart sql cache : %s entries evicted", len(stale))
+
+    def get(self, content, columns, compiled=False):
+        """
+        Return requests of smart collection as tuple (sql, sql_count), or None if not in cache. See key for parameters
+        """
+        row = (
+            self._connect()
+            .execute(
+                "SELECT sql, sql_count FROM smart_sql WHERE key = ?",
+                (self.key(content, columns, compiled),),
+            )
+            .fetchone()
+        )
+        return tuple(row) if row else None
+
+    def put(self, content, columns, compiled, sql, sql_count):
+        """
+        Store requests sql and sql_count of smart collection. See key for others parameters
+        """
+        conn = self._connect()
+        try:
+            conn.execute(
+                "INSERT OR REPLACE INTO smart_sql VALUES (?, ?, ?, ?, ?, ?)",
+                (
+                    self.key(content, columns, compiled),
+                    self.content_hash(content),
+                    self.dependencies_fingerprint(),
+                    sql,
+                    sql_count,
+                    time.time(),
+                ),
+            )
+            conn.commit()
+        except sqlite3.OperationalError as _e:
+            # cache locked by another process : requests are not kept
+            conn.rollback()
+            log.info("smart sql cache : store failed : %s", _e)
+
+    def close(self):
+        """
+        Close cache file
+        """
+        if self.conn:
+            self.conn.close()
+            self.conn = None
@@ -7,6 +7,7 @@ SQLSmartColl Class for Lightroom Smart Collection manipulations
 
 
 """
+import re
 import logging
 
 from .lrcat import TIMESTAMP_LR_EPOCH
@@ -64,6 +65,19 @@ class SQLSmartColl:
         ' ELSE CAST(i.filewidth AS int) || "x" || CAST(i.fileHeight AS int) END) AS dims '
     )
 
+    # columns used in conditions of criteria (see _compile_criteria)
+    _CRITERIA_COLUMNS = {
+        "filename": "name",
+        "widthCropped": "dims",
+        "heightCropped": "dims",
+    }
+
+    # request of a criteria on photos and joined tables : columns, joins and condition
+    _CRITERIA_REQUEST = re.compile(
+        r"\s*SELECT\s+(?:DISTINCT\s+)?(.*?)\s+FROM Adobe_images i\s+(.*?)\s*\bWHERE\b(.*)$",
+        re.S,
+    )
+
     def __init__(self, config, lrdb, smart):
         """
         Initialize from :
@@ -93,6 +107,17 @@ class SQLSmartColl:
         self.base_sql_select = self.base_select = self.base_sql = self.sql = (
             self.func
         ) = self.joins = ""
+        # last (sql, condition) built by _complete_sql, for compiled requests
+        self.last_where = None
+        # keywords, loaded once by process (see LRCatDB.keywords_model)
+        self._lrkeywords = None
+
+    @property
+    def lrkeywords(self):
+        """LRKeywords instance, created on first use"""
+        if self._lrkeywords is None:
+            self._lrkeywords = LRKeywords(self.lrdb)
+        return self._lrkeywords
 
     def criteria_aspectRatio(self):
         """criteria aspectRatio"""
@@ -273,11 +298,12 @@ class SQLSmartColl:
     def criteria_keywords(self):
         """criteria keyword"""
         _base_sql = self.lrdb.lrphoto.select_generic(
-            self.base_select, "keyword", distinct=True, sql=True
+            self.base_select, "keyword", distinct=True, sql=True, facts=False
         )
-        _base_sql = _base_sql[: _base_sql.rfind(" WHERE ")]
+        # keep the keyword joins only (the criterion condition can contain a sub-select)
+        _base_sql = _base_sql[: _base_sql.rfind(" WHERE kw")]
         if self.func["operation"] == "noneOf":
-            lrk = LRKeywords(self.lrdb)
+            lrk = self.lrkeywords
             indexes = list()
             for keyword in self.func["value"].split():
                 indexes += lrk.hierachical_indexes(
@@ -292,7 +318,7 @@ class SQLSmartColl:
             )
 
         elif self.func["operation"] == "any":
-            lrk = LRKeywords(self.lrdb)
+            lrk = self.lrkeywords
             indexes = list()
             for keyword in self.func["value"].split():
                 indexes += lrk.hierachical_indexes(
@@ -307,7 +333,7 @@ class SQLSmartColl:
             "beginsWith",
             "endsWith",
         ]:
-            lrk = LRKeywords(self.lrdb)
+            lrk = self.lrkeywords
             values = []
             for keyword in self.func["value"].split():
                 indexes = lrk.hierachical_indexes(
@@ -328,7 +354,7 @@ class SQLSmartColl:
             self.sql += _sql + " WHERE kwi1.image IS NULL"
         elif self.func["operation"] == "notEmpty":
             _sql = self.lrdb.lrphoto.select_generic(
-                self.base_select, "", sql=True
+                self.base_select, "", sql=True, facts=False
             )
             self.sql += (
                 _sql
@@ -524,7 +550,7 @@ class SQLSmartColl:
                 f'operation unsupported: {self.func["operation"]} on criteria {self.func["criteria"]}'
             )
         combine = rules[self.func["operation"]]
-        lrk = LRKeywords(self.lrdb)
+        lrk = self.lrkeywords
         wheres = [" WHERE "]
         joins = [
             " LEFT JOIN AgMetadataSearchIndex msi ON i.id_local = msi.image ",
@@ -570,7 +596,7 @@ class SQLSmartColl:
         # the base 'select columns from' :
         self.base_sql_select = self._add_joins_from_select(
             self.lrdb.lrphoto.select_generic(
-                self.base_select, "", distinct=True, sql=True
+                self.base_select, "", distinct=True, sql=True, facts=False
             )
         )
         # final sql
@@ -596,7 +622,7 @@ class SQLSmartColl:
                 f'operation unsupported: {self.func["operation"]} on criteria {self.func["criteria"]}'
             )
         combine = rules[self.func["operation"]]
-        lrk = LRKeywords(self.lrdb)
+        lrk = self.lrkeywords
         wheres = [" WHERE "]
         joins = [
             " LEFT JOIN AgMetadataSearchIndex msi ON i.id_local = msi.image "
@@ -620,7 +646,7 @@ class SQLSmartColl:
         # the base 'select columns from' :
         self.base_sql_select = self._add_joins_from_select(
             self.lrdb.lrphoto.select_generic(
-                self.base_select, "", distinct=True, sql=True
+                self.base_select, "", distinct=True, sql=True, facts=False
             )
         )
         # final sql
@@ -638,7 +664,7 @@ class SQLSmartColl:
         """
         self.base_sql_select = self._add_joins_from_select(
             self.lrdb.lrphoto.select_generic(
-                self.base_select, "", distinct=True, sql=True
+                self.base_select, "", distinct=True, sql=True, facts=False
             )
         )
         self._add_joins(
@@ -780,7 +806,7 @@ class SQLSmartColl:
             wheres.append(base_where % (num_value, value))
         # the base 'select columns from' :
         _sql = self.lrdb.lrphoto.select_generic(
-            self.base_select, "", distinct=True, sql=True
+            self.base_select, "", distinct=True, sql=True, facts=False
         )
         # final sql
         self.sql += "".join([_sql] + joins + wheres)
@@ -792,6 +818,9 @@ class SQLSmartColl:
         basesql doesn't contain WHERE statement
         """
         ijoin = basesql.find("LEFT JOIN ")
+        if ijoin == -1:
+            # no join in request
+            return basesql
         sjoins = basesql[ijoin:]
         for join_table in sjoins.split("LEFT JOIN"):
             join_table = join_table.strip()
@@ -825,19 +854,197 @@ class SQLSmartColl:
             parts.append(" LEFT JOIN ".join(self.joins))
         if where_part:
             parts.append(where_part)
-        return " ".join(parts)
+        sql = " ".join(parts)
+        self.last_where = (sql, where_part)
+        return sql
+
+    def _call_criteria(self):
+        """
+        Call criteria function of self.func
+        """
+        log.info("func : %s", self.func)
+        # build criteria function name ...
+        try:
+            func_criteria = getattr(
+                self, f'criteria_{self.func["criteria"]}'
+            )
+        except AttributeError as _e:
+            raise SmartException(
+                f'criteria unsupported: {self.func["criteria"]}'
+            ) from _e
+        # ... and call it
+        func_criteria()
+
+    def _keyword_indexes(self, keyword):
+        """
+        Return ids of keywords matching keyword for operation of self.func, comma separated
+        """
+        return ",".join(
+            str(index)
+            for index in self.lrkeywords.hierachical_indexes(
+                keyword, self.func["operation"]
+            )
+        )
+
+    def compile_keywords(self):
+        """
+        Return condition on photos for criteria keywords, as semi-joins on table of keywords of photos
+        """
+        operation = self.func["operation"]
+        keywords_images = "SELECT image FROM AgLibraryKeywordImage"
+        if operation in ["any", "noneOf"]:
+            indexes = ",".join(
+                filter(
+                    None,
+                    (
+                        self._keyword_indexes(keyword)
+                        for keyword in self.func["value"].split()
+                    ),
+                )
+            )
+            oper = "NOT IN" if operation == "noneOf" else "IN"
+            return f"i.id_local {oper} ({keywords_images} WHERE tag IN ({indexes}))"
+        if operation in ["all", "words", "beginsWith", "endsWith"]:
+            return " AND ".join(
+                f"i.id_local IN ({keywords_images} WHERE tag IN ({self._keyword_indexes(keyword)}))"
+                for keyword in self.func["value"].split()
+            )
+        if operation == "empty":
+            return f"i.id_local NOT IN ({keywords_images})"
+        if operation == "notEmpty":
+            return f"i.id_local IN ({keywords_images})"
+        raise SmartException(
+            f"operation unsupported: {operation} on criteria {self.func['criteria']}"
+        )
+
+    def compile_collection(self):
+        """
+        Return condition on photos for criteria collection, as semi-joins on table of photos of collections
+        """
+        operation = self.func["operation"]
+        if operation in ["all", "beginsWith", "endsWith"]:
+            what = {
+                "all": '"%%%s%%"',
+                "beginsWith": '"%s%%"',
+                "endsWith": '"%%%s"',
+            }
+            return " AND ".join(
+                "i.id_local IN (SELECT ci.image FROM AgLibraryCollectionimage ci"
+                " JOIN AgLibraryCollection col ON col.id_local = ci.Collection"
+                f" WHERE col.name LIKE {what[operation] % value})"
+                for value in self.func["value"].split()
+            )
+        if operation == "noneOf":
+            lrcollection = LRSelectCollection(self.config, self.lrdb)
+            idscoll = ",".join(
+                str(idcoll)
+                for coll in self.func["value"].split()
+                for idcoll, in lrcollection.select_generic(
+                    "id", f'name="%{coll}%"'
+                ).fetchall()
+            )
+            return f"i.id_local NOT IN (SELECT image FROM AgLibraryCollectionimage WHERE collection IN ({idscoll}))"
+        raise SmartException(
+            f"operation unsupported: {operation} on criteria {self.func['criteria']}"
+        )
+
+    def _compile_criteria(self, func):
+        """
+        Return SQL condition on photos (table alias "i") for criteria func :
+            - a semi-join on a link table, for criteria with a compile function (as compile_keywords)
+            - the criteria condition itself, when it only uses columns of photos table
+            - a correlated "EXISTS (...)" on joined tables otherwise : joins start from a single row instead of
+              photos table, and are indexed probes on the photo of the main request
+        """
+        # criteria request on photos ids, and column used by criteria condition
+        columns = "id"
+        if func["criteria"] in self._CRITERIA_COLUMNS:
+            columns += "," + self._CRITERIA_COLUMNS[func["criteria"]]
+        self.base_select = columns
+        self.base_sql = self.lrdb.lrphoto.select_generic(
+            columns, "", sql=True, facts=False
+        )
+        self.joins = []
+        self.base_sql_select = self._add_joins_from_select(self.base_sql)
+        self.sql = ""
+        self.last_where = None
+        self.func = func
+        compile_func = getattr(self, f'compile_{func["criteria"]}', None)
+        if compile_func:
+            return f"({compile_func()})"
+        self._call_criteria()
+        sql, where = self.last_where or ("", "")
+        where = where.strip()
+        if self.sql == sql and not self.joins and where.startswith("WHERE"):
+            # condition on columns of photos table only
+            return f"({where[len('WHERE'):].strip()})"
+        match = self._CRITERIA_REQUEST.match(self.sql)
+        if match and not re.search(r"\b(UNION|INTERSECT|EXCEPT)\b", self.sql):
+            fields, joins, where = match.groups()
+            return f"EXISTS (SELECT {fields} FROM (SELECT 1) {joins} WHERE {where.strip()})"
+        if columns != "id":
+            return f"i.id_local IN (SELECT id FROM ({self.sql}))"
+        return f"i.id_local IN ({self.sql})"
+
+    def build_criteria_sql(self, func):
+        """
+        Return request of ids of photos matching criteria func (an item of smart collection structure)
+        """
+        return f"SELECT i.id_local FROM Adobe_images i WHERE {self._compile_criteria(dict(func))}"
+
+    def build_compiled_sql(self, base_select):
+        """
+        Return self.sql command from data returned by get_smartcoll_data, as a single request on photos :
+        criteria are compiled as conditions (see _compile_criteria), combined by AND ("intersect") or OR ("union"),
+        and columns are selected once on photos matching the conditions.
+        Photos table is scanned once : conditions are semi-joins on link tables or indexed probes by photo, instead
+        of a request on photos by criteria for build_sql.
+        """
+        operators = {
+            "union": " OR ",
+            "intersect": " AND ",
+        }
+        conditions = []
+        fid = 0
+        while fid in self.smart:
+            if fid > 0 and self.smart["combine"] not in operators:
+                raise SmartException(
+                    f'"combine" operation unsupported: {self.smart["combine"]}'
+                )
+            conditions.append(self._compile_criteria(self.smart[fid]))
+            fid += 1
+
+        # columns, for matching photos only. Rows are distinct when criteria are combined,
+        # as with UNION/INTERSECT of build_sql
+        self.base_select = base_select
+        self.joins = []
+        self.base_sql = self.lrdb.lrphoto.select_generic(
+            base_select,
+            "",
+            distinct=len(conditions) > 1,
+            sql=True,
+            facts=False,
+        )
+        self.sql = self.base_sql
+        if conditions:
+            combine = operators.get(self.smart.get("combine"), " AND ")
+            self.sql += " WHERE " + combine.join(conditions)
+        return self.sql
 
     def build_sql(self, base_select):
         """
         Return self.sql command from data returned by get_smartcoll_data
         """
         self.base_select = base_select
+        # requests are completed with joins on catalog tables : table facts of cache is not used
         self.base_sql = self.lrdb.lrphoto.select_generic(
-            base_select, "", sql=True
+            base_select, "", sql=True, facts=False
         )
         self.joins = []
         self.base_sql_select = self._add_joins_from_select(
-            self.lrdb.lrphoto.select_generic(base_select, "", sql=True)
+            self.lrdb.lrphoto.select_generic(
+                base_select, "", sql=True, facts=False
+            )
         )
         self.sql = ""
 
@@ -856,19 +1063,12 @@ class SQLSmartColl:
                     )
 
             self.func = self.smart[fid]
-            log.info("func %s : %s", fid, self.func)
-
-            # build criteria function name ...
-            try:
-                func_criteria = getattr(
-                    self, f'criteria_{self.func["criteria"]}'
-                )
-            except AttributeError as _e:
-                raise SmartException(
-                    f'criteria unsupported: {self.func["criteria"]}'
-                ) from _e
-            # ... and call it
-            func_criteria()
+            start = len(self.sql)
+            self._call_criteria()
+            if fid > 0 and " EXCEPT " in self.sql[start:]:
+                # compound operators are evaluated left to right : request of criterion (noneOf) as a sub-request,
+                # else "X UNION A EXCEPT B" would remove B from X too
+                self.sql = self.sql[:start] + f"SELECT * FROM ({self.sql[start:]})"
 
             # next function
             fid += 1
@@ -891,10 +1091,14 @@ def select_smart(
     sort_column=None,
     is_file=False,
     sql_only=False,
+    stream=False,
+    compiled=False,
 ):
     """
     Execute smart collection :
        build SQL string from lua source, execute and return rows
+       (or an iterator on rows fetched by batches, if stream is True)
+       If compiled is True, SQL is built as a single request (see SQLSmartColl.build_compiled_sql)
     """
     if is_file:
         smart = open(smart_name, "r", encoding="utf-8").read()
@@ -917,7 +1121,10 @@ def select_smart(
         log.info(smart)
 
     builder = SQLSmartColl(config, lrdb, smart)
-    sql = builder.build_sql(columns)
+    if compiled:
+        sql = builder.build_compiled_sql(columns)
+    else:
+        sql = builder.build_sql(columns)
     if sort_column is not None:
         way = "ASC"
         if sort_column[0] == "-":
@@ -927,5 +1134,7 @@ def select_smart(
     log.info("smart sql: %s", sql)
     if sql_only:
         return sql
+    if stream:
+        return lrdb.iter_sql(sql)
     lrdb.cursor.execute(sql)
     return lrdb.cursor.fetchall()
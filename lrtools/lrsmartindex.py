@@ -0,0 +1,326 @@
+# # -*- coding: utf-8 -*-
+# pylint: disable=line-too-long
+
+"""
+LRSmartIndex class for the smart collections of each photo
+
+The index is stored in the acceleration cache file of catalog (see LRCacheDB), and maps each photo to the smart
+collections containing it. It is built by LRSmartBatch, and keyed by the catalog fingerprint.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import time
+
+from .lrcache import LRCacheDB, LRCacheException, catalog_fingerprint
+from .lrsmartbatch import LRSmartBatch
+from .lrselectgeneric import LRSelectException
+from .lrsmartcoll import SmartException
+
+log = logging.getLogger(__name__)
+
+
+class LRSmartIndex:
+    """
+    Membership index of photos in smart collections
+
+    Tables in cache file :
+        - smart_collections : smart collections indexed, with their definition and evaluation error
+        - smart_images : photos indexed, with their touchTime when indexed
+        - smart_members : pairs (smart collection, photo)
+
+    Refresh is incremental : new or modified smart collections are evaluated on all photos, others only on photos
+    new or touched (Adobe_images.touchTime) since last refresh. Smart collections in error are evaluated again on all
+    photos, and excluded from lookups of photos until then.
+    Changes not touching photos (renamed keywords or collections...), and criteria relative to current date
+    (as "inLast") need a full refresh.
+    """
+
+    # name of index in table meta of cache
+    PART = "smartindex"
+    # format version of index tables, increase it on any change in SCHEMA
+    VERSION = 1
+
+    SCHEMA = [
+        "DROP TABLE IF EXISTS smart_collections",
+        "DROP TABLE IF EXISTS smart_images",
+        "DROP TABLE IF EXISTS smart_members",
+        "CREATE TABLE smart_collections (id INTEGER PRIMARY KEY, name TEXT, definition TEXT, error TEXT)",
+        "CREATE TABLE smart_images (image INTEGER PRIMARY KEY, touchTime REAL)",
+        # rows of a smart collection inserted in order of photos
+        "CREATE TABLE smart_members (collection INTEGER, image INTEGER, PRIMARY KEY (collection, image)) WITHOUT ROWID",
+    ]
+    # index on photos, created after build for speed
+    SCHEMA_INDEXES = [
+        "CREATE INDEX IF NOT EXISTS smart_members_image ON smart_members(image)",
+    ]
+
+    def __init__(self, config, lrdb, cache_file=None):
+        """
+        Init
+        - config : LRToolConfig instance
+        - lrdb : LRCatDB instance
+        - cache_file : cache filename. Default is cache file of lrdb, or default cache file of catalog
+        """
+        self.config = config
+        self.lrdb = lrdb
+        if not cache_file:
+            cache_file = (
+                lrdb.cache.cache_file
+                if lrdb.cache
+                else LRCacheDB(lrdb.lrcat_file).cache_file
+            )
+        self.cache_file = cache_file
+
+    def _select(self, sql, params=()):
+        """
+        Execute SQL request on cache file opened read-only, and return rows
+        """
+        if not os.path.exists(self.cache_file):
+            return []
+        conn = sqlite3.connect(f"file:{self.cache_file}?mode=ro", uri=True)
+        try:
+            return conn.execute(sql, params).fetchall()
+        except sqlite3.OperationalError:
+            # index never built
+            return []
+        finally:
+            conn.close()
+
+    def is_fresh(self):
+        """
+        Return True if index is up to date with catalog
+        """
+        return bool(
+            self._select(
+                "SELECT 1 FROM meta WHERE part = ? AND fingerprint = ? AND version = ?",
+                (
+                    self.PART,
+                    catalog_fingerprint(self.lrdb.lrcat_file),
+                    self.VERSION,
+                ),
+            )
+        )
+
+    def refresh(self, full=False):
+        """
+        Build index, or refresh it incrementally
+        - full : rebuild whole index
+        Return dictionary :
+            - collections : number of smart collections evaluated on all photos
+            - images : number of photos evaluated for others smart collections
+            - failed : list of (smart collection name, error message)
+        """
+        start = time.perf_counter()
+        # fingerprint is taken before refresh : a catalog modified meanwhile invalidates the index
+        fingerprint = catalog_fingerprint(self.lrdb.lrcat_file)
+        try:
+            conn = sqlite3.connect(self.cache_file)
+        except sqlite3.OperationalError as _e:
+            raise LRCacheException(
+                f'Unable to create cache "{self.cache_file}": {_e}'
+            ) from _e
+        try:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS meta (part TEXT PRIMARY KEY, fingerprint TEXT, version INTEGER, built REAL)"
+            )
+            version = conn.execute(
+                "SELECT version FROM meta WHERE part = ?", (self.PART,)
+            ).fetchone()
+            if full or not version or version[0] != self.VERSION:
+                for sql in self.SCHEMA:
+                    conn.execute(sql)
+            stats = self._refresh(conn)
+            for sql in self.SCHEMA_INDEXES:
+                conn.execute(sql)
+            conn.execute(
+                "INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?)",
+                (self.PART, fingerprint, self.VERSION, time.time()),
+            )
+            conn.commit()
+        except sqlite3.DatabaseError as _e:
+            conn.rollback()
+            raise LRCacheException(f"Smart index refresh failed: {_e}") from _e
+        finally:
+            conn.close()
+        log.info(
+            "smart index refreshed in %.3f s : %s",
+            time.perf_counter() - start,
+            stats,
+        )
+        return stats
+
+    def _refresh(self, conn):
+        """
+        Update index tables on connection conn to cache, in current transaction. See refresh
+        """
+        # smart collections : new, modified or in error ones are evaluated on all photos
+        indexed = {}
+        errors = set()
+        for idcoll, definition, error in conn.execute(
+            "SELECT id, definition, error FROM smart_collections"
+        ):
+            indexed[idcoll] = definition
+            if error:
+                errors.add(idcoll)
+        smarts = {
+            idcoll: (name, smart, repr(smart))
+            for idcoll, name, smart in self.lrdb.get_smartcolls_data()
+        }
+        removed = [idcoll for idcoll in indexed if idcoll not in smarts]
+        changed = [
+            idcoll
+            for idcoll, (_, _, definition) in smarts.items()
+            if indexed.get(idcoll) != definition or idcoll in errors
+        ]
+        unchanged = [
+            idcoll for idcoll in indexed if idcoll in smarts and idcoll not in changed
+        ]
+
+        # photos : new or touched ones are evaluated for unchanged smart collections
+        touched = dict(
+            self.lrdb.iter_sql("SELECT id_local, touchTime FROM Adobe_images")
+        )
+        indexed_images = dict(
+            conn.execute("SELECT image, touchTime FROM smart_images")
+        )
+        deleted = [image for image in indexed_images if image not in touched]
+        images = [
+            image
+            for image, touch in touched.items()
+            if indexed_images.get(image) != touch
+        ]
+
+        conn.executemany(
+            "DELETE FROM smart_members WHERE collection = ?",
+            ((idcoll,) for idcoll in removed + changed),
+        )
+        conn.executemany(
+            "DELETE FROM smart_collections WHERE id = ?",
+            ((idcoll,) for idcoll in removed),
+        )
+        conn.executemany(
+            "DELETE FROM smart_members WHERE image = ?",
+            ((image,) for image in deleted + images),
+        )
+        conn.executemany(
+            "DELETE FROM smart_images WHERE image = ?",
+            ((image,) for image in deleted),
+        )
+
+        stats = {"collections": len(changed), "images": 0, "failed": []}
+        batch = LRSmartBatch(self.config, self.lrdb)
+        for idcoll in changed:
+            name, smart, definition = smarts[idcoll]
+            error = self._insert_members(conn, batch, idcoll, smart)
+            if error:
+                stats["failed"].append((name, error))
+            conn.execute(
+                "INSERT OR REPLACE INTO smart_collections VALUES (?, ?, ?, ?)",
+                (idcoll, name, definition, error),
+            )
+        if images and unchanged:
+            batch.restrict(images)
+            stats["images"] = len(images)
+            for idcoll in unchanged:
+                name, smart, _ = smarts[idcoll]
+                error = self._insert_members(conn, batch, idcoll, smart)
+                if error:
+                    stats["failed"].append((name, error))
+                    conn.execute(
+                        "UPDATE smart_collections SET error = ? WHERE id = ?",
+                        (error, idcoll),
+                    )
+        conn.executemany(
+            "INSERT OR REPLACE INTO smart_images VALUES (?, ?)",
+            ((image, touched[image]) for image in images),
+        )
+        return stats
+
+    @staticmethod
+    def _insert_members(conn, batch, idcoll, smart):
+        """
+        Evaluate smart collection idcoll and insert its photos in index
+        Return error message, or None
+        """
+        if not smart:
+            return "Invalid syntax"
+        try:
+            ids, _, _ = batch.evaluate(smart)
+        except (LRSelectException, SmartException, sqlite3.OperationalError) as _e:
+            return str(_e)
+        ids = sorted(ids)
+        try:
+            # ids passed as a single JSON array, unpacked by sqlite
+            conn.execute(
+                "INSERT OR IGNORE INTO smart_members SELECT ?, value FROM json_each(?)",
+                (idcoll, json.dumps(ids)),
+            )
+        except sqlite3.OperationalError:
+            # sqlite without JSON functions
+            conn.executemany(
+                "INSERT OR IGNORE INTO smart_members VALUES (?, ?)",
+                ((idcoll, image) for image in ids),
+            )
+        return None
+
+    def smart_collections(self, idphoto):
+        """
+        Return list of names of smart collections containing photo of id idphoto, ordered by name
+        Smart collections in error are excluded (see failed)
+        """
+        return [
+            name
+            for name, in self._select(
+                "SELECT c.name FROM smart_members m JOIN smart_collections c ON c.id = m.collection"
+                " WHERE m.image = ? AND c.error IS NULL ORDER BY c.name",
+                (idphoto,),
+            )
+        ]
+
+    def smart_collections_by_uuid(self, uuid):
+        """
+        Return list of names of smart collections containing photo of uuid (Adobe_images.id_global)
+        """
+        row = (
+            self.lrdb.new_cursor()
+            .execute("SELECT id_local FROM Adobe_images WHERE id_global = ?", (uuid,))
+            .fetchone()
+        )
+        return self.smart_collections(row[0]) if row else []
+
+    def smart_collections_by_name(self, name):
+        """
+        Return dictionary {photo id: list of names of smart collections} for photos of name (criteria "name" of
+        LRSelectPhoto : jokers "%" allowed, virtual copy name included)
+        """
+        return {
+            idphoto: self.smart_collections(idphoto)
+            for idphoto, in self.lrdb.lrphoto.select_generic(
+                "id", f"name={name}"
+            ).fetchall()
+        }
+
+    def photos(self, name):
+        """
+        Return list of ids of photos of smart collection name
+        Smart collections in error are excluded (see failed)
+        """
+        return [
+            image
+            for image, in self._select(
+                "SELECT m.image FROM smart_members m JOIN smart_collections c ON c.id = m.collection"
+                " WHERE c.name = ? AND c.error IS NULL ORDER BY m.image",
+                (name,),
+            )
+        ]
+
+    def failed(self):
+        """
+        Return list of (smart collection name, error message) of smart collections in error at last refresh
+        """
+        return self._select(
+            "SELECT name, error FROM smart_collections WHERE error IS NOT NULL ORDER BY name"
+        )
@@ -10,23 +10,48 @@ import logging
 log = logging.getLogger(__name__)
 
 
+# scanners of decoder, applied at current position
+WHITE = re.compile(r"[ \t]*")
+# alphanumeric characters, as str.isalnum()
+ALNUM = re.compile(r"[^\W_]*")
+DIGITS = re.compile(r"\d*")
+TRUE = re.compile("true", re.I)
+FALSE = re.compile("false", re.I)
+COMMENT = re.compile("---.*$", re.M)
+# common items of a table, decoded in one step :
+#   - "key = value," at end of line. As by original decoder, the comma is kept as pending list item, replaced
+#     by the newline (see object)
+#   - "value," in a list
+# value is a number, a string or a word. Others items are decoded step by step
+ITEM = re.compile(
+    r'(?:\n?[ \t]*([A-Za-z][A-Za-z0-9]*)[ \t]*=[ \t]*|(?:\n[ \t]+)?)(?:(-?[0-9]+)(?:\.([0-9]+))?|"([^"]*)"|([A-Za-z][A-Za-z0-9]*))[ \t]*,'
+)
+
+
 class SLPP:
+    """
+    Decoder of Lua tables, as stored by Lightroom
+
+    The decoder scans text with compiled regular expressions and str.find, from position to position, and returns
+    the same structures as the original character by character decoder (including its approximations : newlines
+    and "_" split words, falsy last item of a list is dropped...), except for decimal numbers : the original decoder
+    repeated their first decimal digit ("1.5" decoded as 1.55), they are decoded to their exact value
+    """
+
     def __init__(self):
         self.text = ""
-        self.ch = ""
-        self.at = 0
         self.len = 0
         self.depth = 0
 
     def decode(self, text):
         if not text or type(text).__name__ != "str":
             return None
-        text = re.sub("---.*$", "", text, 0, re.M)
+        if "---" in text:
+            text = COMMENT.sub("", text)
         self.text = text
-        self.at, self.ch, self.depth = 0, "", 0
         self.len = len(text)
-        self.next_chr()
-        result = self.value()
+        self.depth = 0
+        result, _ = self.value(0)
         if not result:
             return None
         return result
@@ -80,139 +105,143 @@ class SLPP:
             s += tab * self.depth + "}"
         return s
 
-    def white(self):
-        while self.ch:
-            if self.ch == " " or self.ch == "\t":
-                self.next_chr()
-            else:
-                break
+    def digits(self, at):
+        """return position after digits (as str.isdigit()) from position at"""
+        text = self.text
+        at = DIGITS.match(text, at).end()
+        while at < self.len and text[at].isdigit():
+            at = DIGITS.match(text, at + 1).end()
+        return at
 
-    def next_chr(self):
-        if self.at >= self.len:
-            self.ch = None
-            return None
-        self.ch = self.text[self.at]
-        self.at += 1
-        return True
+    def value(self, at):
+        """return tuple (value at position at, position after value)"""
+        at = WHITE.match(self.text, at).end()
+        if at >= self.len:
+            return None, at
+        ch = self.text[at]
+        if ch == "{":
+            return self.object(at)
+        if ch == '"':
+            return self.string(at)
+        if ch.isdigit() or ch == "-":
+            return self.number(at)
+        return self.word(at)
 
-    def value(self):
-        self.white()
-        if not self.ch or self.ch == "":
-            return None
-        if self.ch == "{":
-            return self.object()
-        if self.ch == '"':
-            return self.string()
-        if self.ch.isdigit() or self.ch == "-":
-            return self.number()
-        return self.word()
-
-    def string(self):
-        s = ""
-        if self.ch == '"':
-            while self.next_chr():
-                if self.ch == '"':
-                    self.next_chr()
-                    return str(s)
-                else:
-                    s += self.ch
-        log.error("Unexpected end of string while parsing Lua string")
-        return None
+    def string(self, at):
+        end = self.text.find('"', at + 1)
+        if end < 0:
+            log.error("Unexpected end of string while parsing Lua string")
+            return None, self.len
+        return self.text[at + 1 : end], end + 1
 
-    def object(self):
+    def object(self, at):
+        text = self.text
+        length = self.len
         o = {}
         k = ""
         idx = 0
-        self.depth += 1
-        self.next_chr()
-        self.white()
-        if self.ch and self.ch == "}":
-            self.depth -= 1
-            self.next_chr()
-            return o  # Exit here
-        else:
-            while self.ch:
-                self.white()
-                if self.ch == "{":
-                    o[idx] = self.object()
+        at = WHITE.match(text, at + 1).end()
+        if at < length and text[at] == "}":
+            return o, at + 1  # Exit here
+        while at < length:
+            at = WHITE.match(text, at).end()
+            if at >= length:
+                break
+            ch = text[at]
+            if ch == "{":
+                o[idx], at = self.object(at)
+                idx += 1
+                continue
+            if ch == "}":
+                if k:
+                    o[idx] = k
+                if not any(type(key).__name__ == "str" for key in o):
+                    ar = []
+                    for key, val in o.items():
+                        ar.insert(key, val)
+                    o = ar
+                return o, at + 1  # or here
+            m = ITEM.match(text, at)
+            if m:
+                key, integer, decimals, string, word = m.groups()
+                if string is not None:
+                    val = string
+                elif word is not None:
+                    val = self.word_value(word)
+                elif decimals is not None:
+                    # exact value : the original decoder repeated first decimal digit ("1.5" as 1.55)
+                    val = float(f"{integer}.{decimals}")
+                else:
+                    val = int(integer)
+                end = WHITE.match(text, m.end()).end()
+                if key is None:
+                    o[idx] = val
                     idx += 1
+                    k = ""
+                    at = end
                     continue
-                elif self.ch == "}":
-                    self.depth -= 1
-                    self.next_chr()
-                    if k:
-                        o[idx] = k
-                    if (
-                        len([key for key in o if type(key).__name__ == "str"])
-                        == 0
-                    ):
-                        ar = []
-                        for key, val in o.items():
-                            ar.insert(key, val)
-                        o = ar
-                    return o  # or here
-                else:
-                    if self.ch == '"':
-                        k = self.string()
-                    else:
-                        k = self.value()
-                    self.white()
-                    if self.ch == "=":
-                        self.next_chr()
-                        self.white()
-                        o[k] = self.value()
-                        idx += 1
-                        k = ""
-                    elif self.ch == ",":
-                        self.next_chr()
-                        self.white()
-                        o[idx] = k
-                        idx += 1
-                        k = ""
+                if end < length and text[end] == "\n":
+                    o[self.word_value(key)] = val
+                    idx += 1
+                    k = ","
+                    at = end
+                    continue
+            if ch == '"':
+                k, at = self.string(at)
+            else:
+                k, at = self.value(at)
+            at = WHITE.match(text, at).end()
+            if at < length:
+                ch = text[at]
+                if ch == "=":
+                    o[k], at = self.value(at + 1)
+                    idx += 1
+                    k = ""
+                elif ch == ",":
+                    at = WHITE.match(text, at + 1).end()
+                    o[idx] = k
+                    idx += 1
+                    k = ""
         log.error(
             "Unexpected end of table while parsing Lua string."
         )  # Bad exit here
-        return None
+        return None, length
 
-    def word(self):
-        s = ""
-        if self.ch != "\n":
-            s = self.ch
-        while self.next_chr():
-            if self.ch.isalnum():
-                s += self.ch
-            else:
-                if re.match("^true$", s, re.I):
-                    return True
-                elif re.match("^false$", s, re.I):
-                    return False
-                return str(s)
-        return None
-
-    def number(self):
-        n = ""
-        flt = False
-        if self.ch == "-":
-            n = "-"
-            self.next_chr()
-            if not self.ch or not self.ch.isdigit():
+    def word(self, at):
+        text = self.text
+        end = ALNUM.match(text, at + 1).end()
+        if end >= self.len:
+            return None, self.len
+        # a word starting at a newline doesn't include it
+        s = text[at + 1 : end] if text[at] == "\n" else text[at:end]
+        return self.word_value(s), end
+
+    @staticmethod
+    def word_value(s):
+        """return value of word s : boolean or string"""
+        if not 3 < len(s) < 6:
+            return s
+        if TRUE.fullmatch(s):
+            return True
+        if FALSE.fullmatch(s):
+            return False
+        return s
+
+    def number(self, at):
+        text = self.text
+        start = at
+        if text[at] == "-":
+            at += 1
+            if at >= self.len or not text[at].isdigit():
                 log.error("Malformed number (no digits after initial minus)")
-                return 0
-        while self.ch and self.ch.isdigit():
-            n += self.ch
-            self.next_chr()
-        if self.ch and self.ch == ".":
-            n += self.ch
-            flt = True
-            self.next_chr()
-            if not self.ch or not self.ch.isdigit():
+                return 0, at
+        at = self.digits(at)
+        if at < self.len and text[at] == ".":
+            at += 1
+            if at >= self.len or not text[at].isdigit():
                 log.error("Malformed number (no digits after decimal point)")
-                return n + "0"
-            else:
-                n += self.ch
-            while self.ch and self.ch.isdigit():
-                n += self.ch
-                self.next_chr()
-        if flt:
-            return float(n)
-        return int(n)
+                return text[start:at] + "0", at
+            end = self.digits(at)
+            # exact value : the original decoder repeated first decimal digit ("1.5" as 1.55)
+            return float(text[start:end]), end
+        return int(text[start:at]), at
@@ -37,6 +37,6 @@ setup(
     python_requires=">=3.7",
     package_dir={"lrtools": "lrtools"},
     packages=["lrtools"],
-    scripts=["lrtools.ini", "lrselect.py", "lrsmart.py"],
+    scripts=["lrtools.ini", "lrselect.py", "lrsmart.py", "lrsmartbatch.py", "lrkeywords.py"],
     install_requires=["geopy", "pytz", "tzlocal", "python-dateutil"],
 )